@@ -7,8 +7,8 @@ __classification__ = "UNCLASSIFIED"
 __author__ = ("Jason Casey", "Thomas McCullough")
 
 
+import functools
 import os
-import time
 import numpy
 from typing import Union, Tuple, List, Optional
 
@@ -25,7 +25,6 @@ from tk_builder.base_elements import TypedDescriptor, IntegerDescriptor, \
 from tk_builder.image_reader import NumpyCanvasImageReader
 from tk_builder.panel_builder import WidgetPanel, RadioButtonPanel
 from tk_builder.panels.image_panel import ImagePanel
-from tk_builder.utils.frame_sequence_utils import save_numpy_frame_sequence_to_animated_gif
 
 from tk_builder.widgets.widget_descriptors import RadioButtonDescriptor, \
     PanelDescriptor, ImagePanelDescriptor, CheckButtonDescriptor, LabelDescriptor, \
@@ -34,11 +33,16 @@ from tk_builder.widgets.basic_widgets import Frame, RadioButton, CheckButton, \
     Label, Entry, Button
 
 from sarpy.visualization.remap import NRL
-from sarpy.processing.sicd.subaperture import ApertureFilter
 from sarpy.io.complex.base import SICDTypeReader
 
+from sarpy_apps.supporting_classes.animation_export import export_animation, export_format_from_name
+from sarpy_apps.supporting_classes.background import BackgroundWorker, FrameScheduler
 from sarpy_apps.supporting_classes.file_filters import common_use_collection
-from sarpy_apps.supporting_classes.image_reader import SICDTypeCanvasImageReader
+from sarpy_apps.supporting_classes.image_reader import SICDTypeCanvasImageReader, \
+    PhaseHistoryCanvasImageReader
+from sarpy_apps.supporting_classes.subaperture import ANIMATION_MODES, FrameRenderer, \
+    FilteredImageCache, SubapertureProcessor, animation_frame_rects, default_deweighting, \
+    frame_metadata, phase_history_bounds, rect_slices, write_datacube
 from sarpy_apps.supporting_classes.widget_with_metadata import WidgetWithMetadata
 
 
@@ -353,6 +357,14 @@ class ApertureTool(WidgetPanel):
         self._can_use_tool = True
         self._update_on_changed = True
         self._skip_update = False
+        self._frame_renderer = FrameRenderer()
+        self._filtered_cache = FilteredImageCache()
+        self._animation_scheduler = FrameScheduler(
+            self, self.show_animation_frame, is_ready=self._frame_renderer.is_ready)
+        # NB: a new submission drops the result of the previous one, so only one
+        #     export may be in progress, with all of the export entry points disabled
+        self._export_worker = BackgroundWorker(self, poll_interval=100, name='sarpy_apps_export')
+        self._default_remap = None
 
         WidgetPanel.__init__(self, primary, **kwargs)
         self.init_w_horizontal_layout()
@@ -375,6 +387,8 @@ class ApertureTool(WidgetPanel):
         self.controls_menu.add_command(label="Main Controls", command=self.main_controls_popup)
         self.controls_menu.add_command(label="Phase History", command=self.ph_popup)
         self.controls_menu.add_command(label="Animation", command=self.animation_fast_slow_popup)
+        self.controls_menu.add_separator()
+        self.controls_menu.add_command(label="Export Datacube", command=self.callback_export_datacube)
         self.menu_bar.add_cascade(label="Details", menu=self.controls_menu)
 
         primary.config(menu=self.menu_bar)
@@ -417,64 +431,148 @@ class ApertureTool(WidgetPanel):
     def callback_update_deskew_direction(self):
         if self.image_info_panel.phd_options.deskew_fast_slow.selection() == \
                 self.image_info_panel.phd_options.deskew_fast_slow.slow:
-            self.app_variables.aperture_filter.dimension = 1
+            self.app_variables.processor.dimension = 1
         else:
-            self.app_variables.aperture_filter.dimension = 0
+            self.app_variables.processor.dimension = 0
+        self.invalidate_filtered_images()
         self.update_fft_image()
         self.update_filtered_image()
 
     def callback_update_weighting(self):
         if self.image_info_panel.phd_options.uniform_weighting.is_selected():
-            self.app_variables.aperture_filter.apply_deweighting = True
+            self.app_variables.processor.apply_deweighting = True
         else:
-            self.app_variables.aperture_filter.apply_deweighting = False
+            self.app_variables.processor.apply_deweighting = False
+        self.invalidate_filtered_images()
         self.update_fft_image()
         self.update_filtered_image()
 
     def callback_update_apply_deskew(self):
         if self.image_info_panel.phd_options.apply_deskew.is_selected():
-            self.app_variables.aperture_filter.apply_deskew = True
+            self.app_variables.processor.apply_deskew = True
             self.image_info_panel.phd_options.deskew_fast_slow.fast.configure(state="normal")
             self.image_info_panel.phd_options.deskew_fast_slow.slow.configure(state="normal")
         else:
-            self.app_variables.aperture_filter.apply_deskew = False
+            self.app_variables.processor.apply_deskew = False
             self.image_info_panel.phd_options.deskew_fast_slow.fast.configure(state="disabled")
             self.image_info_panel.phd_options.deskew_fast_slow.slow.configure(state="disabled")
 
+        self.invalidate_filtered_images()
         self.update_fft_image()
         self.update_filtered_image()
 
-    # TODO: update variables, some don't exist in the current form.
+    def _export_in_progress(self):
+        # type: () -> bool
+        """
+        Checks whether an export is in progress, informing the user if so.
+
+        Returns
+        -------
+        bool
+        """
+
+        if self._export_worker.busy:
+            showinfo('Export in progress', message='Wait for the export in progress to finish.')
+            return True
+        return False
+
+    def _set_export_state(self, state):
+        """
+        Sets the state of all of the export entry points.
+
+        Parameters
+        ----------
+        state : str
+            One of `'normal'` or `'disabled'`.
+        """
+
+        self.animation_panel.save.config(state=state)
+        self.controls_menu.entryconfig("Export Datacube", state=state)
+
     def callback_save_animation(self):
+        if self._export_in_progress():
+            return
         self.update_animation_params()
+        if not self.has_phase_history():
+            return
+
         filename = asksaveasfilename(
             initialdir=os.path.expanduser("~"), title="Select file",
-            filetypes=(("animated gif", "*.gif"), ("all files", "*.*")))
-
-        extension = filename[-4:]
-        if extension.lower() != ".gif":
+            filetypes=(
+                ("animated gif", "*.gif"), ("animated png", "*.apng"), ("png sequence", "*.png"),
+                ("all files", "*.*")))
+        if filename is None or filename in ['', ()]:
+            return
+        export_format = export_format_from_name(filename)
+        if export_format is None:
             filename = filename + ".gif"
-        frame_sequence = []  # type: List[numpy.ndarray]
-        direction_forward_or_back = "forward"
-        if self.animation_panel.mode_panel.reverse.is_selected():
-            direction_forward_or_back = "back"
-        self.animation_panel.animation_settings.stop.config(state="normal")
+            export_format = "gif"
+
+        # the frames are computed from a snapshot, independent of the display
+        processor = self.app_variables.processor
+        order = self.get_animation_order()
+        rects = self.get_animation_frame_rects()[order]
+        blank = numpy.zeros(processor.phase_history.shape, dtype='uint8')
+        frames = (
+            blank if frame is None else frame for _, frame in processor.frames(rects, self.get_remap_function()))
+        fps = float(self.animation_panel.animation_settings.frame_rate.get())
+
+        def finished(frame_count):
+            self.animation_panel.animation_settings.enable_all_widgets()
+            self._set_export_state("normal")
+
+        def failed(exception):
+            finished(0)
+            showinfo('Animation export failed', message='Failed writing {}:\n{}'.format(filename, exception))
 
         self.animation_panel.animation_settings.disable_all_widgets()
-        self.animation_panel.animation_settings.stop.config(state="normal")
-        if direction_forward_or_back == "forward":
-            self.app_variables.animation.current_position = -1
-        else:
-            self.app_variables.animation.current_position = self.app_variables.animation.n_frames
-        for i in range(self.app_variables.animation.n_frames):
-            filtered_image = self.get_filtered_image()
-            frame_sequence.append(filtered_image)
-            self.update_animation_params()
-            self.step_animation(direction_forward_or_back)
-            self.phase_history_panel.update()
-        fps = float(self.animation_panel.animation_settings.frame_rate.get())
-        save_numpy_frame_sequence_to_animated_gif(frame_sequence, filename, fps)
-        self.animation_panel.animation_settings.enable_all_widgets()
+        self._set_export_state("disabled")
+        self._export_worker.submit(
+            export_animation, frames, filename, len(order), fps, True, export_format,
+            callback=finished, error_callback=failed)
+
+    def callback_export_datacube(self):
+        """
+        Export the sub-aperture frames, as defined by the animation settings, as
+        a complex64 datacube with json sidecar.
+        """
+
+        if self._export_in_progress():
+            return
+        self.update_animation_params()
+        if not self.has_phase_history():
+            return
+
+        filename = asksaveasfilename(
+            initialdir=os.path.expanduser("~"), title="Select file",
+            filetypes=(("numpy datacube", "*.npy"), ("raw memmap", "*.dat"), ("all files", "*.*")))
+        if filename is None or filename in ['', ()]:
+            return
+
+        # the datacube is computed from a snapshot, independent of any later
+        # region change, and the reader is not touched on the worker thread
+        processor = self.app_variables.processor
+        rects = self.get_animation_frame_rects()
+        metadata = processor.parameters()
+        metadata.update({
+            'source': self.app_variables.image_reader.file_name,
+            'mode': self.get_animation_mode(),
+            'aperture_fraction': self.app_variables.animation.aperture_faction,
+            'min_aperture_percent': self.app_variables.animation.min_aperture_percent,
+            'max_aperture_percent': self.app_variables.animation.max_aperture_percent})
+
+        def finished(sidecar):
+            self._set_export_state("normal")
+
+        def failed(exception):
+            finished(None)
+            showinfo('Datacube export failed', message='Failed writing {}:\n{}'.format(filename, exception))
+
+        self._set_export_state("disabled")
+        self._export_worker.submit(
+            functools.partial(write_datacube, metadata=metadata),
+            processor.phase_history, processor.sicd, rects, filename,
+            callback=finished, error_callback=failed)
 
     def callback_step_forward(self):
         self.step_animation("forward")
@@ -484,41 +582,39 @@ class ApertureTool(WidgetPanel):
 
     def callback_stop_animation(self):
         self.app_variables.animation.stop_pressed = True
+        self._animation_scheduler.stop()
 
-    def callback_play_animation(self):
-        self.update_animation_params()
+    def get_animation_order(self):
+        # type: () -> List[int]
+        """
+        Gets the animation frame indices in display order.
 
-        direction_forward_or_back = "forward"
+        Returns
+        -------
+        List[int]
+        """
+
+        indices = list(range(self.app_variables.animation.n_frames))
         if self.animation_panel.mode_panel.reverse.is_selected():
-            direction_forward_or_back = "back"
-        time_between_frames = 1 / float(self.animation_panel.animation_settings.frame_rate.get())
-        self.animation_panel.animation_settings.stop.config(state="normal")
+            indices.reverse()
+        return indices
 
-        def play_animation():
-            self.animation_panel.animation_settings.disable_all_widgets()
-            self.animation_panel.animation_settings.stop.config(state="normal")
-            if direction_forward_or_back == "forward":
-                self.app_variables.animation.current_position = -1
-            else:
-                self.app_variables.animation.current_position = self.app_variables.animation.n_frames
-            for i in range(self.app_variables.animation.n_frames):
-                self.update_animation_params()
-                if self.app_variables.animation.stop_pressed:
-                    self.animation_panel.animation_settings.enable_all_widgets()
-                    break
-                tic = time.time()
-                self.step_animation(direction_forward_or_back)
-                self.phase_history_panel.update()
-                toc = time.time()
-                if (toc - tic) < time_between_frames:
-                    time.sleep(time_between_frames - (toc - tic))
+    def callback_play_animation(self):
+        self.update_animation_params()
+        order = self.get_animation_order()
+        # start rendering all of the frames in the background, in display order
+        if not self.render_animation_frames(order=order):
+            return
 
+        fps = float(self.animation_panel.animation_settings.frame_rate.get())
         self.app_variables.animation.stop_pressed = False
-        if self.animation_panel.animation_settings.cycle_continuously.is_selected():
-            while not self.app_variables.animation.stop_pressed:
-                play_animation()
-        else:
-            play_animation()
+        self.animation_panel.animation_settings.disable_all_widgets()
+        self.animation_panel.animation_settings.stop.config(state="normal")
+        self._animation_scheduler.start(
+            order, fps, cycle=self.app_variables.animation.cycle_continuously,
+            finished_callback=self._animation_finished)
+
+    def _animation_finished(self):
         self.app_variables.animation.stop_pressed = False
         self.animation_panel.animation_settings.enable_all_widgets()
 
@@ -553,6 +649,9 @@ class ApertureTool(WidgetPanel):
             self.update_filtered_image()
 
     def exit(self):
+        self._animation_scheduler.stop()
+        self._export_worker.shutdown()
+        self._frame_renderer.shutdown()
         self.primary.destroy()
 
     # various methods used in the callbacks
@@ -567,6 +666,7 @@ class ApertureTool(WidgetPanel):
         by the RegionSelector.
         """
 
+        self.invalidate_filtered_images()
         if self._can_use_tool:
             self.update_fft_image()
 
@@ -575,11 +675,13 @@ class ApertureTool(WidgetPanel):
         Handle that the reader and/or index has been updated. This is expected to
         be called by the region selector.
         """
+
+        self.invalidate_filtered_images()
         self._can_use_tool = True
         if self.app_variables.image_reader is None:
             self._can_use_tool = False
             self.image_info_panel.file_label.set_text('')
-            self.app_variables.aperture_filter = None
+            self.app_variables.processor = None
             self.make_blank()
             return  # nothing to be done
 
@@ -596,38 +698,22 @@ class ApertureTool(WidgetPanel):
                 'DeltaKCOAPolys not populated',
                 message='At least one of the DeltaKCOAPolys is unpopulated,\n\t'
                         'and will be populated as [[0]] (maybe incorrectly so) for our purposes')
-            if the_sicd.Grid.Row.DeltaKCOAPoly is None:
-                the_sicd.Grid.Row.DeltaKCOAPoly = [[0, ], ]
-            if the_sicd.Grid.Col.DeltaKCOAPoly is None:
-                the_sicd.Grid.Col.DeltaKCOAPoly = [[0, ], ]
+
+        # the processor populates any missing DeltaKCOAPoly, and determines the
+        # default deskew dimension and deweighting
+        processor = SubapertureProcessor(
+            self.app_variables.image_reader.base_reader, index=self.app_variables.image_reader.index)
+        self.app_variables.processor = processor
 
         self.image_info_panel.phd_options.deskew_fast_slow.fast.configure(state="normal")
         self.image_info_panel.phd_options.deskew_fast_slow.slow.configure(state="normal")
         self.image_info_panel.phd_options.apply_deskew.config(state="normal")
         self.image_info_panel.phd_options.apply_deskew.value.set(True)
 
-        row_delta_kcoa = the_sicd.Grid.Row.DeltaKCOAPoly.get_array()
-        if row_delta_kcoa.size == 1 and row_delta_kcoa[0, 0] == 0:
-            the_dimension = 1
-            self.image_info_panel.phd_options.deskew_fast_slow.set_selection(1)
-        else:
-            the_dimension = 0
-            self.image_info_panel.phd_options.deskew_fast_slow.set_selection(0)
-
-        if the_sicd.Grid.Row.WgtFunct is None or the_sicd.Grid.Col.WgtFunct is None:
-            deweighting = False
-            self.image_info_panel.phd_options.uniform_weighting.config(state="disabled")
-            self.image_info_panel.phd_options.uniform_weighting.value.set(False)
-        else:
-            deweighting = True
-            self.image_info_panel.phd_options.uniform_weighting.config(state="normal")
-            self.image_info_panel.phd_options.uniform_weighting.value.set(True)
-
-        self.app_variables.aperture_filter = ApertureFilter(
-            self.app_variables.image_reader.base_reader,
-            dimension=the_dimension,
-            apply_deskew=True,
-            apply_deweighting=deweighting)
+        self.image_info_panel.phd_options.deskew_fast_slow.set_selection(processor.dimension)
+        self.image_info_panel.phd_options.uniform_weighting.config(
+            state="normal" if default_deweighting(the_sicd) else "disabled")
+        self.image_info_panel.phd_options.uniform_weighting.value.set(processor.apply_deweighting)
 
         self.update_fft_image()
 
@@ -642,6 +728,102 @@ class ApertureTool(WidgetPanel):
         self.app_variables.animation.max_aperture_percent = \
             float(self.animation_panel.resolution_settings.max_res.get()) * 0.01
 
+    def get_animation_mode(self):
+        # type: () -> str
+        """
+        Gets the selected animation mode.
+
+        Returns
+        -------
+        str
+            One of `ANIMATION_MODES`.
+        """
+
+        mode_selections = self.animation_panel.mode_panel.mode_selections
+        selection = mode_selections.selection()
+        for mode in ANIMATION_MODES:
+            if selection == getattr(mode_selections, mode):
+                return mode
+        return 'aperture_percent'
+
+    def get_animation_frame_rects(self):
+        # type: () -> numpy.ndarray
+        """
+        Gets the phase history image rectangle for each animation frame, for the
+        current animation parameters.
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+
+        return animation_frame_rects(
+            self.get_fft_image_bounds(), self.get_animation_mode(), self.app_variables.animation.n_frames,
+            aperture_fraction=self.app_variables.animation.aperture_faction,
+            min_aperture_percent=self.app_variables.animation.min_aperture_percent,
+            max_aperture_percent=self.app_variables.animation.max_aperture_percent)
+
+    def has_phase_history(self):
+        # type: () -> bool
+        """
+        Is there a phase history for the selected region?
+
+        Returns
+        -------
+        bool
+        """
+
+        return self.app_variables.processor is not None and \
+            self.app_variables.processor.phase_history is not None
+
+    def render_animation_frames(self, order=None):
+        # type: (Optional[List[int]]) -> bool
+        """
+        Start rendering the animation frames in the background, for the current
+        animation parameters. Frames which are already rendered are retained.
+
+        Parameters
+        ----------
+        order : None|List[int]
+            The order for rendering the frames.
+
+        Returns
+        -------
+        bool
+            Is there anything to render?
+        """
+
+        if not self.has_phase_history():
+            self._frame_renderer.invalidate()
+            return False
+
+        self._frame_renderer.render(
+            self.app_variables.processor.phase_history,
+            self.app_variables.processor.sicd,
+            self.get_animation_frame_rects(),
+            self.get_remap_function(),
+            order=order)
+        return True
+
+    def invalidate_filtered_images(self):
+        """
+        Discard the cached reconstructed images and the rendered animation frames,
+        since the selection or the filter options have changed.
+        """
+
+        self._filtered_cache.clear()
+        self.invalidate_animation_frames()
+
+    def invalidate_animation_frames(self):
+        """
+        Discard the rendered animation frames, since the selection, the filter
+        options, or the remap function have changed. This stops any animation in
+        progress.
+        """
+
+        self._animation_scheduler.stop()
+        self._frame_renderer.invalidate()
+
     def step_animation(self, direction_forward_or_back):
         """
         Steps the animation.
@@ -656,12 +838,8 @@ class ApertureTool(WidgetPanel):
         """
 
         self.update_animation_params()
-        fft_canvas_bounds = self.phase_history_panel.canvas.image_coords_to_canvas_coords(
-            self.get_fft_image_bounds())
-        full_canvas_x_aperture = fft_canvas_bounds[2] - fft_canvas_bounds[0]
-        full_canvas_y_aperture = fft_canvas_bounds[3] - fft_canvas_bounds[1]
-
-        mode = self.animation_panel.mode_panel.mode_selections.selection()
+        if not self.render_animation_frames():
+            return
 
         if direction_forward_or_back == "forward":
             if self.app_variables.animation.current_position < self.app_variables.animation.n_frames - 1:
@@ -669,58 +847,30 @@ class ApertureTool(WidgetPanel):
         elif direction_forward_or_back == "back":
             if self.app_variables.animation.current_position > 0:
                 self.app_variables.animation.current_position -= 1
+        self.show_animation_frame(self.app_variables.animation.current_position)
 
-        if mode == self.animation_panel.mode_panel.mode_selections.slow_time:
-            aperture_distance = full_canvas_x_aperture * self.app_variables.animation.aperture_faction
-
-            start_locs = numpy.linspace(
-                fft_canvas_bounds[0], fft_canvas_bounds[2] - aperture_distance, self.app_variables.animation.n_frames)
-
-            x_start = start_locs[self.app_variables.animation.current_position]
-            new_rect = (x_start, fft_canvas_bounds[1], x_start + aperture_distance, fft_canvas_bounds[3])
-        elif mode == self.animation_panel.mode_panel.mode_selections.fast_time:
-            aperture_distance = full_canvas_y_aperture * self.app_variables.animation.aperture_faction
-
-            start_locs = numpy.linspace(
-                fft_canvas_bounds[1], fft_canvas_bounds[3] - aperture_distance, self.app_variables.animation.n_frames)
-            start_locs = numpy.flip(start_locs)
-            y_start = start_locs[self.app_variables.animation.current_position]
-            new_rect = (
-                fft_canvas_bounds[0], y_start, fft_canvas_bounds[2], y_start + aperture_distance)
-        else:
-            xul, yul, xlr, ylr = fft_canvas_bounds
-            mid_x = 0.5*(xul+xlr)
-            mid_y = 0.5*(yul+ylr)
-            max_x_width = 0.5*full_canvas_x_aperture*self.app_variables.animation.max_aperture_percent
-            max_y_width = 0.5*full_canvas_y_aperture*self.app_variables.animation.max_aperture_percent
-            min_x_width = 0.5*full_canvas_x_aperture*self.app_variables.animation.min_aperture_percent
-            min_y_width = 0.5*full_canvas_y_aperture*self.app_variables.animation.min_aperture_percent
-
-            if mode == self.animation_panel.mode_panel.mode_selections.full_az_bandwidth:
-                canvas_xul_start, canvas_xlr_start = xul, xlr
-                canvas_xul_stop, canvas_xlr_stop = xul, xlr
-            else:
-                canvas_xul_start, canvas_xlr_start = mid_x - max_x_width, mid_x + max_x_width
-                canvas_xul_stop, canvas_xlr_stop = mid_x - min_x_width, mid_x + min_x_width
+    def show_animation_frame(self, position):
+        """
+        Show the given animation frame, waiting for it to be rendered if necessary.
 
-            if mode == self.animation_panel.mode_panel.mode_selections.full_range_bandwidth:
-                canvas_yul_start, canvas_ylr_start = yul, ylr
-                canvas_yul_stop, canvas_ylr_stop = yul, ylr
-            else:
-                canvas_yul_start, canvas_ylr_start = mid_y - max_y_width, mid_y + max_y_width
-                canvas_yul_stop, canvas_ylr_stop = mid_y - min_y_width, mid_y + min_y_width
+        Parameters
+        ----------
+        position : int
 
-            x_uls = numpy.linspace(canvas_xul_start, canvas_xul_stop, self.app_variables.animation.n_frames)
-            x_lrs = numpy.linspace(canvas_xlr_start, canvas_xlr_stop, self.app_variables.animation.n_frames)
-            y_uls = numpy.linspace(canvas_yul_start, canvas_yul_stop, self.app_variables.animation.n_frames)
-            y_lrs = numpy.linspace(canvas_ylr_start, canvas_ylr_stop, self.app_variables.animation.n_frames)
+        Returns
+        -------
+        None
+        """
 
-            frame_num = self.app_variables.animation.current_position
-            new_rect = (x_uls[frame_num], y_uls[frame_num], x_lrs[frame_num], y_lrs[frame_num])
+        position = min(max(position, 0), self._frame_renderer.frame_count - 1)
+        self.app_variables.animation.current_position = position
+        rect = tuple(float(entry) for entry in self._frame_renderer.rects[position])
 
         select_uid = self.phase_history_panel.canvas.variables.get_tool_shape_id_by_name('SELECT')
-        self.phase_history_panel.canvas.modify_existing_shape_using_canvas_coords(select_uid, new_rect)
-        self.update_filtered_image()
+        self._skip_update = True
+        self.phase_history_panel.canvas.modify_existing_shape_using_image_coords(select_uid, rect)
+        self._skip_update = False
+        self.set_filtered_image(self._frame_renderer.frame(position))
         self.update_phase_history_selection()
 
     def animation_fast_slow_popup(self):
@@ -735,24 +885,17 @@ class ApertureTool(WidgetPanel):
     # updating the various image data
     def update_fft_image(self):
         """
-        This changes the underlying phase history data from the new aperture_filter object.
+        This changes the underlying phase history data from the processor.
         """
 
-        if self.app_variables.aperture_filter is None or \
-                self.app_variables.aperture_filter.normalized_phase_history is None:
+        if not self.has_phase_history():
             self.make_blank()
             return
 
-        # set the phase history image data
-        temp_phase_history = numpy.abs(self.app_variables.aperture_filter.normalized_phase_history)
-        min_phase_history = numpy.min(temp_phase_history)
-        max_phase_history = numpy.max(temp_phase_history)
-        display_phase_history = numpy.empty(temp_phase_history.shape, dtype='uint8')
-        display_phase_history[:] = 255*(temp_phase_history - min_phase_history)/(max_phase_history - min_phase_history)
-
-        if not self.app_variables.aperture_filter.flip_x_axis:
-            display_phase_history = numpy.fliplr(display_phase_history)
-        fft_reader = NumpyCanvasImageReader(display_phase_history)
+        # set the phase history image data, which is scaled on demand at the canvas resolution
+        fft_reader = PhaseHistoryCanvasImageReader(
+            self.app_variables.processor.phase_history,
+            flip_columns=not self.app_variables.processor.aperture_filter.flip_x_axis)
 
         self._skip_update = True  # begin short circuiting a stupid canvas update
         self.phase_history_panel.set_image_reader(fft_reader)
@@ -766,7 +909,7 @@ class ApertureTool(WidgetPanel):
         self._skip_update = False  # short circuiting a stupid canvas update
 
         # update the information about the phase history area selection
-        the_shape = self.app_variables.aperture_filter.normalized_phase_history.shape
+        the_shape = self.app_variables.processor.phase_history.shape
         self.image_info_panel.chip_size_panel.nx.set_text(the_shape[1])
         self.image_info_panel.chip_size_panel.ny.set_text(the_shape[0])
 
@@ -785,28 +928,27 @@ class ApertureTool(WidgetPanel):
         Tuple
         """
 
-        meta = self.app_variables.image_reader.get_sicd()
-
-        row_ratio = meta.Grid.Row.ImpRespBW*meta.Grid.Row.SS
-        col_ratio = meta.Grid.Col.ImpRespBW*meta.Grid.Col.SS
-
         full_n_rows = self.phase_history_panel.canvas.variables.canvas_image_object.image_reader.full_image_ny
         full_n_cols = self.phase_history_panel.canvas.variables.canvas_image_object.image_reader.full_image_nx
-
-        full_im_y_start = int(full_n_rows * (1 - row_ratio) / 2)
-        full_im_y_end = full_n_rows - full_im_y_start
-
-        full_im_x_start = int(full_n_cols * (1 - col_ratio) / 2)
-        full_im_x_end = full_n_cols - full_im_x_start
-
-        return full_im_y_start, full_im_x_start, full_im_y_end, full_im_x_end
+        return phase_history_bounds(self.app_variables.image_reader.get_sicd(), (full_n_rows, full_n_cols))
 
     def update_filtered_image(self):
         """
         This updates the reconstructed image, from the selected filtered image area.
         """
 
-        filter_image = self.get_filtered_image()
+        self.set_filtered_image(self.get_filtered_image())
+
+    def set_filtered_image(self, filter_image):
+        """
+        Display the given reconstructed image.
+
+        Parameters
+        ----------
+        filter_image : None|numpy.ndarray
+            If `None`, a blank image is displayed.
+        """
+
         if self.phase_history_panel.canvas.variables.canvas_image_object is None:
             return
         if filter_image is None:
@@ -815,6 +957,23 @@ class ApertureTool(WidgetPanel):
             filter_image = numpy.zeros((full_n_rows, full_n_cols), dtype='uint8')
         self.filtered_panel.set_image_reader(NumpyCanvasImageReader(filter_image))
 
+    def get_remap_function(self):
+        """
+        Fetches the remap function for the reconstructed image.
+
+        Returns
+        -------
+        Callable
+        """
+
+        remap_function = self.app_variables.image_reader.remap_function
+        if remap_function is None:
+            # NB: retain this, so that the rendered animation frames remain valid
+            if self._default_remap is None:
+                self._default_remap = NRL()
+            remap_function = self._default_remap
+        return remap_function
+
     def get_filtered_image(self) -> Optional[numpy.ndarray]:
         """
         Fetches the actual underlying reconstructed image
@@ -824,13 +983,10 @@ class ApertureTool(WidgetPanel):
         Optional[numpy.ndarray]
         """
 
-        if self.app_variables.aperture_filter is None:
+        if self.app_variables.processor is None:
             return None
 
-        # fetch the remap function
-        remap_function = self.app_variables.image_reader.remap_function
-        if remap_function is None:
-            remap_function = NRL()
+        remap_function = self.get_remap_function()
 
         # fetch the data
         select_uid = self.phase_history_panel.canvas.variables.get_tool_shape_id_by_name('SELECT')
@@ -838,13 +994,10 @@ class ApertureTool(WidgetPanel):
         if full_image_rect is None:
             return None
 
-        y_min = int(min(full_image_rect[0::2]))
-        y_max = int(max(full_image_rect[0::2]))
-        x_min = int(min(full_image_rect[1::2]))
-        x_max = int(max(full_image_rect[1::2]))
-        if y_min == y_max or x_min == x_max:
+        slices = rect_slices(full_image_rect)
+        if slices is None:
             return None
-        return remap_function(self.app_variables.aperture_filter[y_min:y_max, x_min:x_max])
+        return self._filtered_cache.display_image(self.app_variables.processor.aperture_filter, slices, remap_function)
 
     def update_phase_history_selection(self):
         """
@@ -858,37 +1011,26 @@ class ApertureTool(WidgetPanel):
 
         the_sicd = self.app_variables.image_reader.get_sicd()
 
-        image_bounds = self.get_fft_image_bounds()
         select_uid = self.phase_history_panel.canvas.variables.get_tool_shape_id_by_name('SELECT')
-        current_bounds = self.phase_history_panel.canvas.shape_image_coords_to_canvas_coords(select_uid)
-        x_min = min(current_bounds[1::2])
-        x_max = max(current_bounds[1::2])
-        y_min = min(current_bounds[0::2])
-        y_max = max(current_bounds[0::2])
-
-        x_full_image_range = image_bounds[3] - image_bounds[1]
-        y_full_image_range = image_bounds[2] - image_bounds[0]
-
-        start_cross = 100*(x_min - image_bounds[1])/float(x_full_image_range)
-        stop_cross = 100*(x_max - image_bounds[1])/float(x_full_image_range)
-        fraction_cross = 100*(x_max - x_min)/float(x_full_image_range)
-
-        start_range = 100*(y_min - image_bounds[0])/float(y_full_image_range)
-        stop_range = 100*(y_max - image_bounds[0])/float(y_full_image_range)
-        fraction_range = 100*(y_max - y_min)/float(y_full_image_range)
-
-        self.phase_history.start_percent_cross.set_text("{:0.4f}".format(start_cross))
-        self.phase_history.stop_percent_cross.set_text("{:0.4f}".format(stop_cross))
-        self.phase_history.fraction_cross.set_text("{:0.4f}".format(fraction_cross))
-        self.phase_history.start_percent_range.set_text("{:0.4f}".format(start_range))
-        self.phase_history.stop_percent_range.set_text("{:0.4f}".format(stop_range))
-        self.phase_history.fraction_range.set_text("{:0.4f}".format(fraction_range))
+        current_rect = self.phase_history_panel.canvas.get_shape_image_coords(select_uid)
+        if current_rect is None:
+            return
+        selection_info = frame_metadata(the_sicd, self.get_fft_image_bounds(), current_rect)
+        if selection_info['row_bounds'] is None:
+            return
+
+        self.phase_history.start_percent_cross.set_text("{:0.4f}".format(selection_info['cross_start_percent']))
+        self.phase_history.stop_percent_cross.set_text("{:0.4f}".format(selection_info['cross_stop_percent']))
+        self.phase_history.fraction_cross.set_text("{:0.4f}".format(selection_info['cross_fraction_percent']))
+        self.phase_history.start_percent_range.set_text("{:0.4f}".format(selection_info['range_start_percent']))
+        self.phase_history.stop_percent_range.set_text("{:0.4f}".format(selection_info['range_stop_percent']))
+        self.phase_history.fraction_range.set_text("{:0.4f}".format(selection_info['range_fraction_percent']))
 
         # handle units
         self.phase_history.resolution_range_units.set_text("meters")
         self.phase_history.resolution_cross_units.set_text("meters")
-        range_resolution = the_sicd.Grid.Row.ImpRespWid/(0.01*fraction_range)
-        cross_resolution = the_sicd.Grid.Col.ImpRespWid/(0.01*fraction_cross)
+        range_resolution = selection_info['range_resolution']
+        cross_resolution = selection_info['cross_resolution']
 
         tmp_range_resolution = range_resolution
         tmp_cross_resolution = cross_resolution
@@ -948,9 +1090,9 @@ class ApertureTool(WidgetPanel):
         self.phase_history.sample_spacing_range.set_text("{:0.2f}".format(tmp_range_ss))
 
         # only update if we have twist angle and graze angles
-        if the_sicd.SCPCOA.TwistAng and the_sicd.SCPCOA.GrazeAng:
-            cross_ground_resolution = cross_resolution/numpy.cos(numpy.deg2rad(the_sicd.SCPCOA.TwistAng))
-            range_ground_resolution = range_resolution/numpy.cos(numpy.deg2rad(the_sicd.SCPCOA.GrazeAng))
+        if 'cross_ground_resolution' in selection_info:
+            cross_ground_resolution = selection_info['cross_ground_resolution']
+            range_ground_resolution = selection_info['range_ground_resolution']
 
             tmp_cross_ground_res = cross_ground_resolution
             tmp_range_ground_res = range_ground_resolution
@@ -994,9 +1136,9 @@ class AppVariables(object):
     image_reader = TypedDescriptor(
         'image_reader', SICDTypeCanvasImageReader,
         docstring='The complex type image reader object.')  # type: SICDTypeCanvasImageReader
-    aperture_filter = TypedDescriptor(
-        'aperture_filter', ApertureFilter,
-        docstring='The aperture filter calculator.')  # type: ApertureFilter
+    processor = TypedDescriptor(
+        'processor', SubapertureProcessor,
+        docstring='The sub-aperture processor for the selected region.')  # type: SubapertureProcessor
     animation = TypedDescriptor(
         'animation', AnimationProperties,
         docstring='The animation configuration.')  # type: AnimationProperties
@@ -1161,7 +1303,8 @@ class RegionSelection(Frame, WidgetWithMetadata):
         selection_image_coords = self.image_panel.canvas.get_shape_image_coords(select_uid)
 
         if selection_image_coords is None:
-            self.variables.aperture_filter.set_sub_image_bounds(None, None)
+            if self.variables.processor is not None:
+                self.variables.processor.set_region(None, None)
             self.aperture_tool.handle_main_selection_update()
             return
 
@@ -1185,8 +1328,8 @@ class RegionSelection(Frame, WidgetWithMetadata):
                              '({} pixels on an edge).'.format(max_size))
             return
 
-        if self.variables.aperture_filter is not None:
-            self.variables.aperture_filter.set_sub_image_bounds((y1, y2), (x1, x2))
+        if self.variables.processor is not None:
+            self.variables.processor.set_region((y1, y2), (x1, x2))
             self.aperture_tool.handle_main_selection_update()
 
     # noinspection PyUnusedLocal
@@ -1200,6 +1343,7 @@ class RegionSelection(Frame, WidgetWithMetadata):
         """
 
         if self.variables.image_reader is not None:
+            self.aperture_tool.invalidate_animation_frames()
             self.aperture_tool.update_filtered_image()
 
     # noinspection PyUnusedLocal
@@ -11,6 +11,7 @@ import io
 import logging
 import os
 import tempfile
+import threading
 
 import plotly.offline
 import tkinter
@@ -47,6 +48,7 @@ class _Buttons(WidgetPanelNoLabel):
         ('plot_image_area_label', 'plot_image_area_button'),
         ('plot_vector_power_label', 'plot_vector_power_button'),
         ('plot_vector_tfr_label', 'plot_vector_tfr_button'),
+        ('plot_power_summary_label', 'plot_power_summary_button'),
         ('kmz_label', 'kmz_button'),
     )
 
@@ -71,6 +73,13 @@ class _Buttons(WidgetPanelNoLabel):
         'plot_vector_tfr_button', default_text='CPHD Vector Time-Frequency Plot',
         docstring='')  # type: Button
 
+    plot_power_summary_label = LabelDescriptor(
+        'plot_power_summary_label', default_text='Plot CPHD Channel Power Summary',
+        docstring='')  # type: Label
+    plot_power_summary_button = ButtonDescriptor(
+        'plot_power_summary_button', default_text='CPHD Channel Power Plot',
+        docstring='')  # type: Button
+
     kmz_label = LabelDescriptor(
         'kmz_label', default_text='Create KMZ of collection geometry',
         docstring='')  # type: Label
@@ -115,6 +124,8 @@ class ValidationTool(tkinter.PanedWindow, WidgetWithMetadata):
         """
 
         self.variables = AppVariables()
+        # the reader is shared by the plotting tools, some of which read it on worker threads
+        self._read_lock = threading.Lock()
 
         if 'sashrelief' not in kwargs:
             kwargs['sashrelief'] = tkinter.RIDGE
@@ -166,6 +177,7 @@ class ValidationTool(tkinter.PanedWindow, WidgetWithMetadata):
         self.button_panel.plot_image_area_button.config(command=self.callback_plot_image_area)
         self.button_panel.plot_vector_power_button.config(command=self.callback_plot_vector_power)
         self.button_panel.plot_vector_tfr_button.config(command=self.callback_plot_vector_tfr)
+        self.button_panel.plot_power_summary_button.config(command=self.callback_plot_power_summary)
         self.button_panel.kmz_button.config(command=self.callback_kmz)
 
         self.update_reader(reader)
@@ -323,7 +335,7 @@ class ValidationTool(tkinter.PanedWindow, WidgetWithMetadata):
 
         reader = self.variables.image_reader.base_reader
         root = tkinter.Toplevel(self.master)
-        cphd_plotting.CphdVectorPower(root, reader)
+        cphd_plotting.CphdVectorPower(root, reader, read_lock=self._read_lock)
 
     def callback_plot_vector_tfr(self):
         """
@@ -335,7 +347,19 @@ class ValidationTool(tkinter.PanedWindow, WidgetWithMetadata):
 
         reader = self.variables.image_reader.base_reader
         root = tkinter.Toplevel(self.master)
-        cphd_plotting.CphdVectorTFR(root, reader)
+        cphd_plotting.CphdVectorTFR(root, reader, read_lock=self._read_lock)
+
+    def callback_plot_power_summary(self):
+        """
+        Enable the whole channel power visualization
+        """
+
+        if not self._verify_reader():
+            return
+
+        reader = self.variables.image_reader.base_reader
+        root = tkinter.Toplevel(self.master)
+        cphd_plotting.CphdChannelPowerSummary(root, reader, read_lock=self._read_lock)
 
     def callback_kmz(self):
         """
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a headless batch version of the full image frequency support
+weighting analysis, for validating many SICD type files at once.
+
+This is intended to be used from the command line, like
+
+.. code-block:: bash
+
+    python -m sarpy_apps.apps.full_support_batch <input files or directories> -o <output directory>
+
+No display is required, and the files are processed in parallel using a process pool.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import csv
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Sequence
+
+import numpy
+
+from sarpy.io.general.base import SarpyIOError
+
+from sarpy_apps.supporting_classes.frequency_support import analyze_weighting, \
+    populate_weights_figure
+from sarpy_apps.supporting_classes.image_reader import SICDTypeCanvasImageReader
+from sarpy_apps.supporting_classes.scratch import get_scratch_space
+
+logger = logging.getLogger(__name__)
+
+_METRIC_FIELDS = (
+    'declared_rms_error', 'declared_max_error', 'declared_correlation',
+    'derived_rms_error', 'derived_max_error', 'derived_correlation',
+    'low_edge_offset', 'high_edge_offset', 'delta_k1_margin', 'delta_k2_margin',
+    'delta_k_consistent', 'flags')
+_CSV_FIELDS = ('file_name', 'index', 'status', 'message') + \
+    tuple('{}_{}'.format(name, field) for name in ['row', 'col'] for field in _METRIC_FIELDS)
+
+
+def _to_list(array):
+    return None if array is None else numpy.asarray(array).tolist()
+
+
+def _json_safe(value):
+    """
+    Convert the given value to strictly json compatible form, with non-finite
+    floats replaced by `None`.
+    """
+
+    if isinstance(value, dict):
+        return {key: _json_safe(entry) for key, entry in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(entry) for entry in value]
+    if isinstance(value, numpy.ndarray):
+        return _json_safe(value.tolist())
+    if isinstance(value, (bool, numpy.bool_)):
+        return bool(value)
+    if isinstance(value, (int, numpy.integer)):
+        return int(value)
+    if isinstance(value, (float, numpy.floating)):
+        return float(value) if numpy.isfinite(value) else None
+    return value
+
+
+def collect_file_names(inputs):
+    """
+    Collect the file names to be analyzed from the given collection of files
+    and/or directories. Directories are searched (not recursively) for files.
+
+    Parameters
+    ----------
+    inputs : Sequence[str]
+
+    Returns
+    -------
+    List[str]
+    """
+
+    file_names = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for fil in sorted(os.listdir(entry)):
+                full_name = os.path.join(entry, fil)
+                if os.path.isfile(full_name):
+                    file_names.append(full_name)
+        elif os.path.isfile(entry):
+            file_names.append(entry)
+        else:
+            logger.warning('Input {} is neither a file nor a directory, skipping'.format(entry))
+    return file_names
+
+
+def _save_plot(reader, analyses, title, plot_file):
+    # use the agg backend directly, so that no display is required
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(10, 8))
+    FigureCanvasAgg(fig)
+    populate_weights_figure(
+        fig, reader.get_sicd(),
+        analyses[0]['scaled_mean'], analyses[0]['derived_weights'],
+        analyses[1]['scaled_mean'], analyses[1]['derived_weights'],
+        title=title, metrics={'Row': analyses[0]['metrics'], 'Col': analyses[1]['metrics']})
+    fig.savefig(plot_file)
+
+
+def analyze_file(file_name, output_directory=None, plots=False, arrays=False):
+    """
+    Perform the weighting analysis for every image in the given file. This is
+    intended to run in a worker process, so failures are reported in the result
+    rather than raised.
+
+    Parameters
+    ----------
+    file_name : str
+    output_directory : None|str
+        The directory for any plot files.
+    plots : bool
+        Save a png plot of the weight information for each image?
+    arrays : bool
+        Include the scaled mean profile and weight arrays in the records?
+
+    Returns
+    -------
+    List[dict]
+        One json compatible record per image in the file. The status is `flagged`
+        if any of the weighting metrics indicate a likely metadata problem.
+    """
+
+    try:
+        reader = SICDTypeCanvasImageReader(file_name)
+    except (SarpyIOError, TypeError) as e:
+        return [{'file_name': file_name, 'index': None, 'status': 'skipped', 'message': str(e)}]
+
+    records = []
+    for index in range(reader.image_count):
+        record = {'file_name': file_name, 'index': index, 'status': 'success', 'message': ''}
+        # noinspection PyBroadException
+        try:
+            reader.index = index
+            analyses = [analyze_weighting(reader, dimension) for dimension in [0, 1]]
+            for name, analysis in zip(['row', 'col'], analyses):
+                record[name] = {'metrics': analysis['metrics']}
+                if arrays:
+                    record[name]['scaled_mean'] = _to_list(analysis['scaled_mean'])
+                    record[name]['derived_weights'] = _to_list(analysis['derived_weights'])
+                    record[name]['declared_weights'] = _to_list(analysis['declared_weights'])
+            if any(len(analysis['metrics']['flags']) > 0 for analysis in analyses):
+                record['status'] = 'flagged'
+            if plots and output_directory is not None:
+                file_stem = os.path.split(file_name)[1]
+                _save_plot(
+                    reader, analyses,
+                    'Weight information for file {}, index {}'.format(file_stem, index),
+                    os.path.join(output_directory, '{}.{}.weights.png'.format(file_stem, index)))
+        except Exception as e:
+            logger.exception('Weighting analysis failed for file {}, index {}'.format(file_name, index))
+            record['status'] = 'failed'
+            record['message'] = str(e)
+        records.append(record)
+    return records
+
+
+def _csv_row(record):
+    row = {key: record.get(key, '') for key in _CSV_FIELDS[:4]}
+    for name in ['row', 'col']:
+        metrics = record.get(name, {}).get('metrics', {})
+        for field in _METRIC_FIELDS:
+            value = metrics.get(field, None)
+            if field == 'flags' and value is not None:
+                value = ';'.join(value)
+            if isinstance(value, float) and not numpy.isfinite(value):
+                value = None
+            row['{}_{}'.format(name, field)] = '' if value is None else value
+    return row
+
+
+def write_results(records, output_directory, stem='weighting_analysis'):
+    """
+    Write the collection of records to json and csv files in the given directory.
+    Non-finite values are written as `null` in the json file, and empty in the
+    csv file.
+
+    Parameters
+    ----------
+    records : List[dict]
+    output_directory : str
+    stem : str
+        The file name stem for the output files.
+
+    Returns
+    -------
+    (str, str)
+        The json and csv file names.
+    """
+
+    json_file = os.path.join(output_directory, '{}.json'.format(stem))
+    with open(json_file, 'w') as fi:
+        json.dump(_json_safe(records), fi, indent=1, allow_nan=False)
+
+    csv_file = os.path.join(output_directory, '{}.csv'.format(stem))
+    with open(csv_file, 'w', newline='') as fi:
+        writer = csv.DictWriter(fi, fieldnames=_CSV_FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(_csv_row(record))
+    return json_file, csv_file
+
+
+def batch_analysis(inputs, output_directory, plots=False, workers=None, arrays=False):
+    """
+    Perform the weighting analysis over the collection of files and/or directories,
+    using a process pool, and write the results.
+
+    Parameters
+    ----------
+    inputs : Sequence[str]
+    output_directory : str
+    plots : bool
+        Save a png plot of the weight information for each image?
+    workers : None|int
+        The number of worker processes. `None` will use all available cores.
+    arrays : bool
+        Include the scaled mean profile and weight arrays in the records?
+
+    Returns
+    -------
+    List[dict]
+        The collection of records, ordered by file name and index.
+    """
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    file_names = collect_file_names(inputs)
+    if workers is None:
+        workers = os.cpu_count()
+    workers = max(1, min(workers, len(file_names)))
+
+    records = []
+    if len(file_names) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(analyze_file, file_name, output_directory, plots, arrays): file_name
+                for file_name in file_names}
+            for future in as_completed(futures):
+                file_records = future.result()
+                for record in file_records:
+                    logger.info('{} index {}: {}'.format(record['file_name'], record['index'], record['status']))
+                records.extend(file_records)
+        # the worker processes do not run their exit handlers, so remove
+        # any of their leftover scratch directories
+        get_scratch_space().clean_stale()
+    records.sort(key=lambda x: (x['file_name'], -1 if x['index'] is None else x['index']))
+    write_results(records, output_directory)
+    return records
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Perform the full support weighting analysis for a collection of SICD type files.",
+        formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        'input', metavar='input', nargs='+',
+        help='The path(s) to the image files, or directories containing image files.')
+    parser.add_argument(
+        '-o', '--output', default='.',
+        help='The output directory for the json and csv results.')
+    parser.add_argument(
+        '-p', '--plots', action='store_true',
+        help='Save a png plot of the weight information for each image.')
+    parser.add_argument(
+        '-a', '--arrays', action='store_true',
+        help='Include the scaled mean profile and weight arrays in the json results.')
+    parser.add_argument(
+        '-w', '--workers', default=None, type=int,
+        help='The number of worker processes, all available cores by default.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO')
+    batch_analysis(args.input, args.output, plots=args.plots, workers=args.workers, arrays=args.arrays)
@@ -9,7 +9,6 @@ __author__ = "Thomas McCullough"
 
 import logging
 from typing import Optional
-from tempfile import mkstemp
 import os
 
 import tkinter
@@ -28,92 +27,20 @@ from tk_builder.panels.image_panel import ImagePanel
 from tk_builder.widgets.basic_widgets import Frame
 
 from sarpy_apps.supporting_classes.file_filters import common_use_collection
+from sarpy_apps.supporting_classes.frequency_support import create_deskewed_transform, \
+    scale_mean_profile, populate_weights_figure
 from sarpy_apps.supporting_classes.image_reader import ComplexCanvasImageReader, SICDTypeCanvasImageReader
+from sarpy_apps.supporting_classes.scratch import release_scratch_file
+from sarpy_apps.supporting_classes.weighting_metrics import sicd_weighting_metrics, \
+    format_weighting_metrics
 from sarpy_apps.supporting_classes.widget_with_metadata import WidgetWithMetadata
 
 from sarpy.io.complex.base import FlatSICDReader
-from sarpy.processing.sicd.fft_base import fft_sicd, fft2_sicd, fftshift
-from sarpy.processing.sicd.normalize_sicd import DeskewCalculator
 from sarpy.io.complex.base import SICDTypeReader
 
 logger = logging.getLogger(__name__)
 
 
-def create_deskewed_transform(reader, dimension=0, suffix='.sarpy.cache'):
-    """
-    Performs the Fourier transform of the deskewed entirety of the given
-    ComplexImageReader contents.
-
-    Parameters
-    ----------
-    reader : SICDTypeCanvasImageReader
-        The reader object.
-    dimension : int
-        One of [0, 1], which dimension to deskew along.
-    suffix : None|str
-        The suffix for the created file name (created using the tempfile module).
-
-    Returns
-    -------
-    (str, numpy.ndarray, numpy.ndarray)
-        A file name, numpy memmap of the given object, and mean along the given dimension.
-        Care should be taken to ensure that the file is deleted when the usage is complete.
-    """
-
-    # set up a true file for the memmap
-    # NB: it should be noted that the tempfile usage which clean themselves up
-    #     cannot (as of 2021-04-23) be opened multiple times on Windows, which
-    #     means that such a "file" cannot be used in conjunction with a numpy
-    #     memmap.
-    data_size = reader.data_size
-    sicd = reader.get_sicd()
-    _, file_name = mkstemp(suffix=suffix, text=False)
-    logger.debug('Creating temp file % s' % file_name)
-    # set up the memmap
-    memmap = numpy.memmap(file_name, dtype='complex64', mode='r+', offset=0, shape=data_size)
-    calculator = DeskewCalculator(
-        reader.base_reader, dimension=dimension, index=reader.index,
-        apply_deskew=True, apply_deweighting=False, apply_off_axis=False)
-    mean_value = numpy.zeros((data_size[0], ), dtype='float64') if dimension == 0 else \
-        numpy.zeros((data_size[1],), dtype='float64')
-
-    # we'll proceed in blocks of approximately this number of pixels
-    pixels_threshold = 2**20
-    # is our whole reader sufficiently small to just do it all in one fell-swoop?
-    if data_size[0]*data_size[1] <= 4*pixels_threshold:
-        data = fftshift(fft2_sicd(calculator[:, :], sicd))
-        memmap[:, :] = data
-        mean_value[:] = numpy.mean(numpy.abs(data), axis=1-dimension)
-        return file_name, memmap, mean_value
-
-    # fetch full rows, and transform then shift along the row direction
-    block_size = int(numpy.ceil(pixels_threshold/data_size[1]))
-    start_col = 0
-    while start_col < data_size[1]:
-        end_col = min(start_col+block_size, data_size[1])
-        data = fftshift(fft_sicd(calculator[:, start_col:end_col], 0, sicd), axes=0)
-        memmap[:, start_col:end_col] = data
-        if dimension == 0:
-            mean_value += numpy.sum(numpy.abs(data), axis=1)
-        start_col = end_col
-    # fetch full columns, and transform then shift along the column direction
-    block_size = int(numpy.ceil(pixels_threshold/data_size[0]))
-    start_row = 0
-    while start_row < data_size[0]:
-        end_row = min(start_row+block_size, data_size[0])
-        data = fftshift(fft_sicd(memmap[start_row:end_row, :], 1, sicd), axes=1)
-        memmap[start_row:end_row, :] = data
-        if dimension == 1:
-            mean_value += numpy.sum(numpy.abs(data), axis=0)
-        start_row = end_row
-
-    if dimension == 0:
-        mean_value /= data_size[1]
-    else:
-        mean_value /= data_size[0]
-    return file_name, memmap, mean_value
-
-
 class AppVariables(object):
     browse_directory = StringDescriptor(
         'browse_directory', default_value=os.path.expanduser('~'),
@@ -129,33 +56,20 @@ class AppVariables(object):
     row_fourier_file = StringDescriptor(
         'row_fourier_file',
         docstring='The row deskewed fourier transformed reader file')  # type: Optional[str]
-    # NB: we are saving this state in order to properly clean up
+    # NB: we are saving this state in order to release the scratch files
     column_fourier_reader = TypedDescriptor(
         'column_fourier_reader', ComplexCanvasImageReader,
         docstring='The column deskewed fourier transformed reader')  # type: ComplexCanvasImageReader
     column_fourier_file = StringDescriptor(
         'row_fourier_file',
         docstring='The column deskewed fourier transformed reader file')  # type: Optional[str]
-    # NB: we are saving this state in order to properly clean up
+    # NB: we are saving this state in order to release the scratch files
 
     derived_row_weights = None  # the derived weights for the row
     scaled_row_mean = None  # the scaled mean Fourier transform of the row deskewed data
     derived_column_weights = None  # the derived weights for the column
     scaled_column_mean = None  # the scaled mean Fourier transform of the column deskewed data
-
-    def __del__(self):
-        # clean up files, because we might need to do so
-        if self.row_fourier_file is not None \
-                and os.path.exists(self.row_fourier_file):
-            os.remove(self.row_fourier_file)
-            logger.debug('(variables) Removing temp file % s' % self.row_fourier_file)
-            self.row_fourier_file = None
-
-        if self.column_fourier_file is not None and \
-                os.path.exists(self.column_fourier_file):
-            os.remove(self.column_fourier_file)
-            logger.debug('(variables)  Removing temp file % s' % self.column_fourier_file)
-            self.column_fourier_file = None
+    weighting_metrics = None  # the weighting mismatch metrics for both dimensions
 
 
 class FullFrequencySupportTool(Frame, WidgetWithMetadata):
@@ -197,6 +111,7 @@ class FullFrequencySupportTool(Frame, WidgetWithMetadata):
         # menus for informational popups
         self.metadata_menu = tkinter.Menu(self.menu_bar, tearoff=0)
         self.metadata_menu.add_command(label="Weight Plots", command=self.create_weights_plot)
+        self.metadata_menu.add_command(label="Weighting Metrics", command=self.weighting_metrics_popup)
         self.metadata_menu.add_command(label="Metaicon", command=self.metaicon_popup)
         self.metadata_menu.add_command(label="Metaviewer", command=self.metaviewer_popup)
         # ensure menus cascade
@@ -246,18 +161,11 @@ class FullFrequencySupportTool(Frame, WidgetWithMetadata):
         if not hasattr(self, 'variables') or self.variables is None:
             return
 
+        # drop the memmap references, then release the scratch files
         self.variables.row_fourier_reader = None
         self.variables.column_fourier_reader = None
-        if self.variables.row_fourier_file is not None \
-                and os.path.exists(self.variables.row_fourier_file):
-            os.remove(self.variables.row_fourier_file)
-            logger.debug('Removing temp file % s' % self.variables.row_fourier_file)
-
-        if self.variables.column_fourier_file is not None and \
-                os.path.exists(self.variables.column_fourier_file):
-            os.remove(self.variables.column_fourier_file)
-            logger.debug('Removing temp file % s' % self.variables.column_fourier_file)
-
+        release_scratch_file(self.variables.row_fourier_file)
+        release_scratch_file(self.variables.column_fourier_file)
         self.variables.row_fourier_file = None
         self.variables.column_fourier_file = None
 
@@ -283,16 +191,7 @@ class FullFrequencySupportTool(Frame, WidgetWithMetadata):
             draw_deltak_lines(self.row_centered_image_panel.canvas, 'row')
 
             # rescale the row_mean_value so that the smoothed max value is essentially 1
-            if row_mean_value.size < 200:
-                the_max = numpy.amax(row_mean_value)
-            else:
-                the_size = int(numpy.ceil(row_mean_value.size/200.))
-                smoothed = numpy.convolve(
-                    row_mean_value, numpy.full((the_size, ), 1./the_size, dtype='float64'),
-                    mode='valid')
-                the_max = numpy.amax(smoothed)
-            row_mean_value /= the_max
-            self.variables.scaled_row_mean = row_mean_value
+            self.variables.scaled_row_mean = scale_mean_profile(row_mean_value)
             # construct the proper weights and prepare information for weight plotting
             self.variables.derived_row_weights = the_sicd.Grid.Row.define_weight_function(populate=False)
 
@@ -306,16 +205,8 @@ class FullFrequencySupportTool(Frame, WidgetWithMetadata):
 
             draw_deltak_lines(self.column_centered_image_panel.canvas, 'column')
 
-            # rescale the row_mean_value so that the smoothed max value is essentially 1
-            if col_mean_value.size < 200:
-                the_max = numpy.amax(col_mean_value)
-            else:
-                the_size = int(numpy.ceil(col_mean_value.size / 200.))
-                smoothed = numpy.convolve(col_mean_value, numpy.full((the_size,), 1./the_size, dtype='float64'),
-                                          mode='valid')
-                the_max = numpy.amax(smoothed)
-            col_mean_value /= the_max
-            self.variables.scaled_column_mean = col_mean_value
+            # rescale the col_mean_value so that the smoothed max value is essentially 1
+            self.variables.scaled_column_mean = scale_mean_profile(col_mean_value)
             # construct the proper weights and prepare information for weight plotting
             self.variables.derived_column_weights = the_sicd.Grid.Col.define_weight_function(populate=False)
 
@@ -363,6 +254,7 @@ class FullFrequencySupportTool(Frame, WidgetWithMetadata):
         self.variables.derived_row_weights = None
         self.variables.scaled_column_mean = None
         self.variables.derived_column_weights = None
+        self.variables.weighting_metrics = None
         if self.variables.image_reader is None:
             return
 
@@ -374,6 +266,37 @@ class FullFrequencySupportTool(Frame, WidgetWithMetadata):
         set_row_data()
         self.update_idletasks()
         set_col_data()
+        self.variables.weighting_metrics = sicd_weighting_metrics(
+            the_sicd, self.variables.scaled_row_mean, self.variables.scaled_column_mean,
+            derived_row_weights=self.variables.derived_row_weights,
+            derived_column_weights=self.variables.derived_column_weights)
+
+    def get_weighting_metrics(self):
+        """
+        Gets the weighting mismatch metrics for the current image.
+
+        Returns
+        -------
+        None|dict
+            Of the form `{'Row': <metrics>, 'Col': <metrics>}`, see
+            :func:`sarpy_apps.supporting_classes.weighting_metrics.weighting_metrics`.
+        """
+
+        return self.variables.weighting_metrics
+
+    def weighting_metrics_popup(self):
+        """
+        Display the weighting mismatch metrics for the current image.
+        """
+
+        if self.variables.weighting_metrics is None:
+            return  # nothing to be done currently
+
+        showinfo(
+            'Weighting Metrics',
+            message='\n\n'.join(
+                '{}\n{}'.format(name, format_weighting_metrics(self.variables.weighting_metrics[key]))
+                for name, key in [('Row', 'Row'), ('Column', 'Col')]))
 
     def create_weights_plot(self):
         """
@@ -386,59 +309,14 @@ class FullFrequencySupportTool(Frame, WidgetWithMetadata):
                 self.variables.scaled_column_mean is None:
             return  # nothing to be done currently
 
-        the_sicd = self.variables.image_reader.get_sicd()
-        fig, axs = pyplot.subplots(nrows=2, ncols=1)
-
         the_title = 'Weight information for file {}'.format(
             os.path.split(self.variables.image_reader.file_name)[1])
-        fig.suptitle(the_title)
-
-        # plot the row information
-        axs[0].set_ylabel('Row Information')
-        axs[0].set_xlabel('Krow (cycles/meter)')
-        axs[0].plot(
-            numpy.linspace(-0.5/the_sicd.Grid.Row.SS,
-                           0.5/the_sicd.Grid.Row.SS,
-                           self.variables.scaled_row_mean.size),
-            self.variables.scaled_row_mean, 'b', lw=1, label='Observed Data')
-        if self.variables.derived_row_weights is not None:
-            axs[0].plot(numpy.linspace(-0.5*the_sicd.Grid.Row.ImpRespBW,
-                                       0.5*the_sicd.Grid.Row.ImpRespBW,
-                                       self.variables.derived_row_weights.size),
-                        self.variables.derived_row_weights,
-                        'g--', lw=3, label='Row Derived Weights')
-        if the_sicd.Grid.Row.WgtFunct is not None:
-            axs[0].plot(numpy.linspace(-0.5*the_sicd.Grid.Row.ImpRespBW,
-                                       0.5*the_sicd.Grid.Row.ImpRespBW,
-                                       the_sicd.Grid.Row.WgtFunct.size),
-                        the_sicd.Grid.Row.WgtFunct,
-                        'r:', lw=3, label='Row.WgtFunct')
-        axs[0].set_xlim(min(-0.5/the_sicd.Grid.Row.SS, -0.5*the_sicd.Grid.Row.ImpRespBW),
-                        max(0.5/the_sicd.Grid.Row.SS, 0.5*the_sicd.Grid.Row.ImpRespBW))
-        axs[0].legend(loc='upper right')
-
-        axs[1].set_ylabel('Column Information')
-        axs[1].set_xlabel('Kcol (cycles/meter)')
-        axs[1].plot(
-            numpy.linspace(-0.5/the_sicd.Grid.Col.SS,
-                           0.5/the_sicd.Grid.Col.SS,
-                           self.variables.scaled_column_mean.size),
-            self.variables.scaled_column_mean, 'b', lw=1, label='Observed Data')
-        if self.variables.derived_column_weights is not None:
-            axs[1].plot(numpy.linspace(-0.5*the_sicd.Grid.Col.ImpRespBW,
-                                       0.5*the_sicd.Grid.Col.ImpRespBW,
-                                       self.variables.derived_column_weights.size),
-                        self.variables.derived_column_weights,
-                        'g--', lw=3, label='Col Derived Weights')
-        if the_sicd.Grid.Col.WgtFunct is not None:
-            axs[1].plot(numpy.linspace(-0.5*the_sicd.Grid.Col.ImpRespBW,
-                                       0.5*the_sicd.Grid.Col.ImpRespBW,
-                                       the_sicd.Grid.Col.WgtFunct.size),
-                        the_sicd.Grid.Col.WgtFunct,
-                        'r:', lw=3, label='Col.WgtFunct')
-        axs[1].set_xlim(min(-0.5/the_sicd.Grid.Col.SS, -0.5*the_sicd.Grid.Col.ImpRespBW),
-                        max(0.5/the_sicd.Grid.Col.SS, 0.5*the_sicd.Grid.Col.ImpRespBW))
-        axs[1].legend(loc='upper right')
+        fig = pyplot.figure()
+        populate_weights_figure(
+            fig, self.variables.image_reader.get_sicd(),
+            self.variables.scaled_row_mean, self.variables.derived_row_weights,
+            self.variables.scaled_column_mean, self.variables.derived_column_weights,
+            title=the_title, metrics=self.variables.weighting_metrics)
 
         # create a toplevel, and put our figure inside it
         root = tkinter.Toplevel(self.root)
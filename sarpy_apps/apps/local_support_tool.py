@@ -8,8 +8,10 @@ __classification__ = "UNCLASSIFIED"
 __author__ = "Thomas McCullough"
 
 
+import logging
 import os
-from typing import Union
+import threading
+from typing import Union, Tuple
 import numpy
 
 import tkinter
@@ -17,10 +19,18 @@ from tkinter import ttk
 from tkinter.filedialog import askopenfilenames, askdirectory
 from tkinter.messagebox import showinfo
 
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, \
+    NavigationToolbar2Tk
+
 from tk_builder.base_elements import TypedDescriptor, IntegerDescriptor, StringDescriptor
 from tk_builder.image_reader import NumpyCanvasImageReader
 from tk_builder.panels.image_panel import ImagePanel
 
+from sarpy_apps.supporting_classes.background import BackgroundWorker
+from sarpy_apps.supporting_classes.deltak_consistency import deltak_consistency_map, \
+    decimated_amplitude, populate_deltak_figure
+from sarpy_apps.supporting_classes.fft_service import fast_shape, get_fft_service
 from sarpy_apps.supporting_classes.file_filters import common_use_collection
 from sarpy_apps.supporting_classes.image_reader import SICDTypeCanvasImageReader
 from sarpy_apps.supporting_classes.widget_with_metadata import WidgetWithMetadata
@@ -28,8 +38,8 @@ from sarpy_apps.supporting_classes.widget_with_metadata import WidgetWithMetadat
 from sarpy.io.complex.base import SICDTypeReader
 from sarpy.io.complex.utils import get_physical_coordinates
 from sarpy.visualization.remap import NRL
-from sarpy.processing.sicd.fft_base import fft2_sicd, fftshift
 
+logger = logging.getLogger(__name__)
 
 class AppVariables(object):
     browse_directory = StringDescriptor(
@@ -63,6 +73,7 @@ class AppVariables(object):
     col_deltak2 = IntegerDescriptor(
         'col_deltak2',
         docstring='The id of the frequency_panel of the column deltak2.')  # type: Union[None, int]
+    deltak_consistency = None  # the most recent whole image DeltaKCOA consistency map
 
 
 class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
@@ -79,6 +90,14 @@ class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
         self.root = primary
         self.variables = AppVariables()
         self.phase_remap = NRL()
+        # the spectrum is calculated in the background, and only for the most recent selection
+        self.spectrum_delay = 100  # milliseconds to wait for the selection to settle
+        self._spectrum_shape = None
+        # the reader is shared with the DeltaKCOA consistency map calculation
+        self._read_lock = threading.Lock()
+        self._deltak_cancel = None  # type: Union[None, threading.Event]
+        self._deltak_progress = 0.
+        self._deltak_progress_id = None
 
         if 'sashrelief' not in kwargs:
             kwargs['sashrelief'] = tkinter.RIDGE
@@ -86,6 +105,8 @@ class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
             kwargs['orient'] = tkinter.HORIZONTAL
 
         tkinter.PanedWindow.__init__(self, primary, **kwargs)
+        self._spectrum_worker = BackgroundWorker(self)
+        self._deltak_worker = BackgroundWorker(self, poll_interval=100, name='sarpy_apps_deltak')
 
         self.image_panel = ImagePanel(self, borderwidth=0)  # type: ImagePanel
         self.add(
@@ -115,9 +136,20 @@ class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
         self._valid_data_shown = tkinter.IntVar(self, value=0)
         self.metadata_menu.add_checkbutton(
             label='ValidData', variable=self._valid_data_shown, command=self.show_valid_data)
+        # analysis menu
+        self.analysis_menu = tkinter.Menu(self.menu_bar, tearoff=0)
+        self.analysis_menu.add_command(
+            label="DeltaKCOA Consistency Map", command=self.deltak_consistency_popup)
+        self.analysis_menu.add_command(
+            label="Cancel DeltaKCOA Consistency Map", command=self.cancel_deltak_consistency)
+        self._deweight_spectrum = tkinter.IntVar(self, value=0)
+        self.analysis_menu.add_checkbutton(
+            label='Deweight Spectrum', variable=self._deweight_spectrum,
+            command=self.handle_deweight_change)
         # ensure menus cascade
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
         self.menu_bar.add_cascade(label="Metadata", menu=self.metadata_menu)
+        self.menu_bar.add_cascade(label="Analysis", menu=self.analysis_menu)
 
         # handle packing
         self.root.config(menu=self.menu_bar)
@@ -136,9 +168,14 @@ class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
 
         self.update_reader(reader)
 
-    def set_title(self):
+    def set_title(self, status=None):
         """
         Sets the window title.
+
+        Parameters
+        ----------
+        status : None|str
+            The status of any calculation in progress, appended to the title.
         """
 
         file_name = None if self.variables.image_reader is None else self.variables.image_reader.file_name
@@ -148,11 +185,113 @@ class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
             the_title = "Frequency Support Tool, Multiple Files"
         else:
             the_title = "Frequency Support Tool for {}".format(os.path.split(file_name)[1])
+        if status is not None:
+            the_title = '{}, {}'.format(the_title, status)
         self.winfo_toplevel().title(the_title)
 
     def exit(self):
+        self.cancel_deltak_consistency()
+        self._deltak_worker.shutdown()
+        self._spectrum_worker.shutdown()
         self.root.destroy()
 
+    def handle_deweight_change(self):
+        """
+        Handle a change in the spectrum deweighting option.
+        """
+
+        if self.variables.image_reader is None:
+            return
+        self.update_displayed_selection()
+
+    def deltak_consistency_popup(self):
+        """
+        Calculate the whole image map of measured versus DeltaKCOAPoly predicted
+        spectral centroid in the background, showing the progress in the window
+        title, and display it as a heatmap overlay in a popup once complete.
+        """
+
+        the_reader = self.variables.image_reader
+        if the_reader is None:
+            return
+        if self._deltak_cancel is not None:
+            return  # it's already in progress
+
+        cancel_event = threading.Event()
+        self._deltak_cancel = cancel_event
+        self._deltak_progress = 0.
+        the_sicd = the_reader.get_sicd()
+        file_name = the_reader.file_name
+
+        def set_progress(fraction):
+            # NB: this is called on the worker thread, and only sets a value
+            self._deltak_progress = fraction
+
+        def calculate():
+            result = deltak_consistency_map(
+                the_reader, progress_callback=set_progress, cancel_event=cancel_event,
+                read_lock=self._read_lock)
+            if result is None:
+                return None
+            return result, decimated_amplitude(the_reader, read_lock=self._read_lock)
+
+        def finished(result):
+            self._finish_deltak_progress()
+            if result is None:
+                return
+            self.variables.deltak_consistency = result[0]
+            self._show_deltak_consistency(result[0], result[1], the_sicd, file_name)
+
+        def failed(exception):
+            self._finish_deltak_progress()
+            logger.error('Calculating the DeltaKCOA consistency map failed', exc_info=exception)
+            showinfo(
+                'DeltaKCOA consistency failed',
+                message='Calculating the DeltaKCOA consistency map failed:\n{}'.format(exception))
+
+        self._deltak_worker.submit(calculate, callback=finished, error_callback=failed)
+        self._update_deltak_progress()
+
+    def _update_deltak_progress(self):
+        self._deltak_progress_id = None
+        if self._deltak_cancel is None:
+            return
+        self.set_title('DeltaKCOA consistency map {:0.0f}% complete'.format(100*self._deltak_progress))
+        self._deltak_progress_id = self.after(250, self._update_deltak_progress)
+
+    def _finish_deltak_progress(self):
+        self._deltak_cancel = None
+        if self._deltak_progress_id is not None:
+            self.after_cancel(self._deltak_progress_id)
+            self._deltak_progress_id = None
+        self.set_title()
+
+    def cancel_deltak_consistency(self):
+        """
+        Cancel any DeltaKCOA consistency map calculation in progress.
+        """
+
+        if self._deltak_cancel is None:
+            return
+        self._deltak_cancel.set()
+        self._deltak_worker.invalidate()
+        self._finish_deltak_progress()
+
+    def _show_deltak_consistency(self, result, background, the_sicd, file_name):
+        the_title = 'DeltaKCOA consistency' if not isinstance(file_name, str) else \
+            'DeltaKCOA consistency for file {}'.format(os.path.split(file_name)[1])
+        fig = Figure(figsize=(12, 6))
+        populate_deltak_figure(fig, result, the_sicd, background=background, title=the_title)
+
+        # create a toplevel, and put our figure inside it
+        root = tkinter.Toplevel(self.root)
+        root.wm_title('DeltaKCOA Consistency Map')
+        canvas = FigureCanvasTkAgg(fig, master=root)
+        canvas.draw()
+        canvas.get_tk_widget().pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=1)
+        toolbar = NavigationToolbar2Tk(canvas, root)
+        toolbar.update()
+
     def show_valid_data(self):
         if self.variables.image_reader is None:
             return
@@ -223,6 +362,7 @@ class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
         event
         """
 
+        self.cancel_deltak_consistency()
         self.populate_metaicon()
         self.set_default_selection()
         self.show_valid_data()
@@ -257,6 +397,7 @@ class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
         # change the tool to view
         self.image_panel.canvas.current_tool = 'VIEW'
         self.image_panel.canvas.current_tool = 'VIEW'
+        self.cancel_deltak_consistency()
         # update the reader
         self.variables.image_reader = the_reader
         self.image_panel.set_image_reader(the_reader)
@@ -406,24 +547,79 @@ class LocalFrequencySupportTool(tkinter.PanedWindow, WidgetWithMetadata):
         row_phys, col_phys = get_physical_coordinates(
             the_sicd, 0.5*(extent[0]+extent[1]), 0.5*(extent[2]+extent[3]))
 
-        if row_count < threshold or col_count < threshold:
+        def draw_lines():
+            self._initialize_bandwidth_lines()
+            draw_row_delta_lines()
+            draw_col_delta_lines()
+            draw_row_bandwidth_lines()
+            draw_col_bandwidth_lines()
+
+        def clear_spectrum():
             junk_data = numpy.zeros((100, 100), dtype='uint8')
             self.frequency_panel.set_image_reader(NumpyCanvasImageReader(junk_data))
+            self._spectrum_shape = None
             self._initialize_bandwidth_lines()
-        else:
-            image_data = self.variables.image_reader.base_reader[extent[0]:extent[1], extent[2]:extent[3]]
-            if image_data is not None:
-                self.frequency_panel.set_image_reader(
-                    NumpyCanvasImageReader(self.phase_remap(fftshift(fft2_sicd(image_data, the_sicd)))))
-                self._initialize_bandwidth_lines()
-                draw_row_delta_lines()
-                draw_col_delta_lines()
-                draw_row_bandwidth_lines()
-                draw_col_bandwidth_lines()
-            else:
-                junk_data = numpy.zeros((100, 100), dtype='uint8')
-                self.frequency_panel.set_image_reader(NumpyCanvasImageReader(junk_data))
-                self._initialize_bandwidth_lines()
+
+        def fetch_data():
+            # NB: the reader is not necessarily thread safe, so fetch on the main
+            #     thread, serialized with any DeltaKCOA consistency map calculation
+            with self._read_lock:
+                image_data = the_reader.base_reader[extent[0]:extent[1], extent[2]:extent[3]]
+            if image_data is None:
+                clear_spectrum()
+                return None
+            return image_data, the_sicd, deweight, delta_kcoa
+
+        def show_spectrum(spectrum):
+            self.frequency_panel.set_image_reader(NumpyCanvasImageReader(spectrum))
+            self._spectrum_shape = spectrum.shape
+            draw_lines()
+
+        if row_count < threshold or col_count < threshold:
+            self._spectrum_worker.invalidate()
+            clear_spectrum()
+            return
+
+        # the spectrum is zero padded to fast transform sizes
+        row_count, col_count = fast_shape((row_count, col_count))
+        deweight = (self._deweight_spectrum.get() == 1)
+        delta_kcoa = tuple(
+            0. if dir_params.DeltaKCOAPoly is None else float(dir_params.DeltaKCOAPoly(row_phys, col_phys))
+            for dir_params in [the_sicd.Grid.Row, the_sicd.Grid.Col])
+
+        # draw the lines for the new selection without waiting for the spectrum,
+        # over a blank placeholder if the displayed spectrum size does not match
+        placeholder_shape = (row_count, col_count)
+        if self._spectrum_shape != placeholder_shape:
+            self.frequency_panel.set_image_reader(
+                NumpyCanvasImageReader(numpy.zeros(placeholder_shape, dtype='uint8')))
+            self._spectrum_shape = placeholder_shape
+        draw_lines()
+
+        the_reader = self.variables.image_reader
+        self._spectrum_worker.submit(
+            self._calculate_spectrum, prepare=fetch_data, callback=show_spectrum,
+            delay=self.spectrum_delay)
+
+    def _calculate_spectrum(self, image_data, the_sicd, deweight, delta_kcoa):
+        """
+        Calculate the remapped spectrum of the given data. This runs on the worker
+        thread, and must not touch any tkinter elements.
+
+        Parameters
+        ----------
+        image_data : numpy.ndarray
+        the_sicd : sarpy.io.complex.sicd_elements.SICD.SICDType
+        deweight : bool
+        delta_kcoa : Tuple[float, float]
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+
+        return self.phase_remap(
+            get_fft_service().spectrum(image_data, the_sicd, deweight=deweight, delta_kcoa=delta_kcoa))
 
 
 def main(reader=None):
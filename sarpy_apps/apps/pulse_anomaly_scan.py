@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a headless scan of every pulse of every channel of CRSD
+files for interference (RFI) and other anomalies, ranking the suspect pulses.
+
+This is intended to be used from the command line, like
+
+.. code-block:: bash
+
+    python -m sarpy_apps.apps.pulse_anomaly_scan <input files or directories> -o <output directory>
+
+No display is required, and the pulses are processed in parallel using a process
+pool. The ranked suspect pulses are written to `pulse_anomalies.csv`, and the full
+results to `pulse_anomalies.json`, either of which can be opened in the pulse
+explorer to step through the suspects.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import logging
+import os
+
+from sarpy_apps.apps.full_support_batch import collect_file_names
+from sarpy_apps.supporting_classes.pulse_anomaly import DEFAULT_THRESHOLD, scan_anomalies, \
+    write_anomaly_results
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Scan the pulses of a collection of CRSD files for interference and anomalies.",
+        formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        'input', metavar='input', nargs='+',
+        help='The path(s) to the CRSD files, or directories containing CRSD files.')
+    parser.add_argument(
+        '-o', '--output', default='.',
+        help='The output directory for the json and csv results.')
+    parser.add_argument(
+        '-t', '--threshold', default=DEFAULT_THRESHOLD, type=float,
+        help='The robust score above which a pulse is a suspect.')
+    parser.add_argument(
+        '-n', '--task-pulses', default=1024, type=int,
+        help='The number of pulses in each task.')
+    parser.add_argument(
+        '-w', '--workers', default=None, type=int,
+        help='The number of worker processes, all available cores by default.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO')
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    results = scan_anomalies(
+        collect_file_names(args.input), threshold=args.threshold, workers=args.workers,
+        task_pulses=args.task_pulses,
+        progress_callback=lambda fraction: logger.info('{:0.0f}% complete'.format(100*fraction)))
+    json_file, csv_file = write_anomaly_results(results, args.output)
+    logger.info('Wrote results to {} and {}'.format(json_file, csv_file))
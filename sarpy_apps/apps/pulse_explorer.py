@@ -6,154 +6,195 @@ __classification__ = "UNCLASSIFIED"
 __author__ = ("Thomas Rackers", "Thomas McCullough")
 
 import logging
+import multiprocessing
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from typing import List, Optional
 
 import numpy
-from scipy.signal import spectrogram, resample
 
 import tkinter
 from tkinter import ttk
 from tkinter.messagebox import showinfo
 
-from tkinter.filedialog import askopenfilename
+from tkinter.filedialog import askopenfilename, asksaveasfilename
 
 from tk_builder.base_elements import TypedDescriptor, StringDescriptor, \
     BooleanDescriptor, IntegerDescriptor, FloatDescriptor
+from tk_builder.panels.image_panel import ImagePanel
 from tk_builder.widgets.pyplot_frame import PyplotImagePanel, PlotPopup
 from tk_builder.widgets.basic_widgets import Frame, Label, Entry, Combobox, Button, Scale
 
-from sarpy_apps.supporting_classes.file_filters import crsd_files, all_files
+from sarpy_apps.supporting_classes.file_filters import crsd_files, all_files, csv_files, json_files
 from sarpy_apps.supporting_classes.widget_with_metadata import \
     WidgetWithMetadata
 
 from sarpy.io.general.base import SarpyIOError, FlatReader
 from sarpy.io.received.converter import open_received
 from sarpy.io.received.base import CRSDTypeReader
-from sarpy.processing.sicd.windows import kaiser
-from sarpy.processing.sicd.fft_base import fftshift
 
-from sarpy_apps.supporting_classes.image_reader import CRSDTypeCanvasImageReader
+from sarpy_apps.supporting_classes.image_reader import CRSDTypeCanvasImageReader, \
+    WaterfallCanvasImageReader
+from sarpy_apps.supporting_classes.background import BackgroundWorker
+from sarpy_apps.supporting_classes.crsd_pulses import PVPColumnCache, PulseProfileCache, \
+    SpectrogramLevelsCache, export_spectrogram_datacube, pulse_power_profile, pulse_waterfall, \
+    read_pulses, rf_signal_spectrograms, robust_levels, spectrogram_levels
+from sarpy_apps.supporting_classes.pulse_anomaly import load_anomaly_results, ranked_suspects, \
+    scan_anomalies
+from sarpy_apps.supporting_classes.scratch import get_scratch_space
 
 logger = logging.getLogger(__name__)
 
 _PULSE_DISPLAY_VALUES = ('RFSignal',)
 
 
-def _reramp(pulse_data, sampling_rate, deramp_rate):
+class PulseSpectrogramCache(object):
     """
-
-    Parameters
-    ----------
-    pulse_data : numpy.ndarray
-    sampling_rate : float
-    deramp_rate : float
-
-    Returns
-    -------
-    (numpy.ndarray, float)
-        The reramped_data and new sampling rate.
+    Least recently used cache of the pulse spectrograms, keyed by
+    `(channel index, pulse, pulse display)`. The values are the
+    `(times, frequencies, data)` tuples.
     """
 
-    rcv_window_length = pulse_data.size / sampling_rate
-    deramp_bandwidth = abs(rcv_window_length * deramp_rate)
-    upsample_factor = (deramp_bandwidth + sampling_rate) / sampling_rate
+    def __init__(self, max_bytes=256*2**20):
+        """
 
-    sample_size = round(upsample_factor * pulse_data.size)
-    oversample_factor = sample_size / (upsample_factor * pulse_data.size)
-    use_data = resample(pulse_data - numpy.mean(pulse_data), sample_size)
-    time_interval = 1 / (sampling_rate * upsample_factor * oversample_factor)
-    times = time_interval * numpy.arange(sample_size) - 0.5 * rcv_window_length
-    return use_data * numpy.exp(
-        1j * numpy.pi * deramp_rate * times * times), 1. / time_interval
+        Parameters
+        ----------
+        max_bytes : int
+            The maximum number of bytes of cached spectrograms.
+        """
 
+        self._max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
 
-def _stft(data, sampling_rate):
-    """
-    Take the specified short time fourier transform of the provided data.
+    @property
+    def size_bytes(self):
+        # type: () -> int
+        """
+        int: The number of bytes of cached spectrograms.
+        """
 
-    Parameters
-    ----------
-    data : numpy.ndarray
-        Must be one-dimensional
-    sampling_rate : float
-        The sampling rate.
-
-    Returns
-    -------
-    numpy.ndarray
-    """
+        return self._bytes
 
-    if not (isinstance(data, numpy.ndarray) and data.ndim == 1):
-        raise ValueError(
-            'This short time fourier transform function only applies to a '
-            'one-dimensional numpy array')
+    @property
+    def hits(self):
+        # type: () -> int
+        """
+        int: The number of cache hits.
+        """
 
-    nfft = 2 ** int(numpy.ceil(numpy.log2(numpy.sqrt(data.shape[0]))) + 2)
-    nperseg = int(0.97 * nfft)
-    window = kaiser(nperseg, 5)
-    noverlap = int(0.9 * nfft)
-    frequencies, times, trans_data = spectrogram(
-        data, sampling_rate, window=window, nperseg=nperseg, noverlap=noverlap,
-        nfft=nfft, return_onesided=False)
-    return times, fftshift(frequencies, axes=0), fftshift(trans_data, axes=0)
+        return self._hits
 
+    @property
+    def misses(self):
+        # type: () -> int
+        """
+        int: The number of cache misses.
+        """
 
-def _rf_signal(reader, index, pulse):
-    """
-    Gets the RF Signal data for the given index (channel) and pulse.
+        return self._misses
 
-    Parameters
-    ----------
-    reader : CRSDTypeReader
-    index : int
-    pulse : int
-
-    Returns
-    -------
-    (numpy.ndarray, numpy.ndarray, numpy.ndarray)
-        The times, frequencies, and stft data array
-    """
+    @staticmethod
+    def _size(value):
+        return sum(entry.nbytes for entry in value)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
 
-    crsd = reader.crsd_meta
-    params = crsd.Channel.Parameters[index]
-    sampling_rate = params.Fs
-    data_params = {x.Identifier: x for x in crsd.Data.Channels}[params.Identifier]
-    pulse_data = reader.read(slice(numpy.maximum(pulse, 0),
-                                   numpy.minimum(pulse + 1, data_params.NumVectors)),
-                             slice(None),
-                             index=index, squeeze=True)
-    fic_rate = float(reader.read_pvp_variable('FICRate', index, pulse)[0])
-    dfic0 = float(reader.read_pvp_variable('DFIC0', index, pulse)[0])
-
-    if fic_rate == 0:
-        times, frequencies, stft_data = _stft(pulse_data, sampling_rate)
-        frequencies += params.F0Ref + dfic0 - 0.5 * sampling_rate
-    else:
-        reramped, reramped_sampling_rate = _reramp(pulse_data, sampling_rate,
-                                                   fic_rate)
-        times, frequencies, stft_data = _stft(reramped, reramped_sampling_rate)
-        frequencies += \
-            params.F0Ref + dfic0 + \
-            0.5 * fic_rate * pulse_data.size / reramped_sampling_rate - \
-            0.5 * reramped_sampling_rate
-    return times, frequencies, stft_data
+    def clear(self):
+        """
+        Remove all cached spectrograms.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get(self, key):
+        """
+        Gets the cached spectrogram, marking it as most recently used.
+
+        Parameters
+        ----------
+        key : tuple
+
+        Returns
+        -------
+        None|(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+
+        with self._lock:
+            value = self._entries.get(key, None)
+            if value is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Cache the spectrogram, evicting the least recently used entries as
+        necessary.
+
+        Parameters
+        ----------
+        key : tuple
+        value : (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+
+        size = self._size(value)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._size(previous)
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, removed = self._entries.popitem(last=False)
+                self._bytes -= self._size(removed)
 
 
 class STFTCanvasImageReader(CRSDTypeCanvasImageReader):
     __slots__ = (
         '_base_reader', '_chippers', '_index', '_data_size', '_remap_function',
         '_signal_data_size', '_pulse', '_pulse_display', '_pulse_data',
-        '_times', '_frequencies')
+        '_times', '_frequencies', '_spectrogram_cache', '_read_lock',
+        '_prefetch_lock', '_prefetch_workers', '_prefetch_executor', '_pending',
+        '_pvp_cache')
 
-    def __init__(self, reader):
+    def __init__(self, reader, cache_bytes=256*2**20, prefetch_workers=None):
         """
 
         Parameters
         ----------
         reader : str|CRSDTypeReader
             The crsd type reader, or path to appropriate data file.
+        cache_bytes : int
+            The maximum number of bytes of cached pulse spectrograms.
+        prefetch_workers : None|int
+            The number of prefetch worker threads. `None` uses up to four,
+            depending on the number of cores.
         """
 
+        self._spectrogram_cache = PulseSpectrogramCache(max_bytes=cache_bytes)
+        # the reader is not necessarily thread safe, so reads are serialized
+        self._read_lock = threading.Lock()
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_workers = min(4, os.cpu_count() or 1) if prefetch_workers is None \
+            else max(1, int(prefetch_workers))
+        self._prefetch_executor = None
+        self._pending = {}
+        self._pvp_cache = None
         self._signal_data_size = None
         self._pulse = None
         self._pulse_display = None
@@ -214,6 +255,7 @@ class STFTCanvasImageReader(CRSDTypeCanvasImageReader):
             value = 0
         self._index = value
         self._signal_data_size = signal_data_sizes[value]
+        self.cancel_prefetch()
         self.pulse = 0
 
     @property
@@ -246,6 +288,8 @@ class STFTCanvasImageReader(CRSDTypeCanvasImageReader):
         self._base_reader = value
         # noinspection PyProtectedMember
         self._chippers = value.get_data_segment_as_tuple()
+        self._pvp_cache = PVPColumnCache(value)
+        self._spectrogram_cache.clear()
         self.index = 0
 
     @property
@@ -293,17 +337,184 @@ class STFTCanvasImageReader(CRSDTypeCanvasImageReader):
         """
         return self._pulse_data
 
+    @property
+    def read_lock(self):
+        # type: () -> threading.Lock
+        """
+        threading.Lock: The lock which serializes reading from the base reader.
+        """
+
+        return self._read_lock
+
+    @property
+    def pvp_cache(self):
+        # type: () -> PVPColumnCache
+        """
+        PVPColumnCache: The columnar cache of the PVP values.
+        """
+
+        return self._pvp_cache
+
+    @property
+    def spectrogram_cache(self):
+        # type: () -> PulseSpectrogramCache
+        """
+        PulseSpectrogramCache: The cache of computed pulse spectrograms.
+        """
+
+        return self._spectrogram_cache
+
+    def _cache_key(self, pulse):
+        return self.index, pulse, self.pulse_display
+
+    def _compute_spectrograms(self, keys):
+        """
+        Computes the spectrograms for the given keys, which share the channel and
+        display, as a batch. This may be called from a prefetch worker thread.
+
+        Parameters
+        ----------
+        keys : List[tuple]
+
+        Returns
+        -------
+        Dict[tuple, (numpy.ndarray, numpy.ndarray, numpy.ndarray)]
+            The times, frequencies, and stft data array for each key.
+        """
+
+        index, _, pulse_display = keys[0]
+        if pulse_display == 'RFSignal':
+            pulse_data, fic_rates, dfic0s = read_pulses(
+                self.base_reader, index, [key[1] for key in keys], pvp_cache=self._pvp_cache,
+                read_lock=self._read_lock)
+            params, _ = self._pvp_cache.channel_parameters(index)
+            values = rf_signal_spectrograms(params, pulse_data, fic_rates, dfic0s)
+        else:
+            raise ValueError(
+                'Got unhandled pulse display value `{}`'.format(pulse_display))
+        return dict(zip(keys, values))
+
+    def get_spectrogram(self, pulse):
+        """
+        Gets the spectrogram for the given pulse of the current channel, using
+        the cached or prefetched value, if available.
+
+        Parameters
+        ----------
+        pulse : int
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+            The times, frequencies, and stft data array
+        """
+
+        key = self._cache_key(pulse)
+        value = self._spectrogram_cache.get(key)
+        if value is not None:
+            return value
+
+        with self._prefetch_lock:
+            future = self._pending.get(key, None)
+        if future is not None:
+            # wait for the prefetch already in progress, rather than repeat it
+            try:
+                value = future.result()[key]
+            except CancelledError:
+                value = None
+        if value is None:
+            value = self._compute_spectrograms([key, ])[key]
+            self._spectrogram_cache.put(key, value)
+        return value
+
+    def prefetch(self, direction, count=8):
+        """
+        Compute the spectrograms of the next `count` pulses in the given
+        direction in the background, wrapping around at the ends of the channel.
+        The pulses are split into a batch per prefetch worker. Pending batches
+        for only other pulses are cancelled, if not yet started.
+
+        Parameters
+        ----------
+        direction : int
+            The pulse step direction, the sign is all that matters.
+        count : int
+        """
+
+        if self.pulse is None or self.pulse_count is None:
+            return
+
+        step = -1 if direction < 0 else 1
+        pulses = [(self.pulse + step*k) % self.pulse_count for k in range(1, min(count, self.pulse_count - 1) + 1)]
+        keys = [self._cache_key(pulse) for pulse in pulses]
+        wanted = set(keys)
+        submitted = []
+        with self._prefetch_lock:
+            futures = {}
+            for key, future in self._pending.items():
+                futures.setdefault(future, []).append(key)
+            for future, future_keys in futures.items():
+                if wanted.isdisjoint(future_keys) and future.cancel():
+                    for key in future_keys:
+                        del self._pending[key]
+            if self._prefetch_executor is None:
+                self._prefetch_executor = ThreadPoolExecutor(
+                    max_workers=self._prefetch_workers, thread_name_prefix='sarpy_apps_pulses')
+            keys = [key for key in keys if key not in self._pending and key not in self._spectrogram_cache]
+            batch_size = max(1, int(numpy.ceil(len(keys)/float(self._prefetch_workers))))
+            for start in range(0, len(keys), batch_size):
+                batch = keys[start:start + batch_size]
+                future = self._prefetch_executor.submit(self._compute_spectrograms, batch)
+                for key in batch:
+                    self._pending[key] = future
+                submitted.append((batch, future))
+        # NB: the callback is called immediately for a completed future, so
+        #     must be added after the lock is released
+        for batch, future in submitted:
+            future.add_done_callback(lambda the_future, the_keys=batch: self._prefetch_done(the_keys, the_future))
+
+    def _prefetch_done(self, keys, future):
+        with self._prefetch_lock:
+            for key in keys:
+                if self._pending.get(key, None) is future:
+                    del self._pending[key]
+        if future.cancelled():
+            return
+        exception = future.exception()
+        if exception is not None:
+            logger.error('Prefetching the spectrograms for {} failed'.format(keys), exc_info=exception)
+            return
+        for key, value in future.result().items():
+            self._spectrogram_cache.put(key, value)
+
+    def cancel_prefetch(self):
+        """
+        Cancel any pending prefetches which have not yet started.
+        """
+
+        with self._prefetch_lock:
+            for key in list(self._pending.keys()):
+                if self._pending[key].cancel():
+                    del self._pending[key]
+
+    def shutdown(self):
+        """
+        Cancel the pending prefetches, and shut down the prefetch workers.
+        """
+
+        with self._prefetch_lock:
+            executor = self._prefetch_executor
+            self._prefetch_executor = None
+            self._pending = {}
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def _set_pulse_data(self):
         if self.pulse is None:
             self._pulse_data = None
             return
 
-        if self._pulse_display == 'RFSignal':
-            times, frequencies, data = _rf_signal(self.base_reader, self.index, self.pulse)
-        else:
-            raise ValueError(
-                'Got unhandled pulse display value `{}`'.format(self.pulse_display))
-
+        times, frequencies, data = self.get_spectrogram(self.pulse)
         self._times = times
         self._frequencies = frequencies
         self._data_size = data.shape
@@ -332,7 +543,8 @@ class STFTCanvasImageReader(CRSDTypeCanvasImageReader):
         numpy.ndarray
         """
 
-        return self._chippers[self.index].__getitem__((slice(start_row, end_row), slice(start_col, end_col)))
+        with self._read_lock:
+            return self._chippers[self.index].__getitem__((slice(start_row, end_row), slice(start_col, end_col)))
 
 
 ###########
@@ -354,9 +566,18 @@ class AppVariables(object):
         docstring='Are we currently looping through pulses?')  # type: bool
     animation_delay = IntegerDescriptor(
         'animation_delay', default_value=30, docstring='Animation delay in milliseconds')  # type: int
+    prefetch_count = IntegerDescriptor(
+        'prefetch_count', default_value=8,
+        docstring='The number of pulses to prefetch in the stepping direction.')  # type: int
     vmin = FloatDescriptor('vmin', default_value=0)  # type: float
     vmax = FloatDescriptor('vmax', default_value=0)  # type: float
-    vcount = IntegerDescriptor('vcount', default_value=0)  # type: int
+    channel_levels = BooleanDescriptor(
+        'channel_levels', default_value=False,
+        docstring='Are vmin and vmax set from the sampled levels of the whole channel, '
+                  'rather than the current pulse?')  # type: bool
+    level_sample_count = IntegerDescriptor(
+        'level_sample_count', default_value=64,
+        docstring='The number of pulses sampled for the channel display levels.')  # type: int
 
 
 class SliderWidget(Frame):
@@ -468,13 +689,30 @@ class PulseExplorer(Frame, WidgetWithMetadata):
         self.root = primary
         self.variables = AppVariables()
         self.pulse_profile = None
+        self._profile_cache = PulseProfileCache()
+        self._profile_cancel = None  # type: Optional[threading.Event]
+        self._profile_progress = 0.
+        self._profile_progress_id = None
+        self._levels_cache = SpectrogramLevelsCache()
+        self._levels_cancel = None  # type: Optional[threading.Event]
+        self._analysis_cancel = None  # type: Optional[threading.Event]
+        self._analysis_status = None  # type: Optional[str]
+        self._analysis_progress = 0.
+        self._analysis_progress_id = None
+        self.waterfall = None  # type: Optional[dict]
+        self._waterfall_popup = None  # type: Optional[tkinter.Toplevel]
+        self.suspects = None  # type: Optional[List[dict]]
+        self._suspects_popup = None  # type: Optional[tkinter.Toplevel]
 
         Frame.__init__(self, primary, **kwargs)
         WidgetWithMetadata.__init__(self, primary)
+        self._profile_worker = BackgroundWorker(self, poll_interval=100, name='sarpy_apps_profile')
+        self._levels_worker = BackgroundWorker(self, poll_interval=100, name='sarpy_apps_levels')
+        self._analysis_worker = BackgroundWorker(self, poll_interval=100, name='sarpy_apps_analysis')
 
         self.pulse_profile_plot = PlotPopup(primary)  # type: PlotPopup
         self.pulse_profile_plot.plot_window.set_xlabel('Pulse Number')
-        self.pulse_profile_plot.plot_window.set_ylabel('Average Power')
+        self.pulse_profile_plot.plot_window.set_ylabel('Power')
         self.pulse_profile_plot.plot_window.clear()
 
         self.pyplot_panel = PyplotImagePanel(self, navigation=True)  # type: PyplotImagePanel
@@ -522,10 +760,27 @@ class PulseExplorer(Frame, WidgetWithMetadata):
         self.metadata_menu.add_command(label="Metaviewer", command=self.metaviewer_popup)
         self.metadata_menu.add_separator()
         self.metadata_menu.add_command(label="View Time Profile", command=self.detail_popup_callback)
+        self.metadata_menu.add_command(label="Cancel Time Profile", command=self.cancel_pulse_profile)
+        # channel analysis menu
+        self.analysis_menu = tkinter.Menu(self.menu_bar, tearoff=0)
+        self.analysis_menu.add_command(
+            label="Waterfall (Max Power)", command=lambda: self.calculate_waterfall('max'))
+        self.analysis_menu.add_command(
+            label="Waterfall (Mean Power)", command=lambda: self.calculate_waterfall('mean'))
+        self.analysis_menu.add_separator()
+        self.analysis_menu.add_command(
+            label="Export Spectrogram Datacube", command=self.callback_export_spectrogram_datacube)
+        self.analysis_menu.add_separator()
+        self.analysis_menu.add_command(label="Scan Pulses for Anomalies", command=self.calculate_anomaly_scan)
+        self.analysis_menu.add_command(
+            label="Open Anomaly Scan Results", command=self.callback_open_anomaly_results)
+        self.analysis_menu.add_separator()
+        self.analysis_menu.add_command(label="Cancel Analysis", command=self.cancel_analysis)
 
         # ensure menus cascade
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
         self.menu_bar.add_cascade(label="Metadata", menu=self.metadata_menu)
+        self.menu_bar.add_cascade(label="Analysis", menu=self.analysis_menu)
 
         self.root.config(menu=self.menu_bar)
 
@@ -542,42 +797,431 @@ class PulseExplorer(Frame, WidgetWithMetadata):
         self.dir_buttons.button_next.config(command=self.pulse_step_next)
         self.dir_buttons.button_fwd.config(command=self.pulse_animate_forward)
 
+    def _pulse_profile_title(self, status=None):
+        file_name = self.variables.image_reader.file_name
+        file_name_stem = '' if file_name is None else os.path.split(file_name)[1]
+        the_title = 'Pulse Profile - Channel `{}`\n{}'.format(
+            self.variables.image_reader.channel_id, file_name_stem)
+        if status is not None:
+            the_title += ' ({})'.format(status)
+        return the_title
+
     def calculate_pulse_profile(self):
-        pulse_count = self.variables.image_reader.pulse_count
-        avg_pulse_power = numpy.zeros((pulse_count, ), dtype='float64')
+        """
+        Fetch the pulse power profile for the current channel from the cache,
+        or start calculating it in the background.
+        """
+
+        image_reader = self.variables.image_reader
+        base_reader = image_reader.base_reader
+        index = image_reader.index
+        profile = self._profile_cache.get(base_reader, index)
+        if profile is not None:
+            self.pulse_profile = profile
+            self.plot_pulse_profile()
+            return
+
+        if self._profile_cancel is not None:
+            return  # it's already in progress
+
+        cancel_event = threading.Event()
+        self._profile_cancel = cancel_event
+        self._profile_progress = 0.
+
+        def set_progress(fraction):
+            # NB: this is called on the worker thread, and only sets a value
+            self._profile_progress = fraction
+
+        def calculate():
+            the_profile = pulse_power_profile(
+                base_reader, index, progress_callback=set_progress, cancel_event=cancel_event,
+                read_lock=image_reader.read_lock)
+            if the_profile is not None:
+                self._profile_cache.put(base_reader, index, the_profile)
+            return the_profile
+
+        def finished(the_profile):
+            self._finish_profile_progress()
+            if the_profile is None:
+                return
+            self.pulse_profile = the_profile
+            self.plot_pulse_profile()
+
+        def failed(exception):
+            self._finish_profile_progress()
+            logger.error('Calculating the pulse profile failed', exc_info=exception)
+            showinfo('Pulse profile failed', message='Calculating the pulse profile failed:\n{}'.format(exception))
+
+        self._profile_worker.submit(calculate, callback=finished, error_callback=failed)
+        self._update_profile_progress()
+
+    def _update_profile_progress(self):
+        self._profile_progress_id = None
+        if self._profile_cancel is None:
+            return
+        plot_window = self.pulse_profile_plot.plot_window
+        plot_window.set_title(self._pulse_profile_title(
+            'calculating, {:0.0f}% complete'.format(100*self._profile_progress)))
+        plot_window.draw()
+        self._profile_progress_id = self.after(250, self._update_profile_progress)
+
+    def _finish_profile_progress(self):
+        self._profile_cancel = None
+        if self._profile_progress_id is not None:
+            self.after_cancel(self._profile_progress_id)
+            self._profile_progress_id = None
+
+    def cancel_pulse_profile(self):
+        """
+        Cancel any pulse profile calculation in progress.
+        """
+
+        if self._profile_cancel is None:
+            return
+        self._profile_cancel.set()
+        self._profile_worker.invalidate()
+        self._finish_profile_progress()
+        if self.variables.image_reader is not None:
+            self.pulse_profile_plot.plot_window.set_title(self._pulse_profile_title('cancelled'))
+            self.pulse_profile_plot.plot_window.draw()
 
-        chunk_size = 200
-        start_chunk = 0
+    def plot_pulse_profile(self):
+        """
+        Plot the pulse power profile, with the mean power, the percentiles, and
+        the range between the minimum and maximum power.
+        """
 
-        while start_chunk < pulse_count:
-            end_chunk = min(start_chunk + chunk_size, pulse_count)
-            pulses = self.variables.image_reader.get_raw_pulse(start_chunk, end_chunk)
-            pulse_power = pulses.real * pulses.real + pulses.imag * pulses.imag
-            avg_pulse_power[start_chunk:end_chunk] = numpy.mean(pulse_power, axis=1)
-            start_chunk = end_chunk
-        self.pulse_profile = avg_pulse_power
+        profile = self.pulse_profile
+        plot_window = self.pulse_profile_plot.plot_window
+        plot_window.set_title(self._pulse_profile_title())
+        plot_window.clear()
+        if profile is None:
+            return
+        pulses = numpy.arange(profile['mean'].size)
+        plot_window.ax.fill_between(pulses, profile['min'], profile['max'], color='0.85', label='min - max')
+        for level, values in zip(profile['percentile_levels'], profile['percentiles'].T):
+            plot_window.ax.plot(pulses, values, lw=0.8, label='{:g} percentile'.format(level))
+        plot_window.ax.plot(pulses, profile['mean'], 'r', label='mean')
+        plot_window.ax.legend(loc='upper right')
+        plot_window.draw()
 
     def detail_popup_callback(self):
-        if self.pulse_profile is not None:
-            self.pulse_profile_plot.set_focus_on_popup()
-        else:
-            file_name_stem = os.path.split(self.variables.image_reader.file_name)[1]
-            self.pulse_profile_plot.plot_window.set_title(
-                'Pulse Profile - Channel `{}`\n{}'.format(
-                    self.variables.image_reader.channel_id, file_name_stem))
-            self.calculate_pulse_profile()
+        if self.variables.image_reader is None:
+            return
+        if self.pulse_profile is None:
+            self.pulse_profile_plot.plot_window.set_title(self._pulse_profile_title())
             self.pulse_profile_plot.plot_window.clear()
-            self.pulse_profile_plot.plot_window.ax.plot(self.pulse_profile, 'r')
-            self.pulse_profile_plot.plot_window.draw()
-            self.pulse_profile_plot.set_focus_on_popup()
+            self.calculate_pulse_profile()
+        self.pulse_profile_plot.set_focus_on_popup()
 
     def clear_pulse_profile(self):
+        self.cancel_pulse_profile()
         self.pulse_profile = None
         self.pulse_profile_plot.withdraw()
 
-    def set_title(self):
+    def _start_analysis(self, status, function, callback):
+        """
+        Start the channel analysis on the background worker, showing its progress
+        in the window title. Any analysis in progress is cancelled.
+
+        Parameters
+        ----------
+        status : str
+            The analysis description for the window title.
+        function : Callable
+            Called on the worker thread with the progress callback and the
+            cancel event as arguments.
+        callback : Callable
+            Called on the main thread with the result.
+        """
+
+        self.cancel_analysis()
+        cancel_event = threading.Event()
+        self._analysis_cancel = cancel_event
+        self._analysis_status = status
+        self._analysis_progress = 0.
+
+        def set_progress(fraction):
+            # NB: this is called on the worker thread, and only sets a value
+            self._analysis_progress = fraction
+
+        def finished(result):
+            self._finish_analysis_progress()
+            callback(result)
+
+        def failed(exception):
+            self._finish_analysis_progress()
+            logger.error('The {} failed'.format(status), exc_info=exception)
+            showinfo('Analysis failed', message='The {} failed:\n{}'.format(status, exception))
+
+        self._analysis_worker.submit(
+            function, set_progress, cancel_event, callback=finished, error_callback=failed)
+        self._update_analysis_progress()
+
+    def _update_analysis_progress(self):
+        self._analysis_progress_id = None
+        if self._analysis_cancel is None:
+            return
+        self.set_title('{}, {:0.0f}% complete'.format(self._analysis_status, 100*self._analysis_progress))
+        self._analysis_progress_id = self.after(250, self._update_analysis_progress)
+
+    def _finish_analysis_progress(self):
+        self._analysis_cancel = None
+        self._analysis_status = None
+        if self._analysis_progress_id is not None:
+            self.after_cancel(self._analysis_progress_id)
+            self._analysis_progress_id = None
+        self.set_title()
+
+    def cancel_analysis(self):
+        """
+        Cancel any channel analysis in progress.
+        """
+
+        if self._analysis_cancel is None:
+            return
+        self._analysis_cancel.set()
+        self._analysis_worker.invalidate()
+        self._finish_analysis_progress()
+
+    def calculate_waterfall(self, reduction='max'):
+        """
+        Calculate the pulse waterfall for the current channel in the background,
+        and display it once complete.
+
+        Parameters
+        ----------
+        reduction : str
+            The reduction of each spectrogram over time, `'max'` or `'mean'`.
+        """
+
+        image_reader = self.variables.image_reader
+        if image_reader is None:
+            return
+        base_reader = image_reader.base_reader
+        index = image_reader.index
+
+        def calculate(progress_callback, cancel_event):
+            return pulse_waterfall(
+                base_reader, index, reduction=reduction, pvp_cache=image_reader.pvp_cache,
+                progress_callback=progress_callback, cancel_event=cancel_event,
+                read_lock=image_reader.read_lock)
+
+        def finished(the_waterfall):
+            if the_waterfall is not None:
+                self.show_waterfall(the_waterfall)
+
+        self._start_analysis('calculating the {} power waterfall'.format(reduction), calculate, finished)
+
+    def show_waterfall(self, the_waterfall):
+        """
+        Display the pulse waterfall for the current channel in a popup. Double
+        clicking selects the pulse.
+
+        Parameters
+        ----------
+        the_waterfall : dict
+            As from :func:`pulse_waterfall`.
+        """
+
+        self.clear_waterfall()
+        self.waterfall = the_waterfall
+        frequencies = the_waterfall['frequencies']
+
+        popup = tkinter.Toplevel(self.root)
+        popup.wm_title('Pulse Waterfall ({} power) - Channel `{}`, {:0.4f} to {:0.4f} GHz'.format(
+            the_waterfall['reduction'], self.variables.image_reader.channel_id,
+            1e-9*frequencies[0], 1e-9*frequencies[-1]))
+        image_panel = ImagePanel(popup)  # type: ImagePanel
+        image_panel.pack(expand=tkinter.TRUE, fill=tkinter.BOTH)
+        image_panel.hide_shapes()
+        image_panel.set_image_reader(WaterfallCanvasImageReader(the_waterfall['data']))
+
+        def select_pulse(event):
+            canvas = image_panel.canvas
+            image_coords = canvas.variables.canvas_image_object.canvas_coords_to_full_image_yx(
+                (canvas.canvasx(event.x), canvas.canvasy(event.y)))
+            pulse_count = self.variables.image_reader.pulse_count
+            self.variables.animating = False
+            self.set_pulse(min(max(0, int(image_coords[0])), pulse_count - 1))
+
+        image_panel.canvas.bind('<Double-Button-1>', select_pulse)
+        popup.protocol('WM_DELETE_WINDOW', self.clear_waterfall)
+        self._waterfall_popup = popup
+
+    def clear_waterfall(self):
+        """
+        Close any waterfall popup, and release its scratch file.
+        """
+
+        if self._waterfall_popup is not None:
+            self._waterfall_popup.destroy()
+            self._waterfall_popup = None
+        if self.waterfall is not None:
+            file_name = self.waterfall['file_name']
+            self.waterfall = None
+            get_scratch_space().release(file_name)
+
+    def callback_export_spectrogram_datacube(self):
+        """
+        Export the spectrograms of all pulses of the current channel as a float32
+        datacube with json sidecar, in the background.
+        """
+
+        image_reader = self.variables.image_reader
+        if image_reader is None:
+            return
+
+        filename = asksaveasfilename(
+            initialdir=self.variables.browse_directory, title="Select file",
+            filetypes=(("numpy datacube", "*.npy"), ("raw memmap", "*.dat"), ("all files", "*.*")))
+        if filename is None or filename in ['', ()]:
+            return
+
+        base_reader = image_reader.base_reader
+        index = image_reader.index
+
+        def calculate(progress_callback, cancel_event):
+            return export_spectrogram_datacube(
+                base_reader, index, filename, pvp_cache=image_reader.pvp_cache,
+                progress_callback=progress_callback, cancel_event=cancel_event,
+                read_lock=image_reader.read_lock)
+
+        def finished(sidecar):
+            if sidecar is not None:
+                logger.info('Wrote spectrogram datacube of shape {} to {}'.format(sidecar['shape'], filename))
+
+        self._start_analysis('exporting the spectrogram datacube', calculate, finished)
+
+    def calculate_anomaly_scan(self):
+        """
+        Scan all pulses of all channels of the current file for anomalies in the
+        background, using a process pool, and display the suspect pulses.
+        """
+
+        image_reader = self.variables.image_reader
+        if image_reader is None:
+            return
+        file_name = image_reader.file_name
+        if file_name is None:
+            showinfo('Anomaly scan', message='The anomaly scan requires a reader for a file.')
+            return
+
+        def calculate(progress_callback, cancel_event):
+            # NB: spawn, so that the worker processes do not inherit the display
+            results = scan_anomalies(
+                [file_name, ], mp_context=multiprocessing.get_context('spawn'),
+                progress_callback=progress_callback, cancel_event=cancel_event)
+            if results is None:
+                return None
+            if results[0]['status'] != 'success':
+                raise ValueError(results[0]['message'])
+            return ranked_suspects(results)
+
+        def finished(suspects):
+            if suspects is not None:
+                self.show_suspects(suspects)
+
+        self._start_analysis('scanning the pulses for anomalies', calculate, finished)
+
+    def callback_open_anomaly_results(self):
+        """
+        Open the results of an anomaly scan, and display the suspect pulses for
+        the current file.
+        """
+
+        if self.variables.image_reader is None:
+            return
+
+        fname = askopenfilename(
+            initialdir=self.variables.browse_directory, filetypes=[json_files, csv_files, all_files])
+        if fname is None or fname in ['', ()]:
+            return
+        try:
+            suspects = load_anomaly_results(fname)
+        except (OSError, ValueError, KeyError) as e:
+            showinfo('Anomaly scan results', message='Failed reading {}:\n{}'.format(fname, e))
+            return
+        self.show_suspects(suspects)
+
+    def show_suspects(self, suspects):
+        """
+        Display the suspect pulses for the current file in a popup, ranked by
+        decreasing score. Selecting a suspect displays that pulse.
+
+        Parameters
+        ----------
+        suspects : List[dict]
+            As from :func:`ranked_suspects`.
+        """
+
+        the_file = self.variables.image_reader.file_name
+        if the_file is not None:
+            suspects = [
+                entry for entry in suspects
+                if os.path.abspath(entry['file_name']) == os.path.abspath(the_file) or
+                os.path.basename(entry['file_name']) == os.path.basename(the_file)]
+        self.clear_suspects()
+        self.suspects = suspects
+
+        popup = tkinter.Toplevel(self.root)
+        popup.wm_title('Suspect Pulses - {} found'.format(len(suspects)))
+        scrollbar = tkinter.Scrollbar(popup, orient=tkinter.VERTICAL)
+        listbox = tkinter.Listbox(popup, width=80, height=20, yscrollcommand=scrollbar.set)
+        scrollbar.config(command=listbox.yview)
+        scrollbar.pack(side=tkinter.RIGHT, fill=tkinter.Y)
+        listbox.pack(side=tkinter.LEFT, expand=tkinter.TRUE, fill=tkinter.BOTH)
+        for rank, entry in enumerate(suspects):
+            listbox.insert(
+                tkinter.END, '{}. channel `{}`, pulse {}: score {:0.1f} ({})'.format(
+                    rank + 1, entry['channel'], entry['pulse'], entry['score'], entry['metric']))
+
+        # noinspection PyUnusedLocal
+        def select_suspect(event):
+            selection = listbox.curselection()
+            if len(selection) > 0:
+                self.select_suspect(suspects[selection[0]])
+
+        listbox.bind('<<ListboxSelect>>', select_suspect)
+        popup.protocol('WM_DELETE_WINDOW', self.clear_suspects)
+        self._suspects_popup = popup
+
+    def select_suspect(self, suspect):
+        """
+        Display the pulse of the given suspect, changing the channel if necessary.
+
+        Parameters
+        ----------
+        suspect : dict
+        """
+
+        image_reader = self.variables.image_reader
+        if image_reader is None:
+            return
+        self.variables.animating = False
+        if suspect['index'] != image_reader.index:
+            self.slider.cbx_channel.current(suspect['index'])
+            self.handle_image_index_changed(None)
+        self.set_pulse(suspect['pulse'])
+
+    def clear_suspects(self):
+        """
+        Close any suspect pulses popup.
+        """
+
+        if self._suspects_popup is not None:
+            self._suspects_popup.destroy()
+            self._suspects_popup = None
+        self.suspects = None
+
+    def set_title(self, status=None):
         """
         Sets the window title.
+
+        Parameters
+        ----------
+        status : None|str
+            The status of any analysis in progress.
         """
 
         file_name = None if self.variables.image_reader is None \
@@ -587,6 +1231,8 @@ class PulseExplorer(Frame, WidgetWithMetadata):
         else:
             the_title = "Pulse Explorer for {}".format(
                 os.path.split(file_name)[1])
+        if status is not None:
+            the_title += ' ({})'.format(status)
         self.winfo_toplevel().title(the_title)
 
     def set_pulse(self, value, override=False):
@@ -613,26 +1259,98 @@ class PulseExplorer(Frame, WidgetWithMetadata):
             return
 
         self.variables.image_reader.pulse = value
-        if self.variables.vcount == 0:
-            self.variables.vmin = numpy.min(self.variables.image_reader.pulse_data[:, :])
-            self.variables.vmax = numpy.max(self.variables.image_reader.pulse_data[:, :])
-        elif self.variables.vcount < 5:
-            self.variables.vmin = min(self.variables.vmin, numpy.min(self.variables.image_reader.pulse_data[:, :]))
-            self.variables.vmax = max(self.variables.vmax, numpy.max(self.variables.image_reader.pulse_data[:, :]))
-        if self.variables.vmin != self.variables.vmax:
-            self.variables.vcount += 1
+        if not self.variables.channel_levels:
+            self._set_pulse_levels()
 
         self.slider.entry_pulse.set_text(str(value))
         self.slider.var_pulse_number.set(value)
         self.display_in_pyplot_frame()
 
     def exit(self):
+        self.cancel_pulse_profile()
+        self._profile_worker.shutdown()
+        self.cancel_display_levels()
+        self._levels_worker.shutdown()
+        self.cancel_analysis()
+        self._analysis_worker.shutdown()
+        self.clear_waterfall()
+        self.clear_suspects()
+        if self.variables.image_reader is not None:
+            self.variables.image_reader.shutdown()
         self.root.destroy()
 
     def _refresh_vdata(self):
+        self.cancel_display_levels()
         self.variables.vmin = 0
         self.variables.vmax = 0
-        self.variables.vcount = 0
+        self.variables.channel_levels = False
+
+    def _set_levels(self, levels):
+        # the levels are in decibels, and the displayed spectrogram is power
+        self.variables.vmin = float(10**(0.1*levels[0]))
+        self.variables.vmax = float(10**(0.1*levels[-1]))
+
+    def _set_pulse_levels(self):
+        """
+        Sets the display levels from the current pulse, until the channel
+        levels are available.
+        """
+
+        pulse_data = self.variables.image_reader.pulse_data
+        if pulse_data is not None:
+            self._set_levels(robust_levels(pulse_data[:, :]))
+
+    def calculate_display_levels(self):
+        """
+        Fetch the display levels for the current channel from the cache, or
+        start calculating them from a sample of the pulses in the background.
+        """
+
+        image_reader = self.variables.image_reader
+        base_reader = image_reader.base_reader
+        index = image_reader.index
+        sample_count = self.variables.level_sample_count
+        levels = self._levels_cache.get(base_reader, index, sample_count=sample_count)
+        if levels is not None:
+            self._set_levels(levels['levels'])
+            self.variables.channel_levels = True
+            return
+
+        cancel_event = threading.Event()
+        self._levels_cancel = cancel_event
+
+        def calculate():
+            the_levels = spectrogram_levels(
+                base_reader, index, sample_count=sample_count, pvp_cache=image_reader.pvp_cache,
+                cancel_event=cancel_event, read_lock=image_reader.read_lock)
+            if the_levels is not None:
+                self._levels_cache.put(base_reader, index, the_levels)
+            return the_levels
+
+        def finished(the_levels):
+            self._levels_cancel = None
+            if the_levels is None:
+                return
+            self._set_levels(the_levels['levels'])
+            self.variables.channel_levels = True
+            if image_reader.pulse_data is not None:
+                self.display_in_pyplot_frame()
+
+        def failed(exception):
+            self._levels_cancel = None
+            logger.error('Calculating the channel display levels failed', exc_info=exception)
+
+        self._levels_worker.submit(calculate, callback=finished, error_callback=failed)
+
+    def cancel_display_levels(self):
+        """
+        Cancel any display levels calculation in progress.
+        """
+
+        if self._levels_cancel is not None:
+            self._levels_cancel.set()
+            self._levels_cancel = None
+        self._levels_worker.invalidate()
 
     # noinspection PyUnusedLocal
     def handle_remap_change(self, event):
@@ -657,12 +1375,15 @@ class PulseExplorer(Frame, WidgetWithMetadata):
         """
 
         self.clear_pulse_profile()
+        self.cancel_analysis()
+        self.clear_waterfall()
         if self.variables.image_reader is None:
             return
 
         self._refresh_vdata()
         self.variables.animating = False
         self.variables.image_reader.index = self.slider.cbx_channel.current()
+        self.calculate_display_levels()
         self.populate_metaicon_from_reader(self.variables.image_reader)
         self.slider.cbx_channel.selection_clear()
         # Update number of pulses
@@ -701,6 +1422,7 @@ class PulseExplorer(Frame, WidgetWithMetadata):
         elif new_pulse >= self.variables.image_reader.pulse_count:
             new_pulse -= self.variables.image_reader.pulse_count
         self.set_pulse(new_pulse)
+        self.variables.image_reader.prefetch(direction, count=self.variables.prefetch_count)
 
     def pulse_step_prev(self):
         if self.variables.animating:
@@ -747,6 +1469,9 @@ class PulseExplorer(Frame, WidgetWithMetadata):
         """
 
         self.clear_pulse_profile()
+        self.cancel_analysis()
+        self.clear_waterfall()
+        self.clear_suspects()
         if the_reader is None:
             return
 
@@ -766,7 +1491,12 @@ class PulseExplorer(Frame, WidgetWithMetadata):
 
         self._refresh_vdata()
         self.variables.animating = False
+        if self.variables.image_reader is not None and self.variables.image_reader is not the_reader:
+            self.variables.image_reader.shutdown()
         self.variables.image_reader = the_reader
+        self.calculate_display_levels()
+        if not self.variables.channel_levels:
+            self._set_pulse_levels()
         self.display_in_pyplot_frame()
         self.set_title()
         self.populate_metaicon_from_reader(self.variables.image_reader)
@@ -793,7 +1523,7 @@ class PulseExplorer(Frame, WidgetWithMetadata):
         frequencies = 1e-9*self.variables.image_reader.frequencies
         image_data = self.variables.image_reader.pulse_data[:, :]
         image_data = image_data[::-1, :]
-        if self.variables.vcount > 0:
+        if self.variables.vmin != self.variables.vmax:
             self.pyplot_panel.update_image(
                 image_data, aspect='auto', vmin=self.variables.vmin, vmax=self.variables.vmax,
                 extent=[times[0], times[-1], frequencies[0], frequencies[-1]])
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a headless export of the sub-aperture datacube for a region
+of a SICD type image, with the frames defined as for the aperture tool animation.
+
+This is intended to be used from the command line, like
+
+.. code-block:: bash
+
+    python -m sarpy_apps.apps.subaperture_export <input file> <output.npy> --rows 0 1024 --cols 0 1024
+
+No display is required. The datacube is written in the npy format for a `.npy`
+output file name, and as a raw memmap otherwise, with a json sidecar file
+describing the frame aperture bounds and resolutions.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import logging
+
+from sarpy_apps.supporting_classes.subaperture import ANIMATION_MODES, export_datacube
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Export the sub-aperture datacube for a region of a SICD type file.",
+        formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        'input', metavar='input',
+        help='The path to the image file.')
+    parser.add_argument(
+        'output', metavar='output',
+        help='The output datacube file, in the npy format if the extension is .npy,\n'
+             'and a raw memmap otherwise. The json sidecar is written alongside.')
+    parser.add_argument(
+        '--rows', nargs=2, type=int, required=True, metavar=('START', 'END'),
+        help='The region row bounds.')
+    parser.add_argument(
+        '--cols', nargs=2, type=int, required=True, metavar=('START', 'END'),
+        help='The region column bounds.')
+    parser.add_argument(
+        '-m', '--mode', default='slow_time', choices=ANIMATION_MODES,
+        help='The sub-aperture mode.')
+    parser.add_argument(
+        '-n', '--frames', default=7, type=int,
+        help='The number of sub-aperture frames.')
+    parser.add_argument(
+        '-f', '--fraction', default=0.25, type=float,
+        help='The aperture fraction for the slow_time and fast_time modes.')
+    parser.add_argument(
+        '--min-percent', default=10., type=float,
+        help='The final aperture percent for the other modes.')
+    parser.add_argument(
+        '--max-percent', default=100., type=float,
+        help='The initial aperture percent for the other modes.')
+    parser.add_argument(
+        '-i', '--index', default=0, type=int,
+        help='The image index.')
+    parser.add_argument(
+        '-d', '--dimension', default=None, type=int, choices=[0, 1],
+        help='The deskew dimension, determined from the DeltaKCOAPoly by default.')
+    parser.add_argument(
+        '--no-deskew', action='store_true',
+        help='Do not apply the deskew.')
+    parser.add_argument(
+        '--deweighting', default=None, choices=['on', 'off'],
+        help='Apply the deweighting, by default if the weight functions are populated.')
+    parser.add_argument(
+        '-a', '--amplitude', action='store_true',
+        help='Write float32 amplitude, instead of complex64 values.')
+    parser.add_argument(
+        '--memory', default=1024, type=float,
+        help='The memory budget for the frames in progress, in MB.')
+    parser.add_argument(
+        '-w', '--workers', default=None, type=int,
+        help='The number of worker threads, all available cores by default.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO')
+    sidecar = export_datacube(
+        args.input, args.rows, args.cols, args.output, mode=args.mode, n_frames=args.frames,
+        aperture_fraction=args.fraction, min_aperture_percent=0.01*args.min_percent,
+        max_aperture_percent=0.01*args.max_percent, index=args.index, dimension=args.dimension,
+        apply_deskew=not args.no_deskew,
+        apply_deweighting=None if args.deweighting is None else args.deweighting == 'on',
+        amplitude=args.amplitude, memory_budget=int(args.memory*2**20), workers=args.workers,
+        progress_callback=lambda fraction: logger.info('{:0.0f}% complete'.format(100*fraction)))
+    logger.info('Wrote datacube of shape {} to {}'.format(sidecar['shape'], args.output))
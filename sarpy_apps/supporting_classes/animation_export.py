@@ -0,0 +1,309 @@
+"""
+Streaming writers for exporting animation frames, which write each frame as it
+is provided, so that only a single frame is held in memory.
+
+The supported formats are animated GIF, lossless animated PNG (APNG), and a
+sequence of numbered PNG files.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import logging
+import os
+import struct
+import zlib
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy
+import PIL.Image
+from PIL import GifImagePlugin
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('gif', 'apng', 'png')
+_EXTENSIONS = {'.gif': 'gif', '.apng': 'apng', '.png': 'png'}
+
+
+def export_format_from_name(file_name):
+    """
+    Determine the export format from the file extension. The `.gif` extension
+    is animated GIF, `.apng` is animated PNG, and `.png` is a PNG sequence.
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    None|str
+        One of `EXPORT_FORMATS`, or `None` if the extension is not recognized.
+    """
+
+    return _EXTENSIONS.get(os.path.splitext(file_name)[1].lower(), None)
+
+
+def _as_uint8(frame):
+    # type: (numpy.ndarray) -> numpy.ndarray
+    frame = numpy.asarray(frame)
+    if frame.ndim != 2:
+        raise ValueError('Frames must be two-dimensional, got shape {}'.format(frame.shape))
+    if frame.dtype.name != 'uint8':
+        frame = numpy.clip(frame, 0, 255).astype('uint8')
+    return numpy.ascontiguousarray(frame)
+
+
+class _FrameWriter(object):
+    """
+    Base class for the streaming frame writers.
+    """
+
+    def __init__(self, file_name):
+        self._file_name = file_name
+        self._frame_count = 0
+        self._shape = None  # type: Optional[Tuple[int, int]]
+
+    @property
+    def file_name(self):
+        # type: () -> str
+        """
+        str: The output file name.
+        """
+
+        return self._file_name
+
+    @property
+    def frame_count(self):
+        # type: () -> int
+        """
+        int: The number of frames written.
+        """
+
+        return self._frame_count
+
+    def write(self, frame):
+        """
+        Write the next frame.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            The two-dimensional frame, which will be clipped to uint8 if necessary.
+        """
+
+        frame = _as_uint8(frame)
+        if self._shape is None:
+            self._shape = frame.shape
+        elif frame.shape != self._shape:
+            raise ValueError(
+                'All frames must have the same shape, expected {} and got {}'.format(self._shape, frame.shape))
+        self._write_frame(frame)
+        self._frame_count += 1
+
+    def _write_frame(self, frame):
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Finish writing.
+        """
+
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+
+class GIFWriter(_FrameWriter):
+    """
+    Streaming animated GIF writer, for grayscale frames.
+    """
+
+    def __init__(self, file_name, fps=15, loop=True):
+        """
+
+        Parameters
+        ----------
+        file_name : str
+        fps : float
+        loop : bool
+            Should the animation be looped?
+        """
+
+        _FrameWriter.__init__(self, file_name)
+        self._duration = int(round(1000./fps))
+        self._loop = loop
+        self._fid = open(file_name, 'wb')
+
+    def _write_frame(self, frame):
+        image = PIL.Image.fromarray(frame, mode='L')
+        if self._frame_count == 0:
+            info = {'optimize': False}
+            if self._loop:
+                info['loop'] = 0
+            header, _ = GifImagePlugin.getheader(image, info=info)
+            for entry in header:
+                self._fid.write(entry)
+        for entry in GifImagePlugin.getdata(image, duration=self._duration):
+            self._fid.write(entry)
+
+    def close(self):
+        if self._fid is None:
+            return
+        if self._frame_count > 0:
+            self._fid.write(b';')  # the trailer
+        self._fid.close()
+        self._fid = None
+
+
+def _png_chunk(chunk_type, data):
+    # type: (bytes, bytes) -> bytes
+    return struct.pack('>I', len(data)) + chunk_type + data + \
+        struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff)
+
+
+def _png_image_data(frame, compression_level):
+    # type: (numpy.ndarray, int) -> bytes
+    # each scan line is prefixed with the filter type, which is none (0) here
+    scan_lines = numpy.zeros((frame.shape[0], frame.shape[1] + 1), dtype='uint8')
+    scan_lines[:, 1:] = frame
+    return zlib.compress(scan_lines.tobytes(), compression_level)
+
+
+class APNGWriter(_FrameWriter):
+    """
+    Streaming lossless animated PNG writer, for grayscale frames. The number of
+    frames must be known in advance.
+    """
+
+    def __init__(self, file_name, frame_count, fps=15, loop=True, compression_level=6):
+        """
+
+        Parameters
+        ----------
+        file_name : str
+        frame_count : int
+            The number of frames which will be written.
+        fps : float
+        loop : bool
+            Should the animation be looped?
+        compression_level : int
+            The zlib compression level.
+        """
+
+        _FrameWriter.__init__(self, file_name)
+        self._expected_count = int(frame_count)
+        if self._expected_count < 1:
+            raise ValueError('frame_count must be positive, got {}'.format(frame_count))
+        # the frame delay fraction, as numerator and denominator
+        self._delay = (1000, max(1, int(round(1000*fps))))
+        self._loop = loop
+        self._compression_level = int(compression_level)
+        self._sequence_number = 0
+        self._fid = open(file_name, 'wb')
+
+    def _write_frame(self, frame):
+        if self._frame_count >= self._expected_count:
+            raise ValueError('Expected only {} frames'.format(self._expected_count))
+        rows, cols = frame.shape
+        if self._frame_count == 0:
+            self._fid.write(b'\x89PNG\r\n\x1a\n')
+            # 8 bit grayscale
+            self._fid.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', cols, rows, 8, 0, 0, 0, 0)))
+            self._fid.write(_png_chunk(b'acTL', struct.pack('>II', self._expected_count, 0 if self._loop else 1)))
+        self._fid.write(_png_chunk(b'fcTL', struct.pack(
+            '>IIIIIHHBB', self._sequence_number, cols, rows, 0, 0, self._delay[0], self._delay[1], 0, 0)))
+        self._sequence_number += 1
+        data = _png_image_data(frame, self._compression_level)
+        if self._frame_count == 0:
+            self._fid.write(_png_chunk(b'IDAT', data))
+        else:
+            self._fid.write(_png_chunk(b'fdAT', struct.pack('>I', self._sequence_number) + data))
+            self._sequence_number += 1
+
+    def close(self):
+        if self._fid is None:
+            return
+        if self._frame_count != self._expected_count:
+            logger.warning(
+                'Animated png {} declares {} frames, but {} were written'.format(
+                    self._file_name, self._expected_count, self._frame_count))
+        if self._frame_count > 0:
+            self._fid.write(_png_chunk(b'IEND', b''))
+        self._fid.close()
+        self._fid = None
+
+
+class PNGSequenceWriter(_FrameWriter):
+    """
+    Writes each frame as a numbered PNG file. The frame for index `i` of
+    `path/name.png` is written to `path/name_{i:04d}.png`.
+    """
+
+    def _write_frame(self, frame):
+        PIL.Image.fromarray(frame, mode='L').save(self.frame_file_name(self._frame_count))
+
+    def frame_file_name(self, index):
+        """
+        Gets the file name for the given frame index.
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        str
+        """
+
+        stem = os.path.splitext(self._file_name)[0]
+        return '{}_{:04d}.png'.format(stem, index)
+
+
+def export_animation(frames, file_name, frame_count, fps=15, loop=True, export_format=None,
+                     progress_callback=None):
+    """
+    Write the frames to the given file, one at a time.
+
+    Parameters
+    ----------
+    frames : Iterable[numpy.ndarray]
+        The frames, in display order.
+    file_name : str
+    frame_count : int
+        The number of frames.
+    fps : float
+    loop : bool
+        Should the animation be looped?
+    export_format : None|str
+        One of `EXPORT_FORMATS`. If `None`, this is determined from the file
+        extension, defaulting to `gif`.
+    progress_callback : None|Callable
+        Called with the fraction complete after each frame.
+
+    Returns
+    -------
+    int
+        The number of frames written.
+    """
+
+    if export_format is None:
+        export_format = export_format_from_name(file_name) or 'gif'
+    if export_format == 'gif':
+        writer = GIFWriter(file_name, fps=fps, loop=loop)
+    elif export_format == 'apng':
+        writer = APNGWriter(file_name, frame_count, fps=fps, loop=loop)
+    elif export_format == 'png':
+        writer = PNGSequenceWriter(file_name)
+    else:
+        raise ValueError('export_format must be one of {}, got {}'.format(EXPORT_FORMATS, export_format))
+
+    with writer:
+        for frame in frames:
+            writer.write(frame)
+            if progress_callback is not None:
+                progress_callback(float(writer.frame_count)/frame_count)
+    return writer.frame_count
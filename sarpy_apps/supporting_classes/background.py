@@ -0,0 +1,364 @@
+"""
+Helpers for performing expensive computations for a tkinter widget on a worker
+thread, and for pacing animations, without blocking the user interface.
+
+Tkinter is not thread safe, so the result of the computation is delivered
+to the main thread by polling using the widget `after` method. Only the most
+recent submission is of interest, so earlier pending submissions are cancelled,
+and the results of earlier running submissions are dropped.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import logging
+import time
+import tkinter
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker(object):
+    """
+    Runs the most recently submitted function on a worker thread, and delivers
+    its result to a callback on the main thread.
+    """
+
+    def __init__(self, widget, poll_interval=20, max_workers=1, name='sarpy_apps_background'):
+        """
+
+        Parameters
+        ----------
+        widget : tkinter.Misc
+            The widget whose `after` method is used for scheduling on the main thread.
+        poll_interval : int
+            The interval, in milliseconds, for checking whether the computation is complete.
+        max_workers : int
+            The number of worker threads.
+        name : str
+            The thread name prefix.
+        """
+
+        self._widget = widget
+        self._poll_interval = int(poll_interval)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._generation = 0
+        self._delay_id = None  # type: Optional[str]
+        self._poll_id = None  # type: Optional[str]
+        self._future = None  # type: Optional[Future]
+        self._callback = None  # type: Optional[Callable]
+        self._error_callback = None  # type: Optional[Callable]
+
+    @property
+    def generation(self):
+        # type: () -> int
+        """
+        int: The generation of the most recent submission. This is incremented
+        by each submission or invalidation.
+        """
+
+        return self._generation
+
+    @property
+    def busy(self):
+        # type: () -> bool
+        """
+        bool: Is there a current submission which has not yet been delivered?
+        """
+
+        return self._delay_id is not None or self._future is not None
+
+    def _cancel_after(self, after_id):
+        if after_id is None:
+            return
+        try:
+            self._widget.after_cancel(after_id)
+        except tkinter.TclError:
+            pass
+
+    def invalidate(self):
+        """
+        Invalidate any current submission, so that its result will not be delivered.
+
+        Returns
+        -------
+        int
+            The new generation.
+        """
+
+        self._generation += 1
+        self._cancel_after(self._delay_id)
+        self._delay_id = None
+        self._cancel_after(self._poll_id)
+        self._poll_id = None
+        if self._future is not None:
+            # this does nothing if it is already running, and the result is just dropped
+            self._future.cancel()
+            self._future = None
+        self._callback = None
+        self._error_callback = None
+        return self._generation
+
+    def submit(self, function, *args, prepare=None, callback=None, error_callback=None, delay=0):
+        """
+        Submit the function for evaluation on the worker thread, invalidating
+        any previous submission.
+
+        Parameters
+        ----------
+        function : Callable
+            The function to run on the worker thread. This must not touch any
+            tkinter elements.
+        args
+            The arguments for `function`.
+        prepare : None|Callable
+            If provided, this is called on the main thread (after any delay) and
+            its return value, a tuple, is used as the arguments for `function`. If
+            this returns `None`, then the submission is abandoned. This is the place
+            for fetching data from sources which may not be thread safe.
+        callback : None|Callable
+            Called on the main thread with the result of `function`, if the
+            submission is still current.
+        error_callback : None|Callable
+            Called on the main thread with the exception raised by `function`,
+            if the submission is still current. The exception is logged otherwise.
+        delay : int
+            The delay in milliseconds before starting, so that a rapid sequence of
+            submissions is coalesced to the final one.
+
+        Returns
+        -------
+        int
+            The generation of this submission.
+        """
+
+        generation = self.invalidate()
+        self._callback = callback
+        self._error_callback = error_callback
+
+        def start():
+            self._delay_id = None
+            if generation != self._generation:
+                return
+            the_args = args
+            if prepare is not None:
+                the_args = prepare()
+                if the_args is None:
+                    return
+            self._future = self._executor.submit(function, *the_args)
+            self._poll_id = self._widget.after(self._poll_interval, self._poll, generation)
+
+        if delay > 0:
+            self._delay_id = self._widget.after(int(delay), start)
+        else:
+            start()
+        return generation
+
+    def _poll(self, generation):
+        self._poll_id = None
+        if generation != self._generation or self._future is None:
+            return  # this has been superseded
+        if not self._future.done():
+            self._poll_id = self._widget.after(self._poll_interval, self._poll, generation)
+            return
+
+        future, callback, error_callback = self._future, self._callback, self._error_callback
+        self._future = None
+        self._callback = None
+        self._error_callback = None
+        exception = future.exception()
+        if exception is not None:
+            if error_callback is None:
+                logger.error('Background computation failed', exc_info=exception)
+            else:
+                error_callback(exception)
+        elif callback is not None:
+            callback(future.result())
+
+    def shutdown(self):
+        """
+        Invalidate any current submission and shut down the worker threads.
+        """
+
+        self.invalidate()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class FrameScheduler(object):
+    """
+    Displays a sequence of frames at a given frame rate, scheduled using the
+    widget `after` method, so that the user interface remains responsive.
+
+    Each frame is due at a fixed time after the start, so the pacing does not
+    drift. A frame which is not yet available is not waited for on the main
+    thread; the current frame is held (a stall) until it is available. When the
+    display falls behind by a full frame interval, overdue frames are skipped
+    (dropped) to catch up.
+    """
+
+    def __init__(self, widget, show_frame, is_ready=None, poll_interval=10):
+        """
+
+        Parameters
+        ----------
+        widget : tkinter.Misc
+            The widget whose `after` method is used for scheduling.
+        show_frame : Callable
+            Called with the frame index to display the frame.
+        is_ready : None|Callable
+            Called with the frame index to determine whether the frame can be
+            displayed without waiting.
+        poll_interval : int
+            The interval, in milliseconds, for checking whether a stalled frame
+            is available.
+        """
+
+        self._widget = widget
+        self._show_frame = show_frame
+        self._is_ready = is_ready
+        self._poll_interval = int(poll_interval)
+        self._after_id = None  # type: Optional[str]
+        self._indices = ()
+        self._position = 0
+        self._interval = 0.
+        self._due_time = 0.
+        self._cycle = False
+        self._stalled = False
+        self._finished_callback = None  # type: Optional[Callable]
+        self._shown_count = 0
+        self._dropped_count = 0
+        self._stall_count = 0
+
+    @property
+    def running(self):
+        # type: () -> bool
+        """
+        bool: Is an animation in progress?
+        """
+
+        return self._after_id is not None
+
+    @property
+    def shown_count(self):
+        # type: () -> int
+        """
+        int: The number of frames displayed in the current (or last) animation.
+        """
+
+        return self._shown_count
+
+    @property
+    def dropped_count(self):
+        # type: () -> int
+        """
+        int: The number of frames skipped to catch up in the current (or last) animation.
+        """
+
+        return self._dropped_count
+
+    @property
+    def stall_count(self):
+        # type: () -> int
+        """
+        int: The number of frames which were not available when due in the current
+        (or last) animation.
+        """
+
+        return self._stall_count
+
+    def _frame_ready(self, index):
+        return self._is_ready is None or self._is_ready(index)
+
+    def start(self, indices, fps, cycle=False, finished_callback=None):
+        """
+        Start the animation, stopping any animation in progress.
+
+        Parameters
+        ----------
+        indices : Sequence[int]
+            The frame indices, in display order.
+        fps : float
+            The frame rate.
+        cycle : bool
+            Repeat the sequence until stopped?
+        finished_callback : None|Callable
+            Called without arguments when the animation is finished or stopped.
+        """
+
+        if fps <= 0:
+            raise ValueError('fps must be positive, got {}'.format(fps))
+        self.stop()
+        self._indices = tuple(indices)
+        if len(self._indices) == 0:
+            if finished_callback is not None:
+                finished_callback()
+            return
+        self._position = 0
+        self._interval = 1./float(fps)
+        self._cycle = cycle
+        self._stalled = False
+        self._finished_callback = finished_callback
+        self._shown_count = 0
+        self._dropped_count = 0
+        self._stall_count = 0
+        self._due_time = time.perf_counter()
+        self._after_id = self._widget.after_idle(self._tick)
+
+    def stop(self):
+        """
+        Stop any animation in progress.
+        """
+
+        if self._after_id is None:
+            return
+        try:
+            self._widget.after_cancel(self._after_id)
+        except tkinter.TclError:
+            pass
+        self._finish()
+
+    def _finish(self):
+        self._after_id = None
+        logger.debug(
+            'Animation finished with {} frames shown, {} dropped, and {} stalled'.format(
+                self._shown_count, self._dropped_count, self._stall_count))
+        callback = self._finished_callback
+        self._finished_callback = None
+        if callback is not None:
+            callback()
+
+    def _tick(self):
+        self._after_id = None
+        if self._position >= len(self._indices):
+            if not self._cycle:
+                self._finish()
+                return
+            self._position = 0
+
+        now = time.perf_counter()
+        if not self._frame_ready(self._indices[self._position]):
+            if not self._stalled:
+                self._stalled = True
+                self._stall_count += 1
+            self._after_id = self._widget.after(self._poll_interval, self._tick)
+            return
+        if self._stalled:
+            # resume the pacing from now
+            self._stalled = False
+            self._due_time = now
+
+        # skip the overdue frames, provided that the following frame is available
+        while now - self._due_time >= self._interval and self._position + 1 < len(self._indices) and \
+                self._frame_ready(self._indices[self._position + 1]):
+            self._position += 1
+            self._dropped_count += 1
+            self._due_time += self._interval
+
+        self._show_frame(self._indices[self._position])
+        self._shown_count += 1
+        self._position += 1
+        self._due_time += self._interval
+        delay = max(0, int(round(1000*(self._due_time - time.perf_counter()))))
+        self._after_id = self._widget.after(delay, self._tick)
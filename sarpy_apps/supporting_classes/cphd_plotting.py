@@ -5,21 +5,28 @@ Utilities for plotting CPHD metadata
 __classification__ = "UNCLASSIFIED"
 __author__ = "Valkyrie Systems Corporation"
 
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import functools
 import itertools
+import os
 import pathlib
+import threading
 import tkinter
 from tkinter import messagebox
 from tkinter import ttk
 
 import matplotlib.backends.backend_tkagg as mpl_tk
 import matplotlib.figure as mpl_fig
-import matplotlib.mlab as mpl_mlab
 import matplotlib.pyplot as plt
 import numpy as np
 import plotly.colors
 import plotly.graph_objects as go
 
+from sarpy_apps.supporting_classes.background import BackgroundWorker
+from sarpy_apps.supporting_classes.crsd_pulses import file_identity
+
 
 def plot_image_area(reader):
     """
@@ -234,12 +241,546 @@ def _vdot(vec1, vec2, axis=-1, keepdims=False):
     return (np.asarray(vec1) * np.asarray(vec2)).sum(axis=axis, keepdims=keepdims)
 
 
+class VectorCache:
+    """
+    Byte-bounded least recently used cache of per-vector arrays, computing any missing contiguous runs of vectors
+    together
+    """
+    def __init__(self, compute, max_bytes=256 * 2**20, dtype=None):
+        """
+        Args
+        ----
+        compute: callable
+            Called as ``compute(start, stop)`` for a contiguous range of vectors, returning a tuple of arrays, each
+            with the vectors along the first axis
+        max_bytes: int
+            The approximate maximum size of the cached per-vector arrays
+        dtype: None or dtype
+            The dtype of the cached arrays, or None to keep the computed dtype
+        """
+        self._compute = compute
+        self._max_bytes = int(max_bytes)
+        self._dtype = dtype
+        self._values = collections.OrderedDict()
+        self._size_bytes = 0
+
+    def clear(self):
+        """Drop the cached arrays"""
+        self._values.clear()
+        self._size_bytes = 0
+
+    def fetch(self, vectors):
+        """
+        Get the per-vector arrays for each vector
+
+        Returns
+        -------
+        list of tuple of array-like
+        """
+        vectors = list(vectors)
+        missing = [v for v in vectors if v not in self._values]
+        for _, run in itertools.groupby(enumerate(missing), key=lambda x: x[1] - x[0]):
+            run = [v for _, v in run]
+            computed = self._compute(run[0], run[-1] + 1)
+            for offset, vector in enumerate(run):
+                value = tuple(np.array(array[offset], dtype=self._dtype) for array in computed)
+                self._values[vector] = value
+                self._size_bytes += sum(array.nbytes for array in value)
+        values = []
+        for vector in vectors:
+            self._values.move_to_end(vector)
+            values.append(self._values[vector])
+        # evict, but never the vectors just requested
+        while self._size_bytes > self._max_bytes and len(self._values) > len(vectors):
+            _, value = self._values.popitem(last=False)
+            self._size_bytes -= sum(array.nbytes for array in value)
+        return values
+
+
+class VectorWindowSums:
+    """
+    Running sums of per-vector arrays (e.g. the power of each vector) over a sliding window of vectors.
+
+    The per-vector arrays are held in a `VectorCache`, so revisiting a vector costs nothing, and moving the window
+    by one vector adds one vector to, and drops one vector from, the sums.
+    """
+    def __init__(self, compute, max_bytes=256 * 2**20, resync_interval=1024):
+        """
+        Args
+        ----
+        compute: callable
+            Called as ``compute(start, stop)`` for a contiguous range of vectors, returning a tuple of arrays, each
+            with the vectors along the first axis
+        max_bytes: int
+            The approximate maximum size of the cached per-vector arrays
+        resync_interval: int
+            The number of incremental updates after which the sums are recalculated, bounding any accumulated
+            floating point error
+        """
+        self._values = VectorCache(compute, max_bytes=max_bytes, dtype=np.float64)
+        self._resync_interval = int(resync_interval)
+        self._window = None
+        self._sums = None
+        self._update_count = 0
+
+    def clear(self):
+        """Drop the cached arrays and sums"""
+        self._values.clear()
+        self._window = None
+        self._sums = None
+
+    def _fetch(self, vectors):
+        return self._values.fetch(vectors)
+
+    def _accumulate(self, sums, vectors, sign):
+        for value in self._fetch(vectors):
+            for total, array in zip(sums, value):
+                if sign > 0:
+                    total += array
+                else:
+                    total -= array
+
+    def sums(self, start, stop):
+        """
+        Get the sums of the per-vector arrays over the vectors ``start <= v < stop``
+
+        Returns
+        -------
+        list of array-like
+        """
+        start, stop = int(start), int(stop)
+        if self._window is not None:
+            old_start, old_stop = self._window
+            added = [*range(start, min(stop, old_start)), *range(max(start, old_stop), stop)]
+            dropped = [*range(old_start, min(old_stop, start)), *range(max(old_start, stop), old_stop)]
+            incremental = (old_start < stop and start < old_stop
+                           and len(added) + len(dropped) < stop - start
+                           and self._update_count < self._resync_interval)
+        else:
+            incremental = False
+
+        if incremental:
+            self._accumulate(self._sums, added, 1)
+            self._accumulate(self._sums, dropped, -1)
+            self._update_count += 1
+        else:
+            values = self._fetch(range(start, stop))
+            self._sums = [np.sum([value[i] for value in values], axis=0) for i in range(len(values[0]))]
+            self._update_count = 0
+        self._window = (start, stop)
+        return [total.copy() for total in self._sums]
+
+
+def _grid_edges(count, bins):
+    """The first index of each of ``min(bins, count)`` near equal bins, followed by ``count``"""
+    bins = max(1, min(int(bins), count))
+    return -((-np.arange(bins + 1) * count) // bins)
+
+
+def _pool_block(power, row_starts, col_starts):
+    """Max and sum pool a block of power onto the grid cells it covers"""
+    maxima = np.maximum.reduceat(np.maximum.reduceat(power, col_starts, axis=1), row_starts, axis=0)
+    sums = np.add.reduceat(np.add.reduceat(power, col_starts, axis=1, dtype=np.float64), row_starts, axis=0)
+    return maxima, sums
+
+
+def _block_power_summary(signal_chunk, conjugate, row_starts, col_starts):
+    """Pool the domain and spectral powers of a block of vectors, as (domain pools, spectral pools)"""
+    power = signal_chunk.real * signal_chunk.real + signal_chunk.imag * signal_chunk.imag
+    domain_pools = _pool_block(power, row_starts, col_starts)
+    del power
+    if conjugate:
+        signal_chunk = np.conj(signal_chunk)
+    spectral_chunk = np.fft.fftshift(np.fft.fft(signal_chunk, axis=-1), axes=-1)
+    spectral_power = spectral_chunk.real * spectral_chunk.real + spectral_chunk.imag * spectral_chunk.imag
+    spectral_power /= signal_chunk.shape[-1]
+    return domain_pools, _pool_block(spectral_power, row_starts, col_starts)
+
+
+def _to_db(power):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (10 * np.log10(np.where(power > 0, power, np.nan))).astype(np.float32)
+
+
+def channel_power_summary(cphd_reader, channel_id, vector_bins=1024, sample_bins=1024, block_bytes=16 * 2**20,
+                          workers=None, progress_callback=None, cancel_event=None, read_lock=None):
+    """
+    Summarize the power of every vector of a channel as decimated vector by sample images.
+
+    The vectors are read in blocks, and the power in the domain and (using the transform of the whole vector, as
+    in the vector power plot) the spectral domain of each block is max and mean pooled onto a grid of at most
+    ``vector_bins`` by ``sample_bins`` on a thread pool. The memory used is bounded by the block size and the grid,
+    regardless of the number of vectors.
+
+    Args
+    ----
+    cphd_reader: `sarpy.io.phase_history.base.CPHDTypeReader`
+        The reader
+    channel_id: str
+        The channel identifier
+    vector_bins: int
+        The maximum number of grid rows
+    sample_bins: int
+        The maximum number of grid columns
+    block_bytes: int
+        The approximate size of each block of vectors
+    workers: int or None
+        The number of worker threads, the number of cores by default
+    progress_callback: callable or None
+        Called with the fraction complete after each block is read
+    cancel_event: `threading.Event` or None
+        The calculation is abandoned when this is set
+    read_lock: `threading.Lock` or None
+        If provided, this is held while reading, for when the reader is shared with other threads
+
+    Returns
+    -------
+    dict or None
+        None if cancelled. Otherwise with the 'channel', the 'vector_edges' and 'sample_edges' (the first vector and
+        sample of each grid row and column, followed by the vector and sample counts) and, for each of the domain and
+        spectral domain (e.g. 'FX' and 'TOA'), a dict of the 'max' and 'mean' power in dB with shape (rows, columns)
+    """
+    channel_data = {x.Identifier: x for x in cphd_reader.cphd_meta.Data.Channels}[channel_id]
+    num_vectors = channel_data.NumVectors
+    num_samples = channel_data.NumSamples
+    domain = cphd_reader.cphd_meta.Global.DomainType
+    spectral_domain = 'TOA' if domain == 'FX' else 'FX'
+    conjugate = cphd_reader.cphd_meta.Global.SGN == -1
+
+    vector_edges = _grid_edges(num_vectors, vector_bins)
+    sample_edges = _grid_edges(num_samples, sample_bins)
+    grid_shape = (vector_edges.size - 1, sample_edges.size - 1)
+    maxima = {name: np.zeros(grid_shape, dtype=np.float32) for name in (domain, spectral_domain)}
+    sums = {name: np.zeros(grid_shape, dtype=np.float64) for name in (domain, spectral_domain)}
+
+    block_size = max(1, int(block_bytes) // (8 * num_samples))
+    starts = list(range(0, num_vectors, block_size))
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    def store(future, rows):
+        for name, (block_maxima, block_sums) in zip((domain, spectral_domain), future.result()):
+            # each grid row is covered by contiguous vectors, so appears at most once per block
+            np.maximum(maxima[name][rows], block_maxima, out=block_maxima)
+            maxima[name][rows] = block_maxima
+            sums[name][rows] += block_sums
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sarpy_apps_power_summary') as executor:
+        for count, start in enumerate(starts):
+            if cancelled():
+                for future, _ in pending:
+                    future.cancel()
+                return None
+            stop = min(start + block_size, num_vectors)
+            block_rows = np.searchsorted(vector_edges, np.arange(start, stop), side='right') - 1
+            rows, row_starts = np.unique(block_rows, return_index=True)
+            with read_lock or contextlib.nullcontext():
+                signal_chunk = cphd_reader.read(slice(start, stop), slice(None, num_samples),
+                                                index=channel_id, squeeze=False)
+            pending.append((executor.submit(_block_power_summary, signal_chunk, conjugate,
+                                            row_starts, sample_edges[:-1]), rows))
+            del signal_chunk
+            while len(pending) > 2 * workers:
+                store(*pending.pop(0))
+            if progress_callback is not None:
+                progress_callback((count + 1) / len(starts))
+        for entry in pending:
+            store(*entry)
+
+    cell_counts = np.outer(np.diff(vector_edges), np.diff(sample_edges))
+    summary = {'channel': channel_id, 'vector_edges': vector_edges, 'sample_edges': sample_edges}
+    for name in (domain, spectral_domain):
+        summary[name] = {'max': _to_db(maxima[name]), 'mean': _to_db(sums[name] / cell_counts)}
+    return summary
+
+
+class ChannelPowerSummaryCache:
+    """
+    A least recently used cache of the channel power summaries, keyed by the file identity, channel and grid size
+    """
+    def __init__(self, max_entries=16):
+        self._max_entries = int(max_entries)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(cphd_reader, channel_id, vector_bins, sample_bins):
+        identity = file_identity(cphd_reader.file_name)
+        if identity is None:
+            return None
+        return (*identity, channel_id, int(vector_bins), int(sample_bins))
+
+    def get(self, cphd_reader, channel_id, vector_bins, sample_bins):
+        """Get the cached summary from :func:`channel_power_summary`, or None"""
+        key = self._key(cphd_reader, channel_id, vector_bins, sample_bins)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, cphd_reader, vector_bins, sample_bins, summary):
+        """Cache the summary from :func:`channel_power_summary` for the given grid size"""
+        key = self._key(cphd_reader, summary['channel'], vector_bins, sample_bins)
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+POWER_SUMMARY_CACHE = ChannelPowerSummaryCache()
+
+
+@functools.lru_cache(maxsize=32)
+def _tfr_window(nfft, name):
+    """The cached window (None for no window) and the power scale, as ``plt.specgram`` with scale_by_freq=False"""
+    if name == 'none':
+        return None, 1 / nfft**2
+    if name == 'hann':
+        window = np.hanning(nfft).astype(np.float32)
+        window.flags.writeable = False
+        return window, 1 / float(window.sum())**2
+    raise ValueError(f'Unknown window {name}')
+
+
+class VectorTFR:
+    """
+    Log power time-frequency representations of CPHD vectors, computed into reused buffers.
+
+    The result matches ``np.log10`` of the spectrum from ``plt.specgram`` (two-sided, centered frequencies, with
+    scale_by_freq=False), using strided framing views of the vectors and a single transform per block of vectors.
+    """
+    def __init__(self, window='none', block_bytes=16 * 2**20):
+        """
+        Args
+        ----
+        window: str
+            The segment window, 'none' or 'hann'
+        block_bytes: int
+            The approximate size of the segments transformed together
+        """
+        self.window = window
+        self.block_bytes = int(block_bytes)
+        self._buffers = {}
+
+    def _buffer(self, name, shape, dtype):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    @staticmethod
+    def num_segments(num_samples, nfft, noverlap):
+        """The number of segments of a vector, which is zero padded to at least nfft samples"""
+        return (max(num_samples, nfft) - nfft) // (nfft - noverlap) + 1
+
+    @classmethod
+    def axes(cls, num_samples, nfft, noverlap, scss):
+        """
+        The centered frequencies and the segment centers, as from ``plt.specgram`` with Fs=1/scss
+
+        Returns
+        -------
+        tuple of array-like
+        """
+        frequencies = np.fft.fftshift(np.fft.fftfreq(nfft, scss))
+        centers = (nfft / 2 + np.arange(cls.num_segments(num_samples, nfft, noverlap)) * (nfft - noverlap)) * scss
+        return frequencies, centers
+
+    def compute(self, signals, nfft, noverlap, conjugate=False, out=None):
+        """
+        Compute the log power time-frequency representation of one or more vectors
+
+        Args
+        ----
+        signals: array-like
+            A vector of shape (num_samples,), or vectors of shape (num_vectors, num_samples)
+        nfft: int
+            The number of samples in each segment
+        noverlap: int
+            The number of samples of overlap between segments
+        conjugate: bool
+            Conjugate the signals first, as for SGN=-1
+        out: array-like or None
+            float32 of shape (nfft, num segments), or (num_vectors, nfft, num segments) for several vectors. By
+            default, an internal buffer which is reused by the next call, so copy the result to keep it
+
+        Returns
+        -------
+        array-like
+            The log10 power with the frequencies along the first (or second for several vectors) axis
+        """
+        nfft, noverlap = int(nfft), int(noverlap)
+        if not 0 <= noverlap < nfft:
+            raise ValueError(f'noverlap must be in [0, {nfft}), got {noverlap}')
+        step = nfft - noverlap
+        signals = np.asarray(signals)
+        single = signals.ndim == 1
+        signals = signals.reshape(-1, signals.shape[-1])
+        num_vectors, num_samples = signals.shape
+        if num_samples < nfft:
+            padded = np.zeros((num_vectors, nfft), dtype=np.complex64)
+            padded[:, :num_samples] = signals
+            signals, num_samples = padded, nfft
+        num_segments = self.num_segments(num_samples, nfft, noverlap)
+
+        if out is None:
+            out = self._buffer('out', (num_vectors, nfft, num_segments), np.float32)
+        out_vectors = out.reshape(num_vectors, nfft, num_segments)
+        window, scale = _tfr_window(nfft, self.window)
+        block = max(1, min(num_vectors, self.block_bytes // (8 * nfft * num_segments)))
+        center = (nfft + 1) // 2
+
+        for start in range(0, num_vectors, block):
+            stop = min(start + block, num_vectors)
+            frames = np.lib.stride_tricks.sliding_window_view(signals[start:stop], nfft, axis=-1)[:, ::step]
+            if conjugate or window is not None:
+                work = self._buffer('frames', (block, num_segments, nfft), np.complex64)[:stop - start]
+                if conjugate:
+                    np.conjugate(frames, out=work)
+                else:
+                    np.copyto(work, frames)
+                if window is not None:
+                    work *= window
+                frames = work
+            spectrum = np.fft.fft(frames, axis=-1)
+            power = self._buffer('power', (block, num_segments, nfft), np.float32)[:stop - start]
+            np.abs(spectrum, out=power)
+            del spectrum
+            np.square(power, out=power)
+            # center the frequencies, and put them before the segments
+            dest = out_vectors[start:stop]
+            dest[:, :nfft - center] = power[:, :, center:].transpose(0, 2, 1)
+            dest[:, nfft - center:] = power[:, :, :center].transpose(0, 2, 1)
+
+        out *= scale
+        with np.errstate(divide='ignore'):
+            np.log10(out, out=out)
+        return out_vectors[0] if single else out_vectors
+
+    def vector_range(self, cphd_reader, channel_id, start, stop, nfft, noverlap, block_size=64, read_lock=None):
+        """
+        Compute the time-frequency representations of the vectors ``start <= v < stop``, for export or a sweep
+
+        The vectors are read and transformed ``block_size`` at a time, holding ``read_lock`` (if provided) while
+        reading. The yielded arrays are views of a buffer which is reused for the next block, so copy them to keep
+        them.
+
+        Yields
+        ------
+        tuple
+            The vector index and its log10 power, as from :meth:`compute`
+        """
+        num_samples = {x.Identifier: x for x in cphd_reader.cphd_meta.Data.Channels}[channel_id].NumSamples
+        conjugate = cphd_reader.cphd_meta.Global.SGN == -1
+        for block_start in range(int(start), int(stop), int(block_size)):
+            block_stop = min(block_start + int(block_size), int(stop))
+            with read_lock or contextlib.nullcontext():
+                signal_chunk = cphd_reader.read(slice(block_start, block_stop), slice(None, num_samples),
+                                                index=channel_id, squeeze=False)
+            tfrs = self.compute(signal_chunk, nfft, noverlap, conjugate=conjugate)
+            for offset, tfr in enumerate(tfrs):
+                yield block_start + offset, tfr
+
+
+class BlitManager:
+    """
+    Redraw only the animated artists of a figure over a cached background, see the matplotlib blitting tutorial.
+
+    A full draw of the canvas (e.g. after a resize, zoom or pan) refreshes the background.
+    """
+    def __init__(self, canvas, artists=()):
+        """
+        Args
+        ----
+        canvas: `matplotlib.backend_bases.FigureCanvasBase`
+            The canvas, which must support blitting
+        artists: iterable of `matplotlib.artist.Artist`
+            The artists which change, drawn in this order
+        """
+        self.canvas = canvas
+        self._background = None
+        self._artists = []
+        for artist in artists:
+            self.add_artist(artist)
+        self._draw_cid = canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add_artist(self, artist):
+        """Manage the given artist, which is excluded from full draws of the background"""
+        artist.set_animated(True)
+        self._artists.append(artist)
+
+    def _on_draw(self, event):
+        # the animated artists are drawn with the event renderer, so that they also appear in saved figures
+        if event.canvas is self.canvas:
+            self._background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        for artist in self._artists:
+            artist.draw(event.renderer)
+
+    def update(self):
+        """Redraw the animated artists over the background, which requires a full draw the first time"""
+        if self._background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        for artist in self._artists:
+            self.canvas.figure.draw_artist(artist)
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
+def _settled(old, new, transform=None, min_fill=0.5):
+    """
+    The autoscaled (low, high) limits with hysteresis, so that scrubbing through similar data keeps the limits steady.
+
+    The limits grow to the union of the old and new limits, unless the new limits fill less than min_fill of the
+    union (after the transform, e.g. of a log scale), when they are reset to the new limits.
+    """
+    if old is None:
+        return new
+    transform = transform or np.asarray
+    old_low, old_high = sorted(np.asarray(transform(np.asarray(old, dtype=float)), dtype=float))
+    new_low, new_high = sorted(np.asarray(transform(np.asarray(new, dtype=float)), dtype=float))
+    if not np.all(np.isfinite([old_low, old_high, new_low, new_high])):
+        return new
+    if new_high - new_low < min_fill * (max(old_high, new_high) - min(old_low, new_low)):
+        return new
+    if old_low <= new_low and new_high <= old_high:
+        return old
+    # the transform is monotonic, so the union is the same before the transform
+    low, high = min(*old, *new), max(*old, *new)
+    return (low, high) if new[0] <= new[1] else (high, low)
+
+
+def _settle_axes_limits(ax, limits):
+    """Settle the autoscaled limits of the axes against the previous (xlim, ylim), returning whether they changed"""
+    xlim = _settled(limits[0], ax.get_xlim(), ax.xaxis.get_transform().transform)
+    ylim = _settled(limits[1], ax.get_ylim(), ax.yaxis.get_transform().transform)
+    if xlim != ax.get_xlim():
+        ax.set_xlim(xlim, auto=None)
+    if ylim != ax.get_ylim():
+        ax.set_ylim(ylim, auto=None)
+    return (ax.get_xlim(), ax.get_ylim()) != tuple(limits)
+
+
 class CphdVectorPower:
     """
     Create a tool to visualize a CPHD vector's power
+
+    With blit, the changing artists are redrawn over a cached background while scrubbing, and the legends and axes
+    are redrawn only when the channel or the axes limits change. The reader is read holding ``read_lock``, which is
+    shared with any other tools reading it on other threads.
     """
-    def __init__(self, root, cphd_reader):
+    def __init__(self, root, cphd_reader, blit=True, read_lock=None):
         self.cphd_reader = cphd_reader
+        self.read_lock = threading.Lock() if read_lock is None else read_lock
         cphd_domain = cphd_reader.cphd_meta.Global.DomainType
         if cphd_domain != 'FX':
             root.destroy()
@@ -298,6 +839,16 @@ class CphdVectorPower:
         root.rowconfigure(index=0, weight=1)
         root.wm_title("CPHD - Vector Power")
         self.canvas = mpl_tk.FigureCanvasTkAgg(fig, master=mainframe)  # A tk.DrawingArea.
+        self.blitter = None
+        if blit:
+            # the (hatched and costly) spans are only redrawn, in full, when their bounds change
+            noise_artists = [self.pn_ref_line, self.pn_ref_marker, self.sn_ref_line]
+            self.blitter = BlitManager(self.canvas, [*self.power_line.values(),
+                                                     *[x for x in noise_artists if x is not None],
+                                                     *[ax.title for ax in self.ax.values()]])
+        self._needs_full_draw = True
+        self._shown_limits = {}
+        self._shown_background = None
         self.canvas.draw()
 
         # pack_toolbar=False will make it easier to use a layout manager later on.
@@ -393,12 +944,61 @@ class CphdVectorPower:
             self.pn_ref_marker.set_label('_hidden_')
             self.sn_ref_line.set_label('_hidden_')
 
-        self.pvps = self.cphd_reader.read_pvp_array(index=channel_id)
+        with self.read_lock:
+            self.pvps = self.cphd_reader.read_pvp_array(index=channel_id)
+        self._reset_vector_powers(channel_id)
+        self._needs_full_draw = True
 
         self.selected_vector.set(0)
         self._update_slider(0)
         self.channel_select.selection_clear()
 
+    def _reset_vector_powers(self, channel_id):
+        """
+        Set up the caches of the given channel's vectors and their domain powers, which do not depend on the span,
+        and drop the spectral powers
+        """
+        num_samples = self.channel_datas[channel_id].NumSamples
+
+        def read(start, stop):
+            with self.read_lock:
+                return self.cphd_reader.read(slice(start, stop), slice(None, num_samples),
+                                             index=channel_id, squeeze=False),
+
+        def compute_domain_power(start, stop):
+            signal_chunk = np.stack([value[0] for value in self._vector_signals.fetch(range(start, stop))])
+            return (signal_chunk * np.conj(signal_chunk)).real,
+
+        self._vector_signals = VectorCache(read, max_bytes=128 * 2**20)
+        self._domain_powers = VectorWindowSums(compute_domain_power)
+        self._spectral_powers = collections.OrderedDict()
+
+    def _get_spectral_powers(self, span_start, fft_length, max_spans=4):
+        """
+        Get the sliding window sums of the per-vector spectral powers for the given span, keeping those of the most
+        recently used spans, since the span may vary from vector to vector
+        """
+        key = (span_start, fft_length)
+        if key in self._spectral_powers:
+            self._spectral_powers.move_to_end(key)
+            return self._spectral_powers[key]
+
+        conjugate = self.cphd_reader.cphd_meta.Global.SGN == -1
+
+        def compute(start, stop):
+            in_span_chunk = np.stack([value[0][span_start:span_start + fft_length]
+                                      for value in self._vector_signals.fetch(range(start, stop))])
+            if conjugate:
+                in_span_chunk = np.conj(in_span_chunk)
+            spectral_chunk = np.fft.fftshift(np.fft.fft(in_span_chunk, axis=-1), axes=-1)
+            spectral_chunk /= np.sqrt(max(fft_length, 1))
+            return (spectral_chunk * np.conj(spectral_chunk)).real,
+
+        self._spectral_powers[key] = VectorWindowSums(compute, max_bytes=64 * 2**20)
+        while len(self._spectral_powers) > max_spans:
+            self._spectral_powers.popitem(last=False)
+        return self._spectral_powers[key]
+
     def _update_slider(self, vector_index):
         this_channel_data = self.channel_datas[self.selected_channel.get()]
         self.vector_slider.configure(to=this_channel_data.NumVectors - 1)
@@ -407,14 +1007,42 @@ class CphdVectorPower:
         self.num_avg_samples_slider.set(1)
         self.num_adjacent_vec_slider.set(0)
 
+    def select_vector(self, vector_index, channel_id=None):
+        """
+        Show the given vector, after changing to the given channel if provided
+        """
+        if channel_id is not None and channel_id != self.selected_channel.get():
+            self.selected_channel.set(channel_id)
+            self._update_channel()
+        self.selected_vector.set(int(vector_index))
+
     def _autoscale(self, draw=False):
+        """Autoscale the axes if selected, returning whether the limits changed"""
+        changed = False
         if self.should_autoscale.get():
-            for ax in self.ax.values():
+            for name, ax in self.ax.items():
+                limits = self._shown_limits.get(name, (ax.get_xlim(), ax.get_ylim()))
                 ax.autoscale()
                 ax.relim()
                 ax.autoscale_view(True, True, True)
+                if self.blitter is not None and not draw:
+                    changed |= _settle_axes_limits(ax, limits)
+                else:
+                    changed |= (ax.get_xlim(), ax.get_ylim()) != limits
             if draw:
                 self.canvas.draw()
+        return changed
+
+    def _redraw(self, full, background=None):
+        """Draw the canvas in full, or blit if neither the axes limits nor the background state have changed"""
+        full = full or background != self._shown_background
+        self._shown_background = background
+        self._shown_limits = {name: (ax.get_xlim(), ax.get_ylim()) for name, ax in self.ax.items()}
+        if full or self.blitter is None:
+            # required to update canvas and attached toolbar!
+            self.canvas.draw_idle()
+        else:
+            self.blitter.update()
 
     def _update_plot(self, *args):
         vector_index = self.selected_vector.get()
@@ -423,31 +1051,31 @@ class CphdVectorPower:
         num_avg_samples = int(self.num_avg_samples_slider.get())
         num_vectors = self.channel_datas[channel_id].NumVectors
         num_samples = self.channel_datas[channel_id].NumSamples
-        signal_chunk = self.cphd_reader.read(slice(np.maximum(vector_index - num_avg_vectors, 0),
-                                                   np.minimum(vector_index + num_avg_vectors + 1, num_vectors)),
-                                             slice(None, num_samples//num_avg_samples * num_avg_samples),
-                                             index=channel_id, squeeze=False)
+        num_used_samples = num_samples//num_avg_samples * num_avg_samples
         domain = self.cphd_reader.cphd_meta.Global.DomainType
         spectral_domain = 'TOA' if domain == 'FX' else 'FX'
         scss = self.pvps['SCSS'][vector_index]
-        domain_samples = self.pvps['SC0'][vector_index] + np.arange(signal_chunk.shape[-1]) * scss
+        domain_samples = self.pvps['SC0'][vector_index] + np.arange(num_used_samples) * scss
 
-        cphd_power = (signal_chunk * np.conj(signal_chunk)).real
-        cphd_power_averaged = cphd_power.reshape(cphd_power.shape[0], -1, num_avg_samples).mean(axis=(2, 0))
+        # the in-span samples are contiguous, since the domain samples are monotonic
+        sc1, sc2 = [self.pvps[f'{domain}{n}'][vector_index] for n in (1, 2)]
+        in_span = np.flatnonzero((sc1 <= domain_samples) & (domain_samples <= sc2))
+        span_start = int(in_span[0]) if in_span.size else 0
+        fft_length = in_span.size//num_avg_samples * num_avg_samples
+
+        # the powers are averaged over the vectors using running sums over the sliding window of vectors, where
+        # the spectral powers of the vectors depend on the span of the selected vector
+        start = max(vector_index - num_avg_vectors, 0)
+        stop = min(vector_index + num_avg_vectors + 1, num_vectors)
+        power_sum, = self._domain_powers.sums(start, stop)
+        spectral_power_sum, = self._get_spectral_powers(span_start, fft_length).sums(start, stop)
+
+        cphd_power_averaged = power_sum[:num_used_samples].reshape(-1, num_avg_samples).mean(-1) / (stop - start)
         domain_averaged = domain_samples.reshape(-1, num_avg_samples).mean(-1)
         self.power_line[domain].set_data(domain_averaged, cphd_power_averaged)
 
-        sc1, sc2 = [self.pvps[f'{domain}{n}'][vector_index] for n in (1, 2)]
-        is_in_span = (sc1 <= domain_samples) & (domain_samples <= sc2)
-        in_span_chunk = signal_chunk[:, is_in_span]
-        in_span_chunk = in_span_chunk[:, :in_span_chunk.shape[-1]//num_avg_samples * num_avg_samples]
-        if self.cphd_reader.cphd_meta.Global.SGN == -1:
-            in_span_chunk = np.conj(in_span_chunk)
-        spectral_chunk = np.fft.fftshift(np.fft.fft(in_span_chunk, axis=-1), axes=-1)
-        spectral_chunk /= np.sqrt(spectral_chunk.shape[-1])
-        spectral_power = (spectral_chunk * np.conj(spectral_chunk)).real
-        spectral_power_averaged = spectral_power.reshape(spectral_power.shape[0], -1, num_avg_samples).mean(axis=(2, 0))
-        spectral_domain_samples = np.linspace(-1/(2*scss), 1/(2*scss), num=in_span_chunk.shape[-1], endpoint=False)
+        spectral_power_averaged = spectral_power_sum.reshape(-1, num_avg_samples).mean(-1) / (stop - start)
+        spectral_domain_samples = np.linspace(-1/(2*scss), 1/(2*scss), num=fft_length, endpoint=False)
         spectral_domain_averaged = spectral_domain_samples.reshape(-1, num_avg_samples).mean(-1)
 
         self.power_line[spectral_domain].set_data(spectral_domain_averaged, spectral_power_averaged)
@@ -461,14 +1089,16 @@ class CphdVectorPower:
             sn_ref_bw = self.bn_ref / scss * np.array([-1/2, 1/2])
             self.sn_ref_line.set_data(sn_ref_bw, self.sn_ref * np.ones_like(sn_ref_bw))
 
+        span_bounds = []
         for domain, span in self.span.items():
             vertices = span.get_xy()
             b1 = self.pvps[f'{domain}1'][vector_index]
             b2 = self.pvps[f'{domain}2'][vector_index]
             vertices[:, 0] = [b1, b1, b2, b2, b1]
             span.set_xy(vertices)
+            span_bounds.append((b1, b2))
 
-        self._autoscale()
+        limits_changed = self._autoscale()
 
         # update titles
         title_parts = [pathlib.Path(self.cphd_reader.file_name).name]
@@ -479,19 +1109,26 @@ class CphdVectorPower:
         if has_noise_params:
             self.ax['TOA'].set_title(f'BNRef={self.bn_ref}')
 
-        for ax in self.ax.values():
-            self._update_legend(ax)
-
-        # required to update canvas and attached toolbar!
-        self.canvas.draw_idle()
+        # the legends only change with the channel
+        full_draw = self._needs_full_draw or limits_changed
+        if self._needs_full_draw:
+            for ax in self.ax.values():
+                self._update_legend(ax)
+            self._needs_full_draw = False
+        self._redraw(full_draw, background=span_bounds)
 
 
 class CphdVectorTFR:
     """
     Create a tool to visualize a CPHD vector's time-frequency representation
+
+    With blit, the changing artists are redrawn over a cached background while scrubbing, and the axes and colorbar
+    are redrawn only when the channel, the axes limits or the color limits change. The reader is read holding
+    ``read_lock``, which is shared with any other tools reading it on other threads.
     """
-    def __init__(self, root, cphd_reader):
+    def __init__(self, root, cphd_reader, blit=True, read_lock=None):
         self.cphd_reader = cphd_reader
+        self.read_lock = threading.Lock() if read_lock is None else read_lock
         cphd_domain = cphd_reader.cphd_meta.Global.DomainType
         if cphd_domain != 'FX':
             root.destroy()
@@ -504,6 +1141,7 @@ class CphdVectorTFR:
         self.has_signal = cphd_reader.cphd_meta.PVP.SIGNAL is not None
         self.has_fxn = cphd_reader.cphd_meta.PVP.FXN1 is not None and cphd_reader.cphd_meta.PVP.FXN2 is not None
         self.has_toae = cphd_reader.cphd_meta.PVP.TOAE1 is not None and cphd_reader.cphd_meta.PVP.TOAE2 is not None
+        self.tfr = VectorTFR()
 
         # prepare figure
         with plt.style.context('dark_background'):
@@ -569,6 +1207,13 @@ class CphdVectorTFR:
         root.rowconfigure(index=0, weight=1)
         root.wm_title("CPHD - Vector Spectrogram")
         self.canvas = mpl_tk.FigureCanvasTkAgg(fig, master=mainframe)  # A tk.DrawingArea.
+        self.blitter = None
+        if blit:
+            # the PVP lines, labels and markers are only redrawn, in full, when their values change
+            self.blitter = BlitManager(self.canvas, [self.im, self.ax.title])
+        self._needs_full_draw = True
+        self._shown_limits = None
+        self._shown_background = None
         self.canvas.draw()
 
         # pack_toolbar=False will make it easier to use a layout manager later on.
@@ -649,7 +1294,9 @@ class CphdVectorTFR:
             if has_lfm_eclipse:
                 scatter.get_offsets().data[0, 0] = getattr(this_channel_parameters.TOAExtended.LFMEclipse, name)
 
-        self.pvps = self.cphd_reader.read_pvp_array(index=channel_id)
+        with self.read_lock:
+            self.pvps = self.cphd_reader.read_pvp_array(index=channel_id)
+        self._needs_full_draw = True
 
         self.selected_vector.set(0)
         self._update_slider(0)
@@ -670,20 +1317,48 @@ class CphdVectorTFR:
         self._update_plot()
 
     def _autoremap(self, draw=False):
+        """Autoscale the color limits if selected, returning whether they changed"""
+        changed = False
         if self.should_autoremap.get():
+            clim = self.im.get_clim()
             self.im.autoscale()
+            if self.blitter is not None and not draw:
+                settled = _settled(clim, self.im.get_clim())
+                if settled != self.im.get_clim():
+                    self.im.set_clim(settled)
+            changed = self.im.get_clim() != clim
             if draw:
                 self.canvas.draw_idle()
+        return changed
 
     def _autoscale(self, draw=False):
+        """Autoscale the axes if selected, returning whether the limits changed"""
+        changed = False
         if self.should_autoscale.get():
+            # setting the image extent has already changed the limits
+            limits = self._shown_limits or (self.ax.get_xlim(), self.ax.get_ylim())
             self.ax.relim(visible_only=False)
             self.ax.autoscale()
             self.ax.autoscale_view()
+            if self.blitter is not None and not draw:
+                changed = _settle_axes_limits(self.ax, limits)
+            else:
+                changed = (self.ax.get_xlim(), self.ax.get_ylim()) != limits
             if draw:
                 self.canvas.draw_idle()
         else:
             self.ax.autoscale(False)
+        return changed
+
+    def _redraw(self, full, background=None):
+        """Draw the canvas in full, or blit if neither the limits nor the background state have changed"""
+        full = full or background != self._shown_background
+        self._shown_background = background
+        self._shown_limits = (self.ax.get_xlim(), self.ax.get_ylim())
+        if full or self.blitter is None:
+            self.canvas.draw_idle()
+        else:
+            self.blitter.update()
 
     def _update_plot(self, *args):
         vector_index = self.selected_vector.get()
@@ -691,30 +1366,32 @@ class CphdVectorTFR:
         num_fft_samples = int(self.num_samples_slider.get())
         num_overlap = min(num_fft_samples - 1, int(self.num_overlap_slider.get()))
         num_samples = self.channel_datas[channel_id].NumSamples
-        signal_chunk = self.cphd_reader.read(slice(vector_index, vector_index+1),
-                                             slice(None, num_samples),
-                                             index=channel_id, squeeze=True)
+        with self.read_lock:
+            signal_chunk = self.cphd_reader.read(slice(vector_index, vector_index+1),
+                                                 slice(None, num_samples),
+                                                 index=channel_id, squeeze=True)
         scss = self.pvps['SCSS'][vector_index]
-        if self.cphd_reader.cphd_meta.Global.SGN == -1:
-            signal_chunk = np.conj(signal_chunk)
-
-        spec, freq, t, _ = plt.specgram(signal_chunk,
-                                         NFFT=num_fft_samples, noverlap=num_overlap,
-                                         Fs=1/scss, window=mpl_mlab.window_none,
-                                         scale_by_freq=False)
-        self.im.set_data(np.log10(spec))
+
+        # the image copies the data, so the engine buffer is free to be reused
+        log_spec = self.tfr.compute(signal_chunk, num_fft_samples, num_overlap,
+                                    conjugate=self.cphd_reader.cphd_meta.Global.SGN == -1)
+        freq, t = self.tfr.axes(signal_chunk.shape[-1], num_fft_samples, num_overlap, scss)
+        self.im.set_data(log_spec)
         self.im.set_extent([(t[0] + self.pvps['SC0'][vector_index]),
                             t[-1] + self.pvps['SC0'][vector_index],
                             freq[-1],
                             freq[0]])
 
+        pvp_values = []
         for param, obj in self.fx_objects.items():
             obj['line'].set_xdata(self.pvps[param][vector_index])
             obj['label'].set_x(self.pvps[param][vector_index])
+            pvp_values.append(self.pvps[param][vector_index])
 
         for param, obj in self.toa_objects.items():
             obj['line'].set_ydata(self.pvps[param][vector_index])
             obj['label'].set_y(self.pvps[param][vector_index])
+            pvp_values.append(self.pvps[param][vector_index])
 
         if self.has_toae:
             for name, scatter in self.lfm_eclipse_markers.items():
@@ -729,6 +1406,223 @@ class CphdVectorTFR:
         if self.has_signal:
             title_parts.append(f"SIGNAL[{vector_index}]={self.pvps['SIGNAL'][vector_index]}")
         self.ax.set_title('\n'.join(title_parts), pad=36)
-        self._autoremap()
-        self._autoscale()
-        self.canvas.draw_idle()
\ No newline at end of file
+        clim_changed = self._autoremap()
+        limits_changed = self._autoscale()
+        self._redraw(self._needs_full_draw or clim_changed or limits_changed, background=pvp_values)
+        self._needs_full_draw = False
+
+
+class CphdChannelPowerSummary:
+    """
+    Create a tool to visualize the power of every vector of a CPHD channel, linked to the vector power plot
+
+    The summary is calculated on a worker thread, holding ``read_lock`` while reading, which is shared with the linked
+    vector power plot and any other tools reading the reader.
+    """
+    def __init__(self, root, cphd_reader, vector_bins=1024, sample_bins=1024, cache=POWER_SUMMARY_CACHE,
+                 read_lock=None):
+        self.root = root
+        self.cphd_reader = cphd_reader
+        self.read_lock = threading.Lock() if read_lock is None else read_lock
+        cphd_domain = cphd_reader.cphd_meta.Global.DomainType
+        if cphd_domain != 'FX':
+            root.destroy()
+            raise NotImplementedError(f'{cphd_domain}-domain CPHDs have not been implemented yet. '
+                                      'Only FX-domain CPHDs are supported')
+        ref_ch_id = cphd_reader.cphd_meta.Channel.RefChId
+        self.channel_datas = {x.Identifier: x for x in cphd_reader.cphd_meta.Data.Channels}
+        assert ref_ch_id in self.channel_datas
+        self.domain = cphd_domain
+        self.spectral_domain = 'TOA' if cphd_domain == 'FX' else 'FX'
+        self.vector_bins = vector_bins
+        self.sample_bins = sample_bins
+        self.cache = cache
+        self.summary = None
+        self._worker = BackgroundWorker(root, poll_interval=100, name='sarpy_apps_power_summary')
+        self._cancel_event = None
+        self._progress = 0.
+        self._progress_id = None
+        self._vector_window = None
+        self._vector_tool = None
+
+        # prepare figure
+        fig = mpl_fig.Figure(figsize=(10, 7), dpi=100, layout='constrained')
+        self.ax = dict(zip((self.domain, self.spectral_domain), fig.subplots(1, 2, sharey=True)))
+        self.ax[self.domain].set_xlabel(f'{self.domain} sample')
+        self.ax[self.spectral_domain].set_xlabel(f'{self.spectral_domain} sample (centered)')
+        self.ax[self.domain].set_ylabel('vector')
+        self.im = {}
+        self.vector_line = {}
+        for name, ax in self.ax.items():
+            self.im[name] = ax.imshow(np.full((1, 1), np.nan, dtype=np.float32), aspect='auto',
+                                      interpolation='nearest', extent=(0, 1, 1, 0))
+            fig.colorbar(self.im[name], ax=ax, location='bottom', label='digital power [dB]')
+            self.vector_line[name] = ax.axhline(0, color='red', alpha=0.6, visible=False)
+
+        mainframe = ttk.Frame(root, padding="3 3 3 3")
+        mainframe.grid(column=0, row=0, sticky=tkinter.NSEW)
+        root.columnconfigure(index=0, weight=1)
+        root.rowconfigure(index=0, weight=1)
+        root.wm_title("CPHD - Channel Power Summary")
+        root.protocol("WM_DELETE_WINDOW", self.close)
+        self.canvas = mpl_tk.FigureCanvasTkAgg(fig, master=mainframe)  # A tk.DrawingArea.
+        self.canvas.mpl_connect('button_press_event', self._on_click)
+        self.canvas.draw()
+
+        # pack_toolbar=False will make it easier to use a layout manager later on.
+        toolbar = mpl_tk.NavigationToolbar2Tk(self.canvas, mainframe, pack_toolbar=False)
+        toolbar.update()
+
+        self.selected_channel = tkinter.StringVar(value=ref_ch_id)
+        self.channel_select = ttk.Combobox(master=mainframe,
+                                           textvariable=self.selected_channel,
+                                           values=list(self.channel_datas),
+                                           width=50,
+                                           state='readonly')
+        self.channel_select.bind('<<ComboboxSelected>>', self._update_channel)
+
+        self.selected_reduction = tkinter.StringVar(value='max')
+        reduction_select = ttk.Combobox(master=mainframe,
+                                        textvariable=self.selected_reduction,
+                                        values=['max', 'mean'],
+                                        width=8,
+                                        state='readonly')
+        reduction_select.bind('<<ComboboxSelected>>', self._update_images)
+
+        self.status = tkinter.StringVar(value='')
+        status_label = ttk.Label(mainframe, textvariable=self.status)
+        ttk.Label(mainframe, text='Double click a vector to show its power').grid(column=0, row=4, columnspan=3,
+                                                                                  sticky=tkinter.W)
+
+        toolbar.grid(column=0, row=0, columnspan=4, sticky=tkinter.NSEW)
+        self.canvas.get_tk_widget().grid(column=0, row=1, columnspan=4, sticky=tkinter.NSEW)
+        self.channel_select.grid(column=0, row=2, columnspan=3, sticky=tkinter.NSEW)
+        reduction_select.grid(column=3, row=2, sticky=tkinter.NSEW)
+        status_label.grid(column=0, row=3, columnspan=4, sticky=tkinter.W)
+
+        for col in range(4):
+            mainframe.columnconfigure(col, weight=1)
+        mainframe.rowconfigure(1, weight=10)
+
+        self._update_channel()
+
+    def _update_channel(self, *args, **kwargs):
+        self.cancel()
+        channel_id = self.selected_channel.get()
+        self.channel_select.selection_clear()
+        summary = self.cache.get(self.cphd_reader, channel_id, self.vector_bins, self.sample_bins)
+        if summary is not None:
+            self._show_summary(summary)
+            return
+
+        self.summary = None
+        for name, im in self.im.items():
+            im.set_data(np.full((1, 1), np.nan, dtype=np.float32))
+            self.vector_line[name].set_visible(False)
+        self.canvas.draw_idle()
+
+        cancel_event = threading.Event()
+        self._cancel_event = cancel_event
+        self._progress = 0.
+
+        def set_progress(fraction):
+            # NB: this is called on a worker thread, and only sets a value
+            self._progress = fraction
+
+        self._worker.submit(functools.partial(channel_power_summary, progress_callback=set_progress,
+                                              cancel_event=cancel_event, read_lock=self.read_lock),
+                            self.cphd_reader, channel_id, self.vector_bins, self.sample_bins,
+                            callback=self._summary_finished, error_callback=self._summary_failed)
+        self._update_progress()
+
+    def _update_progress(self):
+        self._progress_id = None
+        if self._cancel_event is None:
+            return
+        self.status.set(f'Calculating the power of every vector, {100 * self._progress:.0f}% complete')
+        self._progress_id = self.root.after(250, self._update_progress)
+
+    def _finish_progress(self, status=''):
+        self._cancel_event = None
+        if self._progress_id is not None:
+            self.root.after_cancel(self._progress_id)
+            self._progress_id = None
+        self.status.set(status)
+
+    def _summary_finished(self, summary):
+        self._finish_progress()
+        if summary is None:
+            return
+        self.cache.put(self.cphd_reader, self.vector_bins, self.sample_bins, summary)
+        if summary['channel'] == self.selected_channel.get():
+            self._show_summary(summary)
+
+    def _summary_failed(self, exception):
+        self._finish_progress(f'Failed: {exception}')
+        messagebox.showerror(parent=self.root, title='Channel power summary failed', message=str(exception))
+
+    def cancel(self):
+        """
+        Cancel any calculation in progress
+        """
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+        self._worker.invalidate()
+        self._finish_progress()
+
+    def _show_summary(self, summary):
+        self.summary = summary
+        self.status.set('')
+        self._update_images()
+
+    def _update_images(self, *args):
+        if self.summary is None:
+            return
+        reduction = self.selected_reduction.get()
+        num_vectors = self.summary['vector_edges'][-1]
+        num_samples = self.summary['sample_edges'][-1]
+        extents = {self.domain: (0, num_samples, num_vectors, 0),
+                   self.spectral_domain: (-(num_samples // 2), num_samples - num_samples // 2, num_vectors, 0)}
+        for name, im in self.im.items():
+            data = self.summary[name][reduction]
+            im.set_data(data)
+            im.set_extent(extents[name])
+            finite = data[np.isfinite(data)]
+            if finite.size:
+                low, high = np.percentile(finite, (1, 99.9))
+                im.set_clim(low, max(high, low + 1))
+            self.ax[name].set_title(f'{name} domain, {reduction} power')
+        self.ax[self.domain].figure.suptitle(
+            f"{pathlib.Path(self.cphd_reader.file_name).name}\nchannel {self.summary['channel']}")
+        self.canvas.draw_idle()
+
+    def _on_click(self, event):
+        if not event.dblclick or event.inaxes not in self.ax.values() or event.ydata is None:
+            return
+        if self.summary is None:
+            return
+        num_vectors = self.summary['vector_edges'][-1]
+        self.show_vector(int(np.clip(event.ydata, 0, num_vectors - 1)))
+
+    def show_vector(self, vector_index):
+        """
+        Mark the given vector, and show its power in the vector power plot
+        """
+        for line in self.vector_line.values():
+            line.set_ydata([vector_index + 0.5] * 2)
+            line.set_visible(True)
+        self.canvas.draw_idle()
+
+        if self._vector_window is None or not self._vector_window.winfo_exists():
+            self._vector_window = tkinter.Toplevel(self.root)
+            self._vector_tool = CphdVectorPower(self._vector_window, self.cphd_reader, read_lock=self.read_lock)
+        self._vector_tool.select_vector(vector_index, self.selected_channel.get())
+        self._vector_window.lift()
+
+    def close(self):
+        """
+        Cancel any calculation in progress and close the window
+        """
+        self.cancel()
+        self._worker.shutdown()
+        self.root.destroy()
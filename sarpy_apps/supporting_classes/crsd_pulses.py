@@ -0,0 +1,1206 @@
+"""
+Display independent support for the processing of CRSD pulses, shared by the
+pulse explorer and the headless whole channel analyses.
+
+The pulse spectrograms are calculated in batches, using strided segment views
+of the pulses, a cached window, and a single transform per cache sized block of
+segments, in place of a `scipy.signal.spectrogram` call per pulse.
+
+The display levels for a channel are robust percentiles of the spectrogram power
+(in dB) over a stratified sample of pulses, so that the colour scale does not
+depend on which pulses happen to be viewed first.
+
+The pulse waterfall reduces the spectrogram of every pulse of a channel to a
+single frequency power line, written to a float32 scratch memmap, and the full
+per pulse spectrogram datacube can be exported with chunked writes.
+
+Whole channel results (like the pulse power profile) are cached on disk, keyed
+by the file identity, in the cache directory. This defaults to a `sarpy_apps`
+subdirectory of the user cache directory, and can be set with the
+`SARPY_APPS_CACHE` environment variable.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as scipy_fft
+
+from sarpy.processing.sicd.windows import kaiser
+
+from sarpy_apps.supporting_classes.scratch import get_scratch_space
+from sarpy_apps.supporting_classes.subaperture import datacube_sidecar_name
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRECTORY_VARIABLE = 'SARPY_APPS_CACHE'
+PULSE_PROFILE_PERCENTILES = (5., 50., 95.)
+SPECTROGRAM_LEVEL_PERCENTILES = (1., 99.9)
+# the decibel histogram bins for the spectrogram levels
+_LEVEL_BIN_LIMITS = (-400., 400.)
+_LEVEL_BIN_WIDTH = 0.01
+WATERFALL_REDUCTIONS = ('max', 'mean')
+
+
+class PVPColumnCache(object):
+    """
+    Columnar cache of the per vector parameters (PVP) of a CRSD type reader.
+    Each requested PVP variable is read once per channel, for all pulses, into a
+    contiguous read-only array, which serves both the single pulse lookups and
+    the whole channel analyses.
+    """
+
+    def __init__(self, reader):
+        """
+
+        Parameters
+        ----------
+        reader : sarpy.io.received.base.CRSDTypeReader
+        """
+
+        self._reader = reader
+        self._columns = {}  # type: Dict[Tuple[int, str], Optional[numpy.ndarray]]
+        self._channels = {}  # type: Dict[int, tuple]
+        self._lock = threading.Lock()
+
+    @property
+    def reader(self):
+        """
+        sarpy.io.received.base.CRSDTypeReader: The reader.
+        """
+
+        return self._reader
+
+    def clear(self):
+        """
+        Remove all cached columns.
+        """
+
+        with self._lock:
+            self._columns.clear()
+            self._channels.clear()
+
+    def channel_parameters(self, index):
+        """
+        Gets the channel parameters and the data channel parameters for the
+        given channel index, avoiding repeated identifier lookups.
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        (sarpy.io.received.crsd1_elements.Channel.ChannelParametersType, sarpy.io.received.crsd1_elements.Data.ChannelSizeType)
+        """
+
+        index = int(index)
+        with self._lock:
+            value = self._channels.get(index, None)
+        if value is None:
+            crsd = self._reader.crsd_meta
+            params = crsd.Channel.Parameters[index]
+            data_params = {entry.Identifier: entry for entry in crsd.Data.Channels}[params.Identifier]
+            value = (params, data_params)
+            with self._lock:
+                self._channels[index] = value
+        return value
+
+    def column(self, variable, index):
+        """
+        Gets the values of the given PVP variable for all pulses of the channel.
+
+        Parameters
+        ----------
+        variable : str
+        index : int
+
+        Returns
+        -------
+        None|numpy.ndarray
+            The read-only array of values, or `None` if the variable is not populated.
+        """
+
+        key = (int(index), variable)
+        with self._lock:
+            if key in self._columns:
+                return self._columns[key]
+
+        value = self._reader.read_pvp_variable(variable, key[0])
+        if value is not None:
+            value = numpy.ascontiguousarray(value)
+            value.setflags(write=False)
+        with self._lock:
+            self._columns[key] = value
+        return value
+
+    def value(self, variable, index, pulse):
+        """
+        Gets the value of the given PVP variable for a single pulse.
+
+        Parameters
+        ----------
+        variable : str
+        index : int
+        pulse : int
+
+        Returns
+        -------
+        float|numpy.ndarray
+        """
+
+        the_column = self.column(variable, index)
+        if the_column is None:
+            raise ValueError('PVP variable {} is not populated for channel {}'.format(variable, index))
+        return the_column[pulse]
+
+    def statistics(self, variable, index):
+        """
+        Gets the summary statistics of the given scalar PVP variable over the
+        channel.
+
+        Parameters
+        ----------
+        variable : str
+        index : int
+
+        Returns
+        -------
+        None|dict
+            With `min`, `max`, `mean`, `std`, and `constant` entries, or `None`
+            if the variable is not populated.
+        """
+
+        the_column = self.column(variable, index)
+        if the_column is None or the_column.size == 0:
+            return None
+        the_min = float(numpy.min(the_column))
+        the_max = float(numpy.max(the_column))
+        return {
+            'min': the_min,
+            'max': the_max,
+            'mean': float(numpy.mean(the_column)),
+            'std': float(numpy.std(the_column)),
+            'constant': the_min == the_max}
+
+
+##########
+# pulse spectrograms
+
+def stft_parameters(sample_count):
+    """
+    Gets the short time fourier transform parameters for the given number of
+    samples per pulse.
+
+    Parameters
+    ----------
+    sample_count : int
+
+    Returns
+    -------
+    (int, int, int)
+        The transform length, segment length, and segment overlap.
+    """
+
+    nfft = 2 ** int(numpy.ceil(numpy.log2(numpy.sqrt(sample_count))) + 2)
+    nperseg = int(0.97 * nfft)
+    noverlap = int(0.9 * nfft)
+    return nfft, nperseg, noverlap
+
+
+@lru_cache(maxsize=32)
+def _stft_window(nperseg):
+    # type: (int) -> numpy.ndarray
+    window = numpy.asarray(kaiser(nperseg, 5), dtype='float32')
+    window.setflags(write=False)
+    return window
+
+
+def batch_stft(data, sampling_rate, workers=None, block_bytes=2**20):
+    """
+    Take the short time fourier transform (power spectral density) of each of
+    the pulses. This is equivalent to `scipy.signal.spectrogram` with a Kaiser
+    window, using the parameters from :func:`stft_parameters`, and
+    `return_onesided=False`, for every pulse.
+
+    The segments are strided views of the data, which are detrended and windowed
+    into a reused zero padded buffer, and transformed together in blocks of
+    about `block_bytes`, so that the working arrays remain in cache.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Of shape `(pulse count, sample count)`, or one-dimensional for a single pulse.
+    sampling_rate : float
+    workers : None|int
+        The number of workers for the transform.
+    block_bytes : int
+        The approximate size of the transform buffer.
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        The times, the (centered) frequencies, and the float32 spectrogram array
+        of shape `(pulse count, frequency count, time count)`, or
+        `(frequency count, time count)` for one-dimensional data. The frequency
+        axis is centered, as for the frequencies.
+    """
+
+    if not (isinstance(data, numpy.ndarray) and data.ndim in [1, 2]):
+        raise ValueError('The data must be a one or two-dimensional numpy array')
+    squeeze = (data.ndim == 1)
+    if squeeze:
+        data = data[numpy.newaxis, :]
+
+    pulse_count, sample_count = data.shape
+    nfft, nperseg, noverlap = stft_parameters(sample_count)
+    if nperseg > sample_count:
+        raise ValueError(
+            'The segment length {} exceeds the number of samples {}'.format(nperseg, sample_count))
+    step = nperseg - noverlap
+    window = _stft_window(nperseg)
+    # the density scaling is applied to the window, as the power is quadratic
+    window = window*numpy.float32(
+        numpy.sqrt(1./(sampling_rate*numpy.sum(window.astype('float64')**2))))
+
+    # strided views of the segments, of shape (pulse count, segment count, nperseg)
+    frames = sliding_window_view(data, nperseg, axis=1)[:, ::step, :]
+    segment_count = frames.shape[1]
+
+    # the segment means, for the constant detrend, from the cumulative sum
+    cumulative = numpy.zeros((pulse_count, sample_count + 1), dtype='complex128')
+    numpy.cumsum(data, axis=1, out=cumulative[:, 1:])
+    segment_starts = step*numpy.arange(segment_count)
+    means = ((cumulative[:, segment_starts + nperseg] - cumulative[:, segment_starts])/nperseg).astype('complex64')
+    del cumulative
+
+    # the output is written transposed, and with the frequency axis centered
+    spectrograms = numpy.empty((pulse_count, nfft, segment_count), dtype='float32')
+    output = spectrograms.transpose((0, 2, 1))
+    half = nfft // 2
+
+    # a block is either several whole pulses, or a run of segments of one pulse
+    block_segments = max(1, int(block_bytes) // (8*nfft))
+    if segment_count <= block_segments:
+        block_pulses, block_segments = max(1, block_segments // segment_count), segment_count
+    else:
+        block_pulses = 1
+    block_pulses = min(block_pulses, pulse_count)
+    buffer = numpy.zeros((block_pulses, block_segments, nfft), dtype='complex64')
+    power = numpy.empty((block_pulses, block_segments, nfft), dtype='float32')
+
+    for pulse_start in range(0, pulse_count, block_pulses):
+        pulse_end = min(pulse_start + block_pulses, pulse_count)
+        pulses = pulse_end - pulse_start
+        for segment_start in range(0, segment_count, block_segments):
+            segment_end = min(segment_start + block_segments, segment_count)
+            segments = segment_end - segment_start
+            the_frames = frames[pulse_start:pulse_end, segment_start:segment_end, :]
+            the_buffer = buffer[:pulses, :segments, :]
+            windowed = the_buffer[:, :, :nperseg]
+            numpy.subtract(
+                the_frames, means[pulse_start:pulse_end, segment_start:segment_end, numpy.newaxis], out=windowed)
+            windowed *= window
+            the_buffer[:, :, nperseg:] = 0
+            transformed = scipy_fft.fft(the_buffer, axis=2, overwrite_x=True, workers=workers)
+            squares = transformed.view('float32')
+            squares *= squares
+            the_power = power[:pulses, :segments, :]
+            numpy.add(squares[:, :, 0::2], squares[:, :, 1::2], out=the_power)
+            output[pulse_start:pulse_end, segment_start:segment_end, :nfft-half] = the_power[:, :, half:]
+            output[pulse_start:pulse_end, segment_start:segment_end, nfft-half:] = the_power[:, :, :half]
+
+    times = (0.5*nperseg + step*numpy.arange(segment_count))/float(sampling_rate)
+    frequencies = scipy_fft.fftshift(scipy_fft.fftfreq(nfft, 1./sampling_rate))
+    if squeeze:
+        spectrograms = spectrograms[0]
+    return times, frequencies, spectrograms
+
+
+@lru_cache(maxsize=32)
+def _reramp_table(sample_count, sampling_rate, deramp_rate):
+    """
+    Gets the reramped sample count and sampling rate, and the scaled chirp
+    table, which are constant for pulses which share the sample count,
+    sampling rate and deramp rate.
+
+    Parameters
+    ----------
+    sample_count : int
+    sampling_rate : float
+    deramp_rate : float
+
+    Returns
+    -------
+    (int, float, numpy.ndarray)
+        The reramped sample count and sampling rate, and the chirp table.
+    """
+
+    rcv_window_length = sample_count / sampling_rate
+    deramp_bandwidth = abs(rcv_window_length * deramp_rate)
+    upsample_factor = (deramp_bandwidth + sampling_rate) / sampling_rate
+
+    # NB: the sample size must not be padded (to a fast transform length, say),
+    #   since the displayed frequency offset depends on the reramped sampling rate
+    sample_size = int(round(upsample_factor * sample_count))
+    oversample_factor = sample_size / (upsample_factor * sample_count)
+    time_interval = 1 / (sampling_rate * upsample_factor * oversample_factor)
+    times = time_interval * numpy.arange(sample_size) - 0.5 * rcv_window_length
+    # the phase is calculated in double precision, and the resampling scale is included
+    chirp = (sample_size/float(sample_count))*numpy.exp(1j * numpy.pi * deramp_rate * times * times)
+    chirp = chirp.astype('complex64')
+    chirp.setflags(write=False)
+    return sample_size, 1. / time_interval, chirp
+
+
+def reramp(pulse_data, sampling_rate, deramp_rate, workers=None):
+    """
+    Reramp the deramped pulse data. The mean is removed, and the data is
+    upsampled by the Fourier method, following `scipy.signal.resample`, to the
+    length covering the deramp bandwidth, and the chirp is applied. The work is in complex64 throughout.
+
+    Parameters
+    ----------
+    pulse_data : numpy.ndarray
+        Of shape `(pulse count, sample count)`, or one-dimensional for a single pulse.
+    sampling_rate : float
+    deramp_rate : float
+    workers : None|int
+        The number of workers for the transforms.
+
+    Returns
+    -------
+    (numpy.ndarray, float)
+        The reramped_data and new sampling rate.
+    """
+
+    squeeze = (pulse_data.ndim == 1)
+    if squeeze:
+        pulse_data = pulse_data[numpy.newaxis, :]
+    sample_count = pulse_data.shape[1]
+    sample_size, new_sampling_rate, chirp = _reramp_table(
+        sample_count, float(sampling_rate), float(deramp_rate))
+
+    spectrum = scipy_fft.fft(pulse_data.astype('complex64', copy=False), axis=1, workers=workers)
+    spectrum[:, 0] = 0  # removing the mean
+    upsampled = numpy.zeros((pulse_data.shape[0], sample_size), dtype='complex64')
+    positive = sample_count // 2 + 1
+    upsampled[:, :positive] = spectrum[:, :positive]
+    if sample_count > 2:
+        upsampled[:, positive - sample_count:] = spectrum[:, positive - sample_count:]
+    if sample_count % 2 == 0 and sample_size > sample_count:
+        # split the Nyquist component between the positive and negative frequencies
+        upsampled[:, sample_count // 2] *= 0.5
+        upsampled[:, sample_size - sample_count // 2] = upsampled[:, sample_count // 2]
+    del spectrum
+    reramped = scipy_fft.ifft(upsampled, axis=1, overwrite_x=True, workers=workers)
+    reramped *= chirp
+    if squeeze:
+        reramped = reramped[0]
+    return reramped, new_sampling_rate
+
+
+def read_pulses(reader, index, pulses, pvp_cache=None, read_lock=None):
+    """
+    Reads the signal data and the required PVP values for the given pulses of
+    the channel.
+
+    Parameters
+    ----------
+    reader : sarpy.io.received.base.CRSDTypeReader
+    index : int
+        The channel index.
+    pulses : Sequence[int]
+    pvp_cache : None|PVPColumnCache
+        The columnar PVP cache, which should be provided for repeated use.
+    read_lock : None|threading.Lock
+        If provided, this is held while reading, for when the reader is shared
+        with other threads.
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        The pulse data of shape `(pulse count, sample count)`, and the FICRate
+        and DFIC0 values.
+    """
+
+    if pvp_cache is None:
+        pvp_cache = PVPColumnCache(reader)
+    pulses = numpy.asarray(pulses, dtype='int64')
+    if pulses.ndim != 1 or pulses.size == 0:
+        raise ValueError('pulses must be a non-empty one-dimensional sequence')
+
+    def read_data():
+        first, last = int(numpy.min(pulses)), int(numpy.max(pulses))
+        if last - first + 1 <= 2*pulses.size:
+            # read the covering block, which is typically contiguous
+            block = reader.read(slice(first, last + 1), slice(None), index=index, squeeze=False)
+            return block[pulses - first, :]
+        return numpy.stack(
+            [reader.read(slice(pulse, pulse + 1), slice(None), index=index, squeeze=False)[0]
+             for pulse in pulses], axis=0)
+
+    if read_lock is None:
+        fic_rates = pvp_cache.column('FICRate', index)
+        dfic0s = pvp_cache.column('DFIC0', index)
+        pulse_data = read_data()
+    else:
+        with read_lock:
+            fic_rates = pvp_cache.column('FICRate', index)
+            dfic0s = pvp_cache.column('DFIC0', index)
+            pulse_data = read_data()
+    if fic_rates is None or dfic0s is None:
+        raise ValueError('The FICRate and DFIC0 PVP variables must be populated for channel {}'.format(index))
+    return pulse_data, numpy.array(fic_rates[pulses], dtype='float64'), numpy.array(dfic0s[pulses], dtype='float64')
+
+
+def rf_signal_spectrograms(params, pulse_data, fic_rates, dfic0s, workers=None):
+    """
+    Gets the RF signal spectrograms for the pulses. The pulses which are not
+    deramped are transformed together, as are the pulses which share a deramp
+    rate.
+
+    Parameters
+    ----------
+    params : sarpy.io.received.crsd1_elements.Channel.ChannelParametersType
+    pulse_data : numpy.ndarray
+        Of shape `(pulse count, sample count)`.
+    fic_rates : numpy.ndarray
+    dfic0s : numpy.ndarray
+    workers : None|int
+        The number of workers for the transforms.
+
+    Returns
+    -------
+    List[(numpy.ndarray, numpy.ndarray, numpy.ndarray)]
+        The times, frequencies, and spectrogram for each pulse.
+    """
+
+    sampling_rate = params.Fs
+    results = [None, ]*pulse_data.shape[0]
+
+    no_ramp = numpy.flatnonzero(fic_rates == 0)
+    if no_ramp.size > 0:
+        times, frequencies, spectrograms = batch_stft(pulse_data[no_ramp], sampling_rate, workers=workers)
+        for entry, spectrogram in zip(no_ramp, spectrograms):
+            results[entry] = (
+                times, frequencies + (params.F0Ref + dfic0s[entry] - 0.5*sampling_rate), spectrogram)
+
+    # the pulses sharing the deramp rate (usually all of them) are reramped together
+    for fic_rate in numpy.unique(fic_rates[fic_rates != 0]):
+        entries = numpy.flatnonzero(fic_rates == fic_rate)
+        fic_rate = float(fic_rate)
+        reramped, reramped_sampling_rate = reramp(pulse_data[entries], sampling_rate, fic_rate, workers=workers)
+        times, frequencies, spectrograms = batch_stft(reramped, reramped_sampling_rate, workers=workers)
+        del reramped
+        frequencies = frequencies + \
+            params.F0Ref + \
+            0.5 * fic_rate * pulse_data.shape[1] / reramped_sampling_rate - \
+            0.5 * reramped_sampling_rate
+        for entry, spectrogram in zip(entries, spectrograms):
+            results[entry] = (times, frequencies + dfic0s[entry], spectrogram)
+    return results
+
+
+##########
+# persistent cache support
+
+def get_cache_directory():
+    """
+    Gets the directory for the persistent cache files, which is created if
+    necessary.
+
+    Returns
+    -------
+    str
+    """
+
+    directory = os.environ.get(CACHE_DIRECTORY_VARIABLE, None)
+    if directory is None:
+        base = os.environ.get('XDG_CACHE_HOME', None) or os.path.join(os.path.expanduser('~'), '.cache')
+        directory = os.path.join(base, 'sarpy_apps')
+    directory = os.path.abspath(os.path.expanduser(directory))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def file_identity(file_name):
+    """
+    Gets the identity of the given file, as its absolute path, size and
+    modification time, so that cached results are invalidated if the file
+    changes.
+
+    Parameters
+    ----------
+    file_name : None|str
+
+    Returns
+    -------
+    None|list
+        `None` if the file does not exist.
+    """
+
+    if file_name is None or not os.path.isfile(file_name):
+        return None
+    stat = os.stat(file_name)
+    return [os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns]
+
+
+##########
+# pulse power profile
+
+def _chunk_power_profile(pulses, percentiles):
+    """
+    Calculate the power statistics for each pulse of the chunk.
+
+    Parameters
+    ----------
+    pulses : numpy.ndarray
+        Of shape `(pulse count, sample count)`.
+    percentiles : Tuple[float, ...]
+
+    Returns
+    -------
+    numpy.ndarray
+        Of shape `(pulse count, 3 + len(percentiles))`, with the mean, minimum,
+        maximum, and percentile values.
+    """
+
+    power = pulses.real*pulses.real + pulses.imag*pulses.imag
+    out = numpy.empty((power.shape[0], 3 + len(percentiles)), dtype='float64')
+    out[:, 0] = numpy.mean(power, axis=1, dtype='float64')
+    out[:, 1] = numpy.min(power, axis=1)
+    out[:, 2] = numpy.max(power, axis=1)
+    if len(percentiles) > 0:
+        out[:, 3:] = numpy.percentile(power, percentiles, axis=1).T
+    return out
+
+
+def pulse_power_profile(reader, index, chunk_size=200, percentiles=PULSE_PROFILE_PERCENTILES,
+                        workers=None, progress_callback=None, cancel_event=None, read_lock=None):
+    """
+    Calculate the power profile for the pulses of the given channel. The pulses
+    are read in chunks on the calling thread, and the statistics for each chunk
+    are calculated using a thread pool.
+
+    Parameters
+    ----------
+    reader : sarpy.io.received.base.CRSDTypeReader
+    index : int
+        The channel index.
+    chunk_size : int
+        The number of pulses in each chunk.
+    percentiles : Tuple[float, ...]
+        The power percentiles to calculate for each pulse.
+    workers : None|int
+        The number of worker threads. `None` uses the number of cores.
+    progress_callback : None|Callable
+        Called with the fraction complete after each chunk.
+    cancel_event : None|threading.Event
+        The calculation is abandoned when this is set.
+    read_lock : None|threading.Lock
+        If provided, this is held while reading, for when the reader is shared
+        with other threads.
+
+    Returns
+    -------
+    None|dict
+        `None` if cancelled, otherwise with the `mean`, `min` and `max` power
+        arrays, the `percentiles` array of shape `(pulse count, len(percentiles))`,
+        and the `percentile_levels`.
+    """
+
+    index = int(index)
+    percentiles = tuple(float(entry) for entry in percentiles)
+    pulse_count = reader.get_data_size_as_tuple()[index][0]
+    values = numpy.zeros((pulse_count, 3 + len(percentiles)), dtype='float64')
+    chunk_size = max(1, int(chunk_size))
+    starts = list(range(0, pulse_count, chunk_size))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    def store(future, start):
+        result = future.result()
+        values[start:start+result.shape[0], :] = result
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sarpy_apps_profile') as executor:
+        for count, start in enumerate(starts):
+            if cancelled():
+                for future, _ in pending:
+                    future.cancel()
+                return None
+            end = min(start + chunk_size, pulse_count)
+            if read_lock is None:
+                pulses = reader.read(slice(start, end), slice(None), index=index, squeeze=False)
+            else:
+                with read_lock:
+                    pulses = reader.read(slice(start, end), slice(None), index=index, squeeze=False)
+            pending.append((executor.submit(_chunk_power_profile, pulses, percentiles), start))
+            del pulses
+            while len(pending) > 2*workers:
+                store(*pending.pop(0))
+            if progress_callback is not None:
+                progress_callback(float(count + 1)/len(starts))
+        for entry in pending:
+            store(*entry)
+
+    return {
+        'mean': values[:, 0],
+        'min': values[:, 1],
+        'max': values[:, 2],
+        'percentiles': values[:, 3:],
+        'percentile_levels': numpy.array(percentiles, dtype='float64')}
+
+
+def stratified_pulses(pulse_count, sample_count, seed=0):
+    """
+    Gets a stratified sample of the pulses, with one pulse chosen at random from
+    each of `sample_count` equal sized intervals covering the channel. The
+    sample is reproducible for a given seed.
+
+    Parameters
+    ----------
+    pulse_count : int
+    sample_count : int
+    seed : int
+
+    Returns
+    -------
+    numpy.ndarray
+        The sorted distinct pulse numbers, which is empty if there are no pulses.
+    """
+
+    pulse_count = int(pulse_count)
+    if pulse_count <= 0:
+        return numpy.zeros((0, ), dtype='int64')
+    sample_count = max(1, min(pulse_count, int(sample_count)))
+    edges = numpy.linspace(0, pulse_count, sample_count + 1)
+    offsets = numpy.random.default_rng(seed).random(sample_count)
+    pulses = numpy.floor(edges[:-1] + offsets*(edges[1:] - edges[:-1])).astype('int64')
+    return numpy.unique(numpy.clip(pulses, 0, pulse_count - 1))
+
+
+def _level_histogram(spectrogram):
+    """
+    Gets the histogram of the spectrogram power in decibels, over the fixed
+    bins, clipping to the extreme bins.
+
+    Parameters
+    ----------
+    spectrogram : numpy.ndarray
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    bin_count = int(round((_LEVEL_BIN_LIMITS[1] - _LEVEL_BIN_LIMITS[0])/_LEVEL_BIN_WIDTH))
+    values = numpy.log10(numpy.maximum(spectrogram.ravel(), numpy.finfo('float32').tiny))
+    values *= 10./_LEVEL_BIN_WIDTH
+    values -= _LEVEL_BIN_LIMITS[0]/_LEVEL_BIN_WIDTH
+    bins = numpy.clip(values, 0, bin_count - 1).astype('int32')
+    return numpy.bincount(bins, minlength=bin_count)
+
+
+def _histogram_percentiles(counts, percentiles):
+    """
+    Gets the percentile values, in decibels, from the level histogram, to the
+    bin width resolution.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+    percentiles : Sequence[float]
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    cumulative = numpy.cumsum(counts)
+    targets = 0.01*numpy.array(percentiles, dtype='float64')*cumulative[-1]
+    bins = numpy.minimum(numpy.searchsorted(cumulative, targets, side='left'), counts.size - 1)
+    return _LEVEL_BIN_LIMITS[0] + (bins + 0.5)*_LEVEL_BIN_WIDTH
+
+
+def robust_levels(spectrogram, percentiles=SPECTROGRAM_LEVEL_PERCENTILES):
+    """
+    Gets the percentiles of the power, in decibels, of a single spectrogram.
+
+    Parameters
+    ----------
+    spectrogram : numpy.ndarray
+    percentiles : Sequence[float]
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    return _histogram_percentiles(_level_histogram(spectrogram), percentiles)
+
+
+def spectrogram_levels(reader, index, sample_count=64, percentiles=SPECTROGRAM_LEVEL_PERCENTILES,
+                       batch_size=8, pvp_cache=None, workers=None, progress_callback=None,
+                       cancel_event=None, read_lock=None, seed=0):
+    """
+    Calculate the display levels for the RF signal spectrograms of the given
+    channel, as the percentiles of the spectrogram power in decibels over a
+    stratified sample of the pulses. The sampled spectrograms are computed in
+    batches, and are reduced to a fixed histogram, so the memory usage does not
+    depend on the sample size. A `ValueError` is raised if the channel has no
+    pulses.
+
+    Parameters
+    ----------
+    reader : sarpy.io.received.base.CRSDTypeReader
+    index : int
+        The channel index.
+    sample_count : int
+        The number of sampled pulses.
+    percentiles : Sequence[float]
+    batch_size : int
+        The number of pulses in each spectrogram batch.
+    pvp_cache : None|PVPColumnCache
+    workers : None|int
+        The number of workers for the transforms.
+    progress_callback : None|Callable
+        Called with the fraction complete after each batch.
+    cancel_event : None|threading.Event
+        The calculation is abandoned when this is set.
+    read_lock : None|threading.Lock
+        If provided, this is held while reading.
+    seed : int
+        The seed for the stratified sample of the pulses.
+
+    Returns
+    -------
+    None|dict
+        `None` if cancelled, otherwise with the `levels` array of the decibel
+        values, the `percentile_levels`, the sampled `pulses`, and the
+        `sample_count` and `seed` used.
+    """
+
+    index = int(index)
+    percentiles = tuple(float(entry) for entry in percentiles)
+    if pvp_cache is None:
+        pvp_cache = PVPColumnCache(reader)
+    params, _ = pvp_cache.channel_parameters(index)
+    pulses = stratified_pulses(reader.get_data_size_as_tuple()[index][0], sample_count, seed=seed)
+    if pulses.size == 0:
+        raise ValueError('Channel {} has no pulses, so has no spectrogram levels'.format(index))
+    batch_size = max(1, int(batch_size))
+
+    counts = None
+    for start in range(0, pulses.size, batch_size):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        pulse_data, fic_rates, dfic0s = read_pulses(
+            reader, index, pulses[start:start + batch_size], pvp_cache=pvp_cache, read_lock=read_lock)
+        for _, _, spectrogram in rf_signal_spectrograms(params, pulse_data, fic_rates, dfic0s, workers=workers):
+            histogram = _level_histogram(spectrogram)
+            counts = histogram if counts is None else counts + histogram
+        del pulse_data
+        if progress_callback is not None:
+            progress_callback(min(1., float(start + batch_size)/pulses.size))
+
+    return {
+        'levels': _histogram_percentiles(counts, percentiles),
+        'percentile_levels': numpy.array(percentiles, dtype='float64'),
+        'pulses': pulses,
+        'sample_count': int(sample_count),
+        'seed': int(seed)}
+
+
+def _spectrogram_batches(reader, index, batch_size=32, pvp_cache=None, workers=None,
+                         progress_callback=None, cancel_event=None, read_lock=None):
+    """
+    Generates the RF signal spectrograms of all pulses of the given channel, in
+    contiguous batches.
+
+    Parameters
+    ----------
+    reader : sarpy.io.received.base.CRSDTypeReader
+    index : int
+    batch_size : int
+    pvp_cache : None|PVPColumnCache
+    workers : None|int
+    progress_callback : None|Callable
+        Called with the fraction complete after each batch.
+    cancel_event : None|threading.Event
+        The generation stops early when this is set.
+    read_lock : None|threading.Lock
+
+    Yields
+    ------
+    (int, List[(numpy.ndarray, numpy.ndarray, numpy.ndarray)])
+        The first pulse number of the batch, and the times, frequencies, and
+        spectrogram of each pulse.
+    """
+
+    if pvp_cache is None:
+        pvp_cache = PVPColumnCache(reader)
+    params, _ = pvp_cache.channel_parameters(index)
+    pulse_count = reader.get_data_size_as_tuple()[index][0]
+    batch_size = max(1, int(batch_size))
+    for start in range(0, pulse_count, batch_size):
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        pulses = numpy.arange(start, min(start + batch_size, pulse_count))
+        pulse_data, fic_rates, dfic0s = read_pulses(
+            reader, index, pulses, pvp_cache=pvp_cache, read_lock=read_lock)
+        results = rf_signal_spectrograms(params, pulse_data, fic_rates, dfic0s, workers=workers)
+        del pulse_data
+        yield start, results
+        if progress_callback is not None:
+            progress_callback(float(pulses[-1] + 1)/pulse_count)
+
+
+def pulse_waterfall(reader, index, reduction='max', batch_size=32, pvp_cache=None, workers=None,
+                    progress_callback=None, cancel_event=None, read_lock=None):
+    """
+    Calculate the pulse waterfall for the given channel, where the spectrogram
+    of each pulse is reduced to the maximum or mean power over time at each
+    frequency. The lines are resampled onto the frequencies of the first pulse,
+    where they differ, and written to a float32 scratch memmap of shape
+    `(pulse count, frequency count)`. A `ValueError` is raised if the channel
+    has no pulses.
+
+    Parameters
+    ----------
+    reader : sarpy.io.received.base.CRSDTypeReader
+    index : int
+        The channel index.
+    reduction : str
+        One of `WATERFALL_REDUCTIONS`.
+    batch_size : int
+        The number of pulses in each spectrogram batch.
+    pvp_cache : None|PVPColumnCache
+    workers : None|int
+        The number of workers for the transforms.
+    progress_callback : None|Callable
+        Called with the fraction complete after each batch.
+    cancel_event : None|threading.Event
+        The calculation is abandoned when this is set.
+    read_lock : None|threading.Lock
+        If provided, this is held while reading.
+
+    Returns
+    -------
+    None|dict
+        `None` if cancelled, otherwise with the `data` memmap, its scratch
+        `file_name` (which should be released once no longer in use), the
+        `frequencies` array and the `reduction`.
+    """
+
+    if reduction not in WATERFALL_REDUCTIONS:
+        raise ValueError('reduction must be one of {}, got {}'.format(WATERFALL_REDUCTIONS, reduction))
+
+    index = int(index)
+    pulse_count = reader.get_data_size_as_tuple()[index][0]
+    if pulse_count == 0:
+        raise ValueError('Channel {} has no pulses, so has no pulse waterfall'.format(index))
+    scratch = get_scratch_space()
+    file_name = None
+    data = None
+    reference = None
+    try:
+        for start, results in _spectrogram_batches(
+                reader, index, batch_size=batch_size, pvp_cache=pvp_cache, workers=workers,
+                progress_callback=progress_callback, cancel_event=cancel_event, read_lock=read_lock):
+            if data is None:
+                reference = results[0][1]
+                file_name, data = scratch.create_memmap(
+                    (pulse_count, reference.size), dtype='float32', suffix='.waterfall')
+            for offset, (_, frequencies, spectrogram) in enumerate(results):
+                if reduction == 'max':
+                    line = numpy.max(spectrogram, axis=1)
+                else:
+                    line = numpy.mean(spectrogram, axis=1, dtype='float64')
+                if frequencies.size != reference.size or not numpy.array_equal(frequencies, reference):
+                    line = numpy.interp(reference, frequencies, line, left=0, right=0)
+                data[start + offset, :] = line
+    except BaseException:
+        scratch.release(file_name)
+        raise
+
+    if cancel_event is not None and cancel_event.is_set():
+        del data
+        scratch.release(file_name)
+        return None
+    data.flush()
+    return {
+        'data': data,
+        'file_name': file_name,
+        'frequencies': reference,
+        'reduction': reduction}
+
+
+def export_spectrogram_datacube(reader, index, file_name, batch_size=32, pvp_cache=None, workers=None,
+                                progress_callback=None, cancel_event=None, read_lock=None):
+    """
+    Write the full resolution RF signal spectrograms for all pulses of the
+    given channel as a float32 datacube of shape `(pulse count, frequency count,
+    time count)`, one batch of pulses at a time, along with a json sidecar file
+    describing the axes.
+
+    If the file extension is `.npy`, then the datacube is written in the numpy
+    npy format. Otherwise, it is written as a raw memmap, and the dtype and shape
+    are only recorded in the sidecar.
+
+    The time axis and frequency spacing are recorded once, so they must be the
+    same for every pulse (i.e. the pulses must share the reramped sampling rate),
+    otherwise a `ValueError` is raised and the partial file removed. A
+    `ValueError` is also raised if the channel has no pulses.
+
+    Parameters
+    ----------
+    reader : sarpy.io.received.base.CRSDTypeReader
+    index : int
+        The channel index.
+    file_name : str
+    batch_size : int
+        The number of pulses in each spectrogram batch, and write.
+    pvp_cache : None|PVPColumnCache
+    workers : None|int
+        The number of workers for the transforms.
+    progress_callback : None|Callable
+        Called with the fraction complete after each batch.
+    cancel_event : None|threading.Event
+        The export is abandoned, and the partial file removed, when this is set.
+    read_lock : None|threading.Lock
+        If provided, this is held while reading.
+
+    Returns
+    -------
+    None|dict
+        `None` if cancelled, otherwise the sidecar contents.
+    """
+
+    index = int(index)
+    pulse_count = reader.get_data_size_as_tuple()[index][0]
+    if pulse_count == 0:
+        raise ValueError('Channel {} has no pulses, so has no spectrogram datacube'.format(index))
+    cube = None
+    cube_format = 'npy' if os.path.splitext(file_name)[1].lower() == '.npy' else 'raw'
+    shape = None
+    times = None
+    frequency_starts = numpy.zeros((pulse_count, ), dtype='float64')
+    frequency_spacing = None
+    try:
+        for start, results in _spectrogram_batches(
+                reader, index, batch_size=batch_size, pvp_cache=pvp_cache, workers=workers,
+                progress_callback=progress_callback, cancel_event=cancel_event, read_lock=read_lock):
+            if cube is None:
+                times = results[0][0]
+                frequency_spacing = float(results[0][1][1] - results[0][1][0])
+                shape = (pulse_count, ) + results[0][2].shape
+                if cube_format == 'npy':
+                    cube = numpy.lib.format.open_memmap(file_name, mode='w+', dtype='float32', shape=shape)
+                else:
+                    cube = numpy.memmap(file_name, dtype='float32', mode='w+', shape=shape)
+            for offset, (pulse_times, frequencies, spectrogram) in enumerate(results):
+                if spectrogram.shape != cube.shape[1:]:
+                    raise ValueError(
+                        'The spectrogram for pulse {} has shape {}, which differs from the '
+                        'shape {} for the first pulse'.format(start + offset, spectrogram.shape, cube.shape[1:]))
+                spacing = float(frequencies[1] - frequencies[0])
+                if not numpy.allclose(pulse_times, times, rtol=1e-9, atol=0) or \
+                        not numpy.isclose(spacing, frequency_spacing, rtol=1e-9, atol=0):
+                    raise ValueError(
+                        'The spectrogram for pulse {} has frequency spacing {}, or a time axis, '
+                        'which differs from the first pulse, with frequency spacing {}. The axes '
+                        'are recorded once for all pulses'.format(start + offset, spacing, frequency_spacing))
+                frequency_starts[start + offset] = frequencies[0]
+            cube[start:start + len(results)] = numpy.stack([entry[2] for entry in results], axis=0)
+        if cube is not None:
+            cube.flush()
+    except BaseException:
+        del cube
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        raise
+
+    del cube
+    if cancel_event is not None and cancel_event.is_set():
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        return None
+
+    sidecar = {
+        'file_name': os.path.basename(file_name),
+        'format': cube_format,
+        'dtype': 'float32',
+        'shape': list(shape),
+        'channel': reader.crsd_meta.Channel.Parameters[index].Identifier,
+        'times': [float(entry) for entry in times],
+        'frequency_spacing': frequency_spacing,
+        'frequency_starts': [float(entry) for entry in frequency_starts]}
+    with open(datacube_sidecar_name(file_name), 'w') as fi:
+        json.dump(sidecar, fi, indent=1)
+    return sidecar
+
+
+class PulseProfileCache(object):
+    """
+    Cache of the pulse power profiles, per channel, held in memory and persisted
+    to the cache directory keyed by the file identity.
+    """
+
+    _prefix = 'pulse_profile_'
+    _fields = ('mean', 'min', 'max', 'percentiles', 'percentile_levels')
+    _default_percentiles = PULSE_PROFILE_PERCENTILES
+    # the calculation parameters, besides the percentiles, which determine the result
+    _default_parameters = {}
+    _description = 'pulse profile'
+
+    def __init__(self, directory=None):
+        """
+
+        Parameters
+        ----------
+        directory : None|str
+            The persistent cache directory. If `None`, :func:`get_cache_directory`
+            is used.
+        """
+
+        self._directory = directory
+        self._entries = {}  # type: Dict[str, dict]
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        # type: () -> str
+        """
+        str: The persistent cache directory.
+        """
+
+        if self._directory is None:
+            self._directory = get_cache_directory()
+        return self._directory
+
+    def _parameters(self, parameters):
+        unexpected = set(parameters.keys()).difference(self._default_parameters.keys())
+        if len(unexpected) > 0:
+            raise ValueError('Unexpected {} parameters {}'.format(self._description, sorted(unexpected)))
+        out = dict(self._default_parameters)
+        out.update(parameters)
+        return {key: numpy.asarray(value).item() for key, value in out.items()}
+
+    def _key(self, reader, index, percentiles, parameters):
+        identity = file_identity(reader.file_name)
+        if identity is None:
+            return None
+        channel_id = reader.crsd_meta.Channel.Parameters[index].Identifier
+        the_key = {'file': identity, 'channel': channel_id, 'percentiles': [float(entry) for entry in percentiles]}
+        the_key.update(parameters)
+        return json.dumps(the_key, sort_keys=True)
+
+    def _file_name(self, key):
+        return os.path.join(
+            self.directory, self._prefix + hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+
+    def get(self, reader, index, percentiles=None, **parameters):
+        """
+        Gets the cached pulse power profile, from memory or disk.
+
+        Parameters
+        ----------
+        reader : sarpy.io.received.base.CRSDTypeReader
+        index : int
+        percentiles : None|Tuple[float, ...]
+            `None` uses the default percentiles.
+        parameters
+            The calculation parameters, `sample_count` and `seed` for the levels
+            cache, where any omitted use the defaults.
+
+        Returns
+        -------
+        None|dict
+            As from :func:`pulse_power_profile`, or :func:`spectrogram_levels`
+            for the levels cache.
+        """
+
+        if percentiles is None:
+            percentiles = self._default_percentiles
+        key = self._key(reader, index, percentiles, self._parameters(parameters))
+        if key is None:
+            return None
+        with self._lock:
+            value = self._entries.get(key, None)
+        if value is not None:
+            return value
+
+        file_name = self._file_name(key)
+        if not os.path.isfile(file_name):
+            return None
+        try:
+            with numpy.load(file_name, allow_pickle=False) as data:
+                if str(data['key']) != key:
+                    return None
+                value = {name: data[name] for name in self._fields}
+        except (OSError, ValueError, KeyError):
+            logger.warning('Failed reading cached {} {}'.format(self._description, file_name), exc_info=True)
+            return None
+        with self._lock:
+            self._entries[key] = value
+        return value
+
+    def put(self, reader, index, profile):
+        """
+        Cache the pulse power profile, in memory and on disk.
+
+        Parameters
+        ----------
+        reader : sarpy.io.received.base.CRSDTypeReader
+        index : int
+        profile : dict
+            As from :func:`pulse_power_profile`, or :func:`spectrogram_levels`
+            for the levels cache.
+        """
+
+        parameters = {name: profile[name] for name in self._default_parameters}
+        key = self._key(reader, index, profile['percentile_levels'], self._parameters(parameters))
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = profile
+
+        file_name = self._file_name(key)
+        temp_file_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        try:
+            with open(temp_file_name, 'wb') as fi:
+                numpy.savez(fi, key=numpy.array(key), **profile)
+            os.replace(temp_file_name, file_name)
+        except OSError:
+            logger.warning('Failed writing cached {} {}'.format(self._description, file_name), exc_info=True)
+            if os.path.exists(temp_file_name):
+                os.remove(temp_file_name)
+
+
+class SpectrogramLevelsCache(PulseProfileCache):
+    """
+    Cache of the spectrogram display levels, per channel, held in memory and
+    persisted to the cache directory keyed by the file identity.
+    """
+
+    _prefix = 'spectrogram_levels_'
+    _fields = ('levels', 'percentile_levels', 'pulses', 'sample_count', 'seed')
+    _default_percentiles = SPECTROGRAM_LEVEL_PERCENTILES
+    _default_parameters = {'sample_count': 64, 'seed': 0}
+    _description = 'spectrogram levels'
@@ -0,0 +1,335 @@
+"""
+Whole image consistency check of the local spectral centroid against the
+`Grid.Row.DeltaKCOAPoly` and `Grid.Col.DeltaKCOAPoly` predictions.
+
+The image is tiled into overlapping windows, which are transformed in batches
+(stacked three-dimensional arrays) using a thread pool, and the spectral
+centroid of each window is compared with the polynomial prediction at the
+window center. The image is read one block of windows at a time, so that the
+memory usage is bounded, regardless of the image size.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+from sarpy.io.complex.utils import get_physical_coordinates
+
+from sarpy_apps.supporting_classes.fft_service import fast_shape, get_fft_service
+
+logger = logging.getLogger(__name__)
+
+
+def _window_starts(size, window_size, step):
+    """
+    Gets the window start indices covering the given size.
+
+    Parameters
+    ----------
+    size : int
+    window_size : int
+    step : int
+
+    Returns
+    -------
+    (numpy.ndarray, int)
+        The start indices, and the (possibly reduced) window size.
+    """
+
+    if size <= window_size:
+        return numpy.array([0, ], dtype='int64'), size
+    starts = numpy.arange(0, size - window_size + 1, step, dtype='int64')
+    if starts[-1] != size - window_size:
+        # ensure that the end of the image is covered
+        starts = numpy.append(starts, size - window_size)
+    return starts, window_size
+
+
+def _circular_centroid(marginal, sample_spacing):
+    """
+    Gets the spectral centroid (cycles/meter) from the marginal power along the
+    last axis, which is in (unshifted) fft order. The circular mean is used, so
+    the centroid is correct for spectral support which wraps around.
+
+    Parameters
+    ----------
+    marginal : numpy.ndarray
+    sample_spacing : float
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    size = marginal.shape[-1]
+    phasor = numpy.exp((2j*numpy.pi/size)*numpy.arange(size))
+    return numpy.angle(marginal.dot(phasor))/(2*numpy.pi*sample_spacing)
+
+
+def _batch_centroids(stack, sicd):
+    """
+    Calculate the row and column spectral centroids for the stack of windows.
+
+    Parameters
+    ----------
+    stack : numpy.ndarray
+        Of shape `(window_count, row_size, column_size)`, which will be overwritten.
+    sicd : SICDType
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        The row centroid, column centroid, total power, and fraction of zero
+        (i.e. outside the valid data) pixels for each window.
+    """
+
+    zero_fraction = numpy.mean(stack == 0, axis=(1, 2))
+    stack = get_fft_service().fft2_sicd(stack, sicd, axes=(1, 2), overwrite=True)
+    power = stack.real*stack.real + stack.imag*stack.imag
+    row_marginal = numpy.sum(power, axis=2, dtype='float64')
+    col_marginal = numpy.sum(power, axis=1, dtype='float64')
+    return _circular_centroid(row_marginal, sicd.Grid.Row.SS), \
+        _circular_centroid(col_marginal, sicd.Grid.Col.SS), \
+        numpy.sum(row_marginal, axis=1), zero_fraction
+
+
+def _wrap(value, sample_spacing):
+    period = 1./sample_spacing
+    return numpy.mod(value + 0.5*period, period) - 0.5*period
+
+
+def deltak_consistency_map(reader, window_size=256, overlap=0.5, max_pixels=2**22,
+                           max_zero_fraction=0.1, workers=None, progress_callback=None,
+                           cancel_event=None, read_lock=None):
+    """
+    Calculate the map of measured spectral centroid versus the `DeltaKCOAPoly`
+    predicted values over the whole image.
+
+    Parameters
+    ----------
+    reader : SICDTypeCanvasImageReader
+    window_size : int|tuple
+        The window size, either a single value or `(row_size, column_size)`,
+        which will be rounded up to fast transform sizes.
+    overlap : float
+        The fractional overlap of adjacent windows, in `[0, 1)`.
+    max_pixels : int
+        The approximate maximum number of pixels in a single batch of windows.
+    max_zero_fraction : float
+        Windows with a larger fraction of zero valued pixels (i.e. outside of the
+        valid data) are omitted.
+    workers : None|int
+        The number of worker threads. `None` uses the number of cores.
+    progress_callback : None|Callable
+        Called with the fraction complete after each block of windows.
+    cancel_event : None|threading.Event
+        The calculation is abandoned when this is set.
+    read_lock : None|threading.Lock
+        If provided, this is held while reading, for when the reader is shared
+        with other threads.
+
+    Returns
+    -------
+    None|dict
+        `None` if cancelled, otherwise with `row_centers` and `col_centers` arrays of the window center pixel
+        coordinates, and `row_measured`, `row_predicted`, `row_offset`,
+        `col_measured`, `col_predicted` and `col_offset` arrays (cycles/meter)
+        of shape `(row_centers.size, col_centers.size)`. Omitted windows are
+        populated with `nan`.
+    """
+
+    if not (0 <= overlap < 1):
+        raise ValueError('overlap must be in the range [0, 1), got {}'.format(overlap))
+    if isinstance(window_size, int):
+        window_size = (window_size, window_size)
+
+    sicd = reader.get_sicd()
+    data_size = reader.data_size
+    window_size = fast_shape(window_size)
+    steps = [max(1, int(round(entry*(1 - overlap)))) for entry in window_size]
+    row_starts, row_size = _window_starts(data_size[0], int(window_size[0]), steps[0])
+    col_starts, col_size = _window_starts(data_size[1], int(window_size[1]), steps[1])
+    batch_count = max(1, int(max_pixels // (row_size*col_size)))
+
+    row_spacing = sicd.Grid.Row.SS
+    col_spacing = sicd.Grid.Col.SS
+
+    shape = (row_starts.size, col_starts.size)
+    row_measured = numpy.full(shape, numpy.nan, dtype='float64')
+    col_measured = numpy.full(shape, numpy.nan, dtype='float64')
+    total_power = numpy.zeros(shape, dtype='float64')
+    zero_fraction = numpy.zeros(shape, dtype='float64')
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    blocks = [
+        (i, j) for i in range(row_starts.size) for j in range(0, col_starts.size, batch_count)]
+
+    def store(future, i, j):
+        row_cent, col_cent, power, zeros = future.result()
+        row_measured[i, j:j+row_cent.size] = row_cent
+        col_measured[i, j:j+col_cent.size] = col_cent
+        total_power[i, j:j+power.size] = power
+        zero_fraction[i, j:j+zeros.size] = zeros
+
+    def read_block(row_start, col_start, col_end):
+        if read_lock is None:
+            return reader.base_reader[row_start:row_start+row_size, col_start:col_end, reader.index]
+        with read_lock:
+            return reader.base_reader[row_start:row_start+row_size, col_start:col_end, reader.index]
+
+    # NB: the data is read on this thread, since the reader is not necessarily
+    #     thread safe, and at most a couple of blocks per worker are in memory
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for count, (i, j) in enumerate(blocks):
+            if cancel_event is not None and cancel_event.is_set():
+                for future, _, _ in pending:
+                    future.cancel()
+                return None
+            starts = col_starts[j:j+batch_count]
+            row_start = int(row_starts[i])
+            col_start = int(starts[0])
+            data = read_block(row_start, col_start, int(starts[-1])+col_size)
+            stack = numpy.ascontiguousarray(
+                sliding_window_view(data, col_size, axis=1)[:, starts - col_start, :].transpose((1, 0, 2)),
+                dtype='complex64')
+            pending.append(
+                (executor.submit(_batch_centroids, stack, sicd), i, j))
+            del data, stack
+            while len(pending) > 2*workers:
+                store(*pending.pop(0))
+            if progress_callback is not None:
+                progress_callback(float(count + 1)/len(blocks))
+        for entry in pending:
+            store(*entry)
+
+    # windows without signal have no meaningful centroid, and windows straddling
+    # the valid data boundary are biased, since the signal is off center
+    no_signal = (total_power <= 1e-6*numpy.median(total_power)) | (zero_fraction > max_zero_fraction)
+    row_measured[no_signal] = numpy.nan
+    col_measured[no_signal] = numpy.nan
+
+    row_centers = row_starts + 0.5*row_size
+    col_centers = col_starts + 0.5*col_size
+    row_phys, col_phys = get_physical_coordinates(
+        sicd, row_centers[:, numpy.newaxis], col_centers[numpy.newaxis, :])
+    row_phys, col_phys = numpy.broadcast_arrays(row_phys, col_phys)
+    row_predicted = numpy.zeros(shape, dtype='float64') if sicd.Grid.Row.DeltaKCOAPoly is None else \
+        sicd.Grid.Row.DeltaKCOAPoly(row_phys, col_phys)
+    col_predicted = numpy.zeros(shape, dtype='float64') if sicd.Grid.Col.DeltaKCOAPoly is None else \
+        sicd.Grid.Col.DeltaKCOAPoly(row_phys, col_phys)
+
+    return {
+        'window_size': (row_size, col_size),
+        'row_centers': row_centers,
+        'col_centers': col_centers,
+        'row_measured': row_measured,
+        'row_predicted': row_predicted,
+        'row_offset': _wrap(row_measured - row_predicted, row_spacing),
+        'col_measured': col_measured,
+        'col_predicted': col_predicted,
+        'col_offset': _wrap(col_measured - col_predicted, col_spacing)}
+
+
+def decimated_amplitude(reader, max_size=1024, read_lock=None):
+    """
+    Fetch a decimated, log-scaled amplitude image for use as a background.
+
+    Parameters
+    ----------
+    reader : SICDTypeCanvasImageReader
+    max_size : int
+        The maximum size of the decimated image along either dimension.
+    read_lock : None|threading.Lock
+        If provided, this is held while reading.
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    data_size = reader.data_size
+    decimation = max(1, int(numpy.ceil(max(data_size)/float(max_size))))
+    if read_lock is None:
+        data = reader.base_reader[0:data_size[0]:decimation, 0:data_size[1]:decimation, reader.index]
+    else:
+        with read_lock:
+            data = reader.base_reader[0:data_size[0]:decimation, 0:data_size[1]:decimation, reader.index]
+    amplitude = numpy.abs(data)
+    valid = amplitude[amplitude > 0]
+    if valid.size == 0:
+        return amplitude
+    amplitude = 20*numpy.log10(numpy.maximum(amplitude, numpy.amin(valid)))
+    low, high = numpy.percentile(amplitude, [5, 99.5])
+    return numpy.clip(amplitude, low, high)
+
+
+def populate_deltak_figure(fig, result, sicd, background=None, title=None):
+    """
+    Populate the given matplotlib figure with the row and column offset heatmaps,
+    overlaid on the (optional) background image.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+    result : dict
+        As produced by :func:`deltak_consistency_map`.
+    sicd : SICDType
+    background : None|numpy.ndarray
+        The background image, covering the full image extent.
+    title : None|str
+
+    Returns
+    -------
+    numpy.ndarray
+        The array of axes.
+    """
+
+    axs = fig.subplots(nrows=1, ncols=2, squeeze=True)
+    if title is not None:
+        fig.suptitle(title)
+
+    row_centers = result['row_centers']
+    col_centers = result['col_centers']
+    data_size = (sicd.ImageData.NumRows, sicd.ImageData.NumCols)
+
+    def cell_edges(centers, size):
+        # the heatmap cells are bounded halfway between adjacent window centers
+        if centers.size == 1:
+            return 0, size
+        first = max(0., centers[0] - 0.5*(centers[1] - centers[0]))
+        last = min(float(size), centers[-1] + 0.5*(centers[-1] - centers[-2]))
+        return first, last
+
+    row_edges = cell_edges(row_centers, data_size[0])
+    col_edges = cell_edges(col_centers, data_size[1])
+
+    for ax, name, dir_params in zip(axs, ('Row', 'Col'), (sicd.Grid.Row, sicd.Grid.Col)):
+        offset = result['{}_offset'.format(name.lower())]
+        if background is not None:
+            ax.imshow(
+                background, cmap='gray', extent=(0, data_size[1], data_size[0], 0),
+                interpolation='nearest', aspect='auto')
+        limit = numpy.nanmax(numpy.abs(offset)) if numpy.any(numpy.isfinite(offset)) else 0
+        if limit == 0:
+            limit = 0.01*dir_params.ImpRespBW
+        image = ax.imshow(
+            offset, cmap='RdBu_r', vmin=-limit, vmax=limit, alpha=0.6, interpolation='nearest',
+            extent=(col_edges[0], col_edges[1], row_edges[1], row_edges[0]), aspect='auto')
+        ax.set_xlim(0, data_size[1])
+        ax.set_ylim(data_size[0], 0)
+        rms = numpy.sqrt(numpy.nanmean(offset*offset)) if numpy.any(numpy.isfinite(offset)) else numpy.nan
+        ax.set_title('{} measured - predicted DeltaKCOA, rms {:0.3g}'.format(name, rms))
+        ax.set_xlabel('Column (pixels)')
+        ax.set_ylabel('Row (pixels)')
+        fig.colorbar(image, ax=ax, label='cycles/meter')
+    fig.tight_layout()
+    return axs
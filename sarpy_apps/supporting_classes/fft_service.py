@@ -0,0 +1,277 @@
+"""
+Fourier transform service for the frequency support tools.
+
+Requested sizes are rounded up to fast transform lengths, the weighting and
+deweighting arrays are cached per (shape, Grid) pair, and per thread scratch
+buffers are reused, so that repeated local spectrum calculations for similar
+selections avoid reallocation and recalculation.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy
+from scipy import fft as scipy_fft
+
+from sarpy.io.complex.sicd_elements.Grid import DirParamType
+from sarpy.io.complex.sicd_elements.SICD import SICDType
+
+logger = logging.getLogger(__name__)
+
+
+def fast_shape(shape):
+    """
+    Round each entry of the shape up to the next fast transform length.
+
+    Parameters
+    ----------
+    shape : tuple
+
+    Returns
+    -------
+    tuple
+    """
+
+    return tuple(scipy_fft.next_fast_len(int(entry)) for entry in shape)
+
+
+def _fft_direction(dir_params):
+    # this follows sarpy.processing.sicd.fft_base
+    return -1 if dir_params.Sgn is None else dir_params.Sgn
+
+
+def _direction_key(dir_params):
+    # type: (DirParamType) -> tuple
+    weight_key = None
+    if dir_params.WgtType is not None:
+        weight_key = (
+            dir_params.WgtType.WindowName,
+            None if dir_params.WgtType.Parameters is None else
+            tuple(sorted(dir_params.WgtType.Parameters.get_collection().items())))
+    return (
+        dir_params.SS, dir_params.ImpRespBW, weight_key,
+        None if dir_params.WgtFunct is None else numpy.asarray(dir_params.WgtFunct).tobytes())
+
+
+def _weight_function(dir_params):
+    # type: (DirParamType) -> Optional[numpy.ndarray]
+    if dir_params.WgtFunct is not None:
+        return numpy.asarray(dir_params.WgtFunct, dtype='float64')
+    # NB: use a copy, since this may populate WgtFunct
+    return dir_params.copy().define_weight_function(populate=False)
+
+
+def _sampled_weights(size, dir_params):
+    """
+    Sample the weight function on the (shifted) frequency grid for the given size,
+    with zero outside of the impulse response bandwidth.
+    """
+
+    frequencies = (numpy.arange(size) - (size//2))/(size*dir_params.SS)
+    weights = _weight_function(dir_params)
+    half_bandwidth = 0.5*dir_params.ImpRespBW
+    if weights is None:
+        weights = numpy.ones((2, ), dtype='float64')
+    weights = weights/numpy.amax(weights)
+    return numpy.where(
+        numpy.abs(frequencies) <= half_bandwidth,
+        numpy.interp(frequencies, numpy.linspace(-half_bandwidth, half_bandwidth, weights.size), weights),
+        0).astype('float32')
+
+
+class FFTService(object):
+    """
+    Fourier transform service, with caching of weighting arrays and reuse of
+    scratch buffers. This is safe to use from multiple threads.
+    """
+
+    def __init__(self, cache_size=16, workers=None):
+        """
+
+        Parameters
+        ----------
+        cache_size : int
+            The number of (shape, Grid) weighting entries to cache.
+        workers : None|int
+            The number of threads used for each transform, see :func:`scipy.fft.fft`.
+        """
+
+        self._cache_size = int(cache_size)
+        self._workers = workers
+        self._weights = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _cached(self, key, calculate):
+        with self._lock:
+            if key in self._weights:
+                self._weights.move_to_end(key)
+                return self._weights[key]
+        value = calculate()
+        with self._lock:
+            self._weights[key] = value
+            while len(self._weights) > self._cache_size:
+                self._weights.popitem(last=False)
+        return value
+
+    def weighting(self, shape, sicd):
+        """
+        Gets the row and column weighting, sampled on the shifted frequency grid
+        for the given shape, centered at zero frequency.
+
+        Parameters
+        ----------
+        shape : Tuple[int, int]
+        sicd : SICDType
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+        """
+
+        shape = (int(shape[0]), int(shape[1]))
+        key = ('weighting', shape, _direction_key(sicd.Grid.Row), _direction_key(sicd.Grid.Col))
+        return self._cached(
+            key, lambda: (_sampled_weights(shape[0], sicd.Grid.Row), _sampled_weights(shape[1], sicd.Grid.Col)))
+
+    def deweighting(self, shape, sicd, max_gain=10.):
+        """
+        Gets the row and column deweighting, sampled on the shifted frequency grid
+        for the given shape, centered at zero frequency. This is the reciprocal
+        of the weighting inside the impulse response bandwidth, and zero outside.
+
+        Parameters
+        ----------
+        shape : Tuple[int, int]
+        sicd : SICDType
+        max_gain : float
+            The maximum deweighting value, to avoid amplifying noise at the band edges.
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+        """
+
+        def calculate():
+            out = []
+            for weights in self.weighting(shape, sicd):
+                deweights = numpy.zeros(weights.shape, dtype='float32')
+                mask = (weights > 0)
+                deweights[mask] = numpy.minimum(1./weights[mask], max_gain)
+                out.append(deweights)
+            return tuple(out)
+
+        shape = (int(shape[0]), int(shape[1]))
+        key = ('deweighting', shape, float(max_gain), _direction_key(sicd.Grid.Row), _direction_key(sicd.Grid.Col))
+        return self._cached(key, calculate)
+
+    def buffer(self, shape, dtype='complex64'):
+        """
+        Gets the scratch buffer of the given shape and dtype for the current thread.
+        The contents are undefined, and are only valid until the next request
+        from this thread.
+
+        Parameters
+        ----------
+        shape : tuple
+        dtype : str|numpy.dtype
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+
+        key = (tuple(int(entry) for entry in shape), numpy.dtype(dtype).str)
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None or buffers[0] != key:
+            # only the most recent buffer is retained, to bound the memory usage
+            buffers = (key, numpy.empty(key[0], dtype=dtype))
+            self._local.buffers = buffers
+        return buffers[1]
+
+    def fft2_sicd(self, data, sicd, axes=(0, 1), overwrite=False):
+        """
+        Apply the two-dimensional forward transform along the given axes, with the
+        directions determined by the sicd `Grid.Row.Sgn` and `Grid.Col.Sgn`.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+        sicd : SICDType
+        axes : Tuple[int, int]
+            The row and column axes.
+        overwrite : bool
+            May the contents of `data` be destroyed?
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+
+        for axis, dir_params in zip(axes, (sicd.Grid.Row, sicd.Grid.Col)):
+            transform = scipy_fft.fft if _fft_direction(dir_params) < 0 else scipy_fft.ifft
+            data = transform(data, axis=axis, overwrite_x=overwrite, workers=self._workers)
+            overwrite = True  # the intermediate result is ours
+        return data
+
+    def spectrum(self, data, sicd, deweight=False, delta_kcoa=(0., 0.)):
+        """
+        Calculate the shifted spectrum of the given data, zero padded to the next
+        fast size.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The two-dimensional complex data.
+        sicd : SICDType
+        deweight : bool
+            Apply the deweighting?
+        delta_kcoa : Tuple[float, float]
+            The row and column spectral center, which the deweighting is centered on.
+
+        Returns
+        -------
+        numpy.ndarray
+            The shifted spectrum of shape `fast_shape(data.shape)`.
+        """
+
+        shape = fast_shape(data.shape)
+        work = self.buffer(shape, dtype='complex64')
+        work[:data.shape[0], :data.shape[1]] = data
+        work[data.shape[0]:, :] = 0
+        work[:data.shape[0], data.shape[1]:] = 0
+
+        spectrum = scipy_fft.fftshift(self.fft2_sicd(work, sicd, overwrite=True))
+        if deweight:
+            row_deweight, col_deweight = self.deweighting(shape, sicd)
+            # shift the deweighting to the spectral center
+            row_shift = int(round(delta_kcoa[0]*shape[0]*sicd.Grid.Row.SS))
+            col_shift = int(round(delta_kcoa[1]*shape[1]*sicd.Grid.Col.SS))
+            spectrum *= numpy.roll(row_deweight, row_shift)[:, numpy.newaxis]
+            spectrum *= numpy.roll(col_deweight, col_shift)[numpy.newaxis, :]
+        return spectrum
+
+
+_FFT_SERVICE = None  # type: Optional[FFTService]
+_FFT_SERVICE_LOCK = threading.Lock()
+
+
+def get_fft_service():
+    """
+    Gets the shared fft service.
+
+    Returns
+    -------
+    FFTService
+    """
+
+    global _FFT_SERVICE
+    with _FFT_SERVICE_LOCK:
+        if _FFT_SERVICE is None:
+            _FFT_SERVICE = FFTService()
+        return _FFT_SERVICE
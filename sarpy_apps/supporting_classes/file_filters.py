@@ -12,6 +12,7 @@ from tk_builder.file_filters import *
 gff_files = create_filter_entry('GFF Files', '.gff')
 cphd_files = create_filter_entry('CPHD Files', '.cphd')
 crsd_files = create_filter_entry('CRSD Files', '.crsd')
+csv_files = create_filter_entry('CSV Files', '.csv')
 sar_images = ('SAR Images', nitf_files[1] + hdf5_files[1] + tiff_files[1] + gff_files[1] + cphd_files[1] + crsd_files[1])
 
 # filter collection
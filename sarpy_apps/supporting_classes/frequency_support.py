@@ -0,0 +1,207 @@
+"""
+Display independent methods for the frequency support analysis, shared by the
+frequency support tools and the batch weighting analysis.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import logging
+
+import numpy
+
+from sarpy.processing.sicd.fft_base import fft_sicd, fft2_sicd, fftshift
+from sarpy.processing.sicd.normalize_sicd import DeskewCalculator
+
+from sarpy_apps.supporting_classes.scratch import get_scratch_space
+from sarpy_apps.supporting_classes.weighting_metrics import weighting_metrics, \
+    weighting_flags, format_weighting_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def create_deskewed_transform(reader, dimension=0, suffix='.sarpy.cache'):
+    """
+    Performs the Fourier transform of the deskewed entirety of the given
+    ComplexImageReader contents.
+
+    Parameters
+    ----------
+    reader : SICDTypeCanvasImageReader
+        The reader object.
+    dimension : int
+        One of [0, 1], which dimension to deskew along.
+    suffix : None|str
+        The suffix for the created file name.
+
+    Returns
+    -------
+    (str, numpy.ndarray, numpy.ndarray)
+        A file name, numpy memmap of the given object, and mean along the given dimension.
+        The file is registered with the scratch space, and should be released using
+        :func:`sarpy_apps.supporting_classes.scratch.release_scratch_file` when
+        the usage is complete.
+    """
+
+    # set up a true file for the memmap, registered with the scratch space
+    data_size = reader.data_size
+    sicd = reader.get_sicd()
+    file_name, memmap = get_scratch_space().create_memmap(data_size, dtype='complex64', suffix=suffix)
+    calculator = DeskewCalculator(
+        reader.base_reader, dimension=dimension, index=reader.index,
+        apply_deskew=True, apply_deweighting=False, apply_off_axis=False)
+    mean_value = numpy.zeros((data_size[0], ), dtype='float64') if dimension == 0 else \
+        numpy.zeros((data_size[1],), dtype='float64')
+
+    # we'll proceed in blocks of approximately this number of pixels
+    pixels_threshold = 2**20
+    # is our whole reader sufficiently small to just do it all in one fell-swoop?
+    if data_size[0]*data_size[1] <= 4*pixels_threshold:
+        data = fftshift(fft2_sicd(calculator[:, :], sicd))
+        memmap[:, :] = data
+        mean_value[:] = numpy.mean(numpy.abs(data), axis=1-dimension)
+        return file_name, memmap, mean_value
+
+    # fetch full rows, and transform then shift along the row direction
+    block_size = int(numpy.ceil(pixels_threshold/data_size[1]))
+    start_col = 0
+    while start_col < data_size[1]:
+        end_col = min(start_col+block_size, data_size[1])
+        data = fftshift(fft_sicd(calculator[:, start_col:end_col], 0, sicd), axes=0)
+        memmap[:, start_col:end_col] = data
+        if dimension == 0:
+            mean_value += numpy.sum(numpy.abs(data), axis=1)
+        start_col = end_col
+    # fetch full columns, and transform then shift along the column direction
+    block_size = int(numpy.ceil(pixels_threshold/data_size[0]))
+    start_row = 0
+    while start_row < data_size[0]:
+        end_row = min(start_row+block_size, data_size[0])
+        data = fftshift(fft_sicd(memmap[start_row:end_row, :], 1, sicd), axes=1)
+        memmap[start_row:end_row, :] = data
+        if dimension == 1:
+            mean_value += numpy.sum(numpy.abs(data), axis=0)
+        start_row = end_row
+
+    if dimension == 0:
+        mean_value /= data_size[1]
+    else:
+        mean_value /= data_size[0]
+    return file_name, memmap, mean_value
+
+
+def scale_mean_profile(mean_value):
+    """
+    Rescale the mean Fourier transform profile (in place) so that the smoothed
+    maximum value is essentially 1.
+
+    Parameters
+    ----------
+    mean_value : numpy.ndarray
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    if mean_value.size < 200:
+        the_max = numpy.amax(mean_value)
+    else:
+        the_size = int(numpy.ceil(mean_value.size/200.))
+        smoothed = numpy.convolve(
+            mean_value, numpy.full((the_size, ), 1./the_size, dtype='float64'), mode='valid')
+        the_max = numpy.amax(smoothed)
+    mean_value /= the_max
+    return mean_value
+
+
+def analyze_weighting(reader, dimension):
+    """
+    Perform the weighting analysis for the given dimension of the reader. The
+    temporary file used for the deskewed transform is removed before returning.
+
+    Parameters
+    ----------
+    reader : SICDTypeCanvasImageReader
+    dimension : int
+        One of [0, 1].
+
+    Returns
+    -------
+    dict
+        Containing the `scaled_mean`, `derived_weights` and `declared_weights`
+        arrays, and the `metrics` dictionary from :func:`weighting_metrics`.
+    """
+
+    file_name, memmap, mean_value = create_deskewed_transform(reader, dimension=dimension)
+    del memmap
+    get_scratch_space().release(file_name)
+
+    sicd = reader.get_sicd()
+    dir_params = sicd.Grid.Row if dimension == 0 else sicd.Grid.Col
+    declared_weights = None if dir_params.WgtFunct is None else numpy.array(dir_params.WgtFunct, dtype='float64')
+    derived_weights = dir_params.define_weight_function(populate=False)
+    scaled_mean = scale_mean_profile(mean_value)
+    metrics = weighting_metrics(scaled_mean, dir_params, derived_weights=derived_weights)
+    metrics['flags'] = weighting_flags(metrics)
+    return {
+        'scaled_mean': scaled_mean,
+        'derived_weights': derived_weights,
+        'declared_weights': declared_weights,
+        'metrics': metrics}
+
+
+def populate_weights_figure(fig, sicd, scaled_row_mean, derived_row_weights,
+                            scaled_column_mean, derived_column_weights, title=None, metrics=None):
+    """
+    Populate the given matplotlib figure with the weight information plots.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+    sicd : SICDType
+    scaled_row_mean : numpy.ndarray
+    derived_row_weights : None|numpy.ndarray
+    scaled_column_mean : numpy.ndarray
+    derived_column_weights : None|numpy.ndarray
+    title : None|str
+    metrics : None|dict
+        The weighting metrics, of the form `{'Row': <metrics>, 'Col': <metrics>}`,
+        which will be annotated on the respective plots.
+
+    Returns
+    -------
+    numpy.ndarray
+        The array of axes.
+    """
+
+    axs = fig.subplots(nrows=2, ncols=1)
+    if title is not None:
+        fig.suptitle(title)
+
+    for ax, name, dir_params, scaled_mean, derived_weights in zip(
+            axs, ('Row', 'Column'), (sicd.Grid.Row, sicd.Grid.Col),
+            (scaled_row_mean, scaled_column_mean), (derived_row_weights, derived_column_weights)):
+        short_name = name[:3]
+        ax.set_ylabel('{} Information'.format(name))
+        ax.set_xlabel('K{} (cycles/meter)'.format(short_name.lower()))
+        ax.plot(
+            numpy.linspace(-0.5/dir_params.SS, 0.5/dir_params.SS, scaled_mean.size),
+            scaled_mean, 'b', lw=1, label='Observed Data')
+        if derived_weights is not None:
+            ax.plot(
+                numpy.linspace(-0.5*dir_params.ImpRespBW, 0.5*dir_params.ImpRespBW, derived_weights.size),
+                derived_weights, 'g--', lw=3, label='{} Derived Weights'.format(short_name))
+        if dir_params.WgtFunct is not None:
+            ax.plot(
+                numpy.linspace(-0.5*dir_params.ImpRespBW, 0.5*dir_params.ImpRespBW, dir_params.WgtFunct.size),
+                dir_params.WgtFunct, 'r:', lw=3, label='{}.WgtFunct'.format(short_name))
+        ax.set_xlim(min(-0.5/dir_params.SS, -0.5*dir_params.ImpRespBW),
+                    max(0.5/dir_params.SS, 0.5*dir_params.ImpRespBW))
+        ax.legend(loc='upper right')
+        if metrics is not None and short_name in metrics:
+            ax.text(
+                0.01, 0.97, format_weighting_metrics(metrics[short_name]), transform=ax.transAxes,
+                va='top', ha='left', fontsize='small', family='monospace',
+                bbox={'boxstyle': 'round', 'facecolor': 'white', 'alpha': 0.8})
+    return axs
@@ -710,3 +710,177 @@ class DerivedCanvasImageReader(GeneralCanvasImageReader):
             return None, 'NONE'
 
         return sidd.project_image_to_ground_geo(image_coordinates, projection_type='HAE'), 'LLH_HAE'
+
+
+######
+# Phase history magnitude display
+
+class PhaseHistoryCanvasImageReader(CanvasImageReader):
+    """
+    Displays the magnitude of a complex phase history array, linearly scaled to
+    8-bit using the global minimum and maximum. The scaling is only performed
+    for the portion (usually decimated to the canvas resolution) actually requested
+    by the canvas, so no full size display copy is made.
+    """
+
+    __slots__ = ('_data', '_minimum', '_scale')
+
+    def __init__(self, phase_history, flip_columns=False, block_size=2**20):
+        """
+
+        Parameters
+        ----------
+        phase_history : numpy.ndarray
+            The two-dimensional complex phase history array.
+        flip_columns : bool
+            Display with the column order reversed? This is a view, and not a copy.
+        block_size : int
+            The approximate number of pixels in a block, for determining the
+            magnitude range with bounded memory usage.
+        """
+
+        if not isinstance(phase_history, numpy.ndarray) or phase_history.ndim != 2:
+            raise ValueError('phase_history must be a two-dimensional numpy array')
+        self._data = phase_history[:, ::-1] if flip_columns else phase_history
+        self._data_size = phase_history.shape
+
+        minimum = numpy.inf
+        maximum = -numpy.inf
+        block_rows = max(1, int(block_size // max(1, phase_history.shape[1])))
+        for start in range(0, phase_history.shape[0], block_rows):
+            magnitude = self._magnitude(phase_history[start:start+block_rows])
+            minimum = min(minimum, float(magnitude.min()))
+            maximum = max(maximum, float(magnitude.max()))
+        self._minimum = minimum
+        self._scale = 0. if maximum <= minimum else 255./(maximum - minimum)
+
+    @staticmethod
+    def _magnitude(data):
+        # type: (numpy.ndarray) -> numpy.ndarray
+        return numpy.abs(data.astype('complex64', copy=False))
+
+    @property
+    def file_name(self):
+        return None
+
+    @property
+    def remapable(self):
+        return False
+
+    @property
+    def remap_function(self):
+        return None
+
+    @property
+    def image_count(self):
+        return 1
+
+    @property
+    def index(self):
+        return 0
+
+    def __getitem__(self, item):
+        magnitude = self._magnitude(self._data[item])
+        # scale in place, and truncate to uint8
+        numpy.subtract(magnitude, self._minimum, out=magnitude)
+        numpy.multiply(magnitude, self._scale, out=magnitude)
+        numpy.clip(magnitude, 0, 255, out=magnitude)
+        return magnitude.astype('uint8')
+
+
+######
+# CRSD pulse waterfall display
+
+class WaterfallCanvasImageReader(CanvasImageReader):
+    """
+    Displays a pulse waterfall, a two-dimensional power array (usually a
+    memmap) of shape `(pulse count, frequency count)`, in decibels linearly
+    scaled to 8-bit between the given levels. The scaling is only performed for
+    the portion (usually decimated to the canvas resolution) actually requested
+    by the canvas.
+    """
+
+    __slots__ = ('_data', '_low', '_scale')
+
+    def __init__(self, data, levels=None, sample_rows=1024):
+        """
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The two-dimensional power array.
+        levels : None|Tuple[float, float]
+            The display levels in decibels. If `None`, the 1 and 99.9 percentiles
+            over a sample of at most `sample_rows` rows are used.
+        sample_rows : int
+            The maximum number of rows used for determining the default levels.
+        """
+
+        if not isinstance(data, numpy.ndarray) or data.ndim != 2:
+            raise ValueError('data must be a two-dimensional numpy array')
+        self._data = data
+        self._data_size = data.shape
+        self._low = 0.
+        self._scale = 0.
+        if levels is None:
+            step = max(1, int(numpy.ceil(data.shape[0]/float(sample_rows))))
+            levels = numpy.percentile(self._decibels(data[::step]), [1., 99.9])
+        self.set_levels(*levels)
+
+    @staticmethod
+    def _decibels(data):
+        # type: (numpy.ndarray) -> numpy.ndarray
+        values = numpy.maximum(data.astype('float32'), numpy.finfo('float32').tiny)
+        numpy.log10(values, out=values)
+        numpy.multiply(values, 10, out=values)
+        return values
+
+    @property
+    def levels(self):
+        # type: () -> Tuple[float, float]
+        """
+        Tuple[float, float]: The display levels in decibels.
+        """
+
+        return self._low, self._low + (0. if self._scale == 0 else 255./self._scale)
+
+    def set_levels(self, low, high):
+        """
+        Sets the display levels.
+
+        Parameters
+        ----------
+        low : float
+        high : float
+            The decibel values displayed as 0 and 255.
+        """
+
+        self._low = float(low)
+        self._scale = 0. if high <= low else 255./(float(high) - self._low)
+
+    @property
+    def file_name(self):
+        return None
+
+    @property
+    def remapable(self):
+        return False
+
+    @property
+    def remap_function(self):
+        return None
+
+    @property
+    def image_count(self):
+        return 1
+
+    @property
+    def index(self):
+        return 0
+
+    def __getitem__(self, item):
+        values = self._decibels(self._data[item])
+        numpy.subtract(values, self._low, out=values)
+        numpy.multiply(values, self._scale, out=values)
+        numpy.clip(values, 0, 255, out=values)
+        return values.astype('uint8')
@@ -0,0 +1,380 @@
+"""
+Display independent scan of every pulse of every channel of CRSD files for
+interference (RFI) and other anomalies.
+
+Each pulse is characterized by metrics of its spectrogram, calculated from the
+received samples at the channel sampling rate `Fs`:
+
+* `spectral_kurtosis` - the maximum over frequency of the absolute spectral
+  kurtosis, which is zero for Gaussian noise, and departs from zero for
+  intermittent or impulsive (positive) and continuous wave (negative) signals.
+* `peak_to_median` - the ratio (in dB) of the peak to the median of the time
+  averaged power spectrum, which is large for narrow band interference.
+* `out_of_band` - the fraction of the power outside the instantaneous bandwidth
+  `BWInst`, centered in the sampled band about the channel `F0Ref`.
+
+The metrics are compared with the channel as a whole using robust (median and
+median absolute deviation) scores, and the pulses scoring above the threshold
+are ranked as suspects.
+
+The scan is split into tasks of contiguous pulses, which are evaluated by a
+process pool, so that it scales with the number of cores.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import csv
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy
+
+from sarpy.io.general.base import SarpyIOError
+from sarpy.io.received.converter import open_received
+
+from sarpy_apps.supporting_classes.crsd_pulses import batch_stft
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_METRICS = ('spectral_kurtosis', 'peak_to_median', 'out_of_band')
+DEFAULT_THRESHOLD = 6.
+_CSV_FIELDS = ('rank', 'file_name', 'channel', 'index', 'pulse', 'score', 'metric') + \
+    ANOMALY_METRICS + ('peak_offset', )
+
+
+def pulse_metrics(pulse_data, sampling_rate, bandwidth=None, workers=None):
+    """
+    Calculate the anomaly metrics for each of the pulses.
+
+    Parameters
+    ----------
+    pulse_data : numpy.ndarray
+        Of shape `(pulse count, sample count)`.
+    sampling_rate : float
+        The channel `Fs`.
+    bandwidth : None|float
+        The channel instantaneous bandwidth `BWInst`. If `None`, or not less
+        than the sampling rate, then the out of band fraction is zero.
+    workers : None|int
+        The number of workers for the transforms.
+
+    Returns
+    -------
+    Dict[str, numpy.ndarray]
+        The array of each of `ANOMALY_METRICS`, and the `peak_offset` array of
+        the frequency of the power spectrum peak relative to the center of the
+        sampled band.
+    """
+
+    _, frequencies, spectrograms = batch_stft(pulse_data, sampling_rate, workers=workers)
+    power = numpy.mean(spectrograms, axis=2, dtype='float64')
+    second_moment = numpy.mean(numpy.square(spectrograms, dtype='float64'), axis=2)
+    del spectrograms
+
+    tiny = numpy.finfo('float64').tiny
+    # for complex Gaussian noise, the power is exponentially distributed, and
+    # the second moment is twice the squared mean
+    kurtosis = second_moment/numpy.maximum(power*power, tiny) - 2
+    kurtosis[power <= tiny] = 0
+
+    median = numpy.median(power, axis=1)
+    peak_bin = numpy.argmax(power, axis=1)
+    peak = power[numpy.arange(power.shape[0]), peak_bin]
+    total = numpy.sum(power, axis=1)
+    if bandwidth is None or bandwidth >= sampling_rate:
+        out_of_band = numpy.zeros(power.shape[0], dtype='float64')
+    else:
+        outside = numpy.abs(frequencies) > 0.5*bandwidth
+        out_of_band = numpy.sum(power[:, outside], axis=1)/numpy.maximum(total, tiny)
+    return {
+        'spectral_kurtosis': numpy.max(numpy.abs(kurtosis), axis=1),
+        'peak_to_median': 10*numpy.log10(numpy.maximum(peak, tiny)/numpy.maximum(median, tiny)),
+        'out_of_band': out_of_band,
+        'peak_offset': frequencies[peak_bin].astype('float64')}
+
+
+def channel_pulse_metrics(reader, index, start=0, end=None, chunk_size=64, workers=None,
+                          cancel_event=None):
+    """
+    Calculate the anomaly metrics for the given range of pulses of the channel,
+    reading a chunk of pulses at a time.
+
+    Parameters
+    ----------
+    reader : sarpy.io.received.base.CRSDTypeReader
+    index : int
+        The channel index.
+    start : int
+    end : None|int
+        `None` for the end of the channel.
+    chunk_size : int
+    workers : None|int
+        The number of workers for the transforms.
+    cancel_event : None|threading.Event
+        The calculation is abandoned when this is set.
+
+    Returns
+    -------
+    None|Dict[str, numpy.ndarray]
+        `None` if cancelled, otherwise as from :func:`pulse_metrics`.
+    """
+
+    params = reader.crsd_meta.Channel.Parameters[index]
+    pulse_count = reader.get_data_size_as_tuple()[index][0]
+    end = pulse_count if end is None else min(int(end), pulse_count)
+    chunk_size = max(1, int(chunk_size))
+    results = []
+    for chunk_start in range(int(start), end, chunk_size):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        pulse_data = reader.read(
+            slice(chunk_start, min(chunk_start + chunk_size, end)), slice(None), index=index, squeeze=False)
+        results.append(pulse_metrics(pulse_data, params.Fs, bandwidth=params.BWInst, workers=workers))
+    return {key: numpy.concatenate([entry[key] for entry in results]) for key in results[0]}
+
+
+def robust_scores(metrics):
+    """
+    Score each pulse against the channel, as the largest (one sided) robust
+    z-score over the metrics, using the median and the scaled median absolute
+    deviation.
+
+    Parameters
+    ----------
+    metrics : Dict[str, numpy.ndarray]
+        As from :func:`channel_pulse_metrics`.
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray, dict)
+        The score for each pulse, the index into `ANOMALY_METRICS` of the metric
+        providing the score, and the `median` and `scale` for each metric.
+    """
+
+    z_scores = []
+    statistics = {}
+    for name in ANOMALY_METRICS:
+        values = metrics[name]
+        median = float(numpy.median(values))
+        scale = 1.4826*float(numpy.median(numpy.abs(values - median)))
+        if scale <= 0:
+            # a constant metric, so any departure is notable
+            scale = max(1e-6*abs(median), 1e-12)
+        statistics[name] = {'median': median, 'scale': scale}
+        z_scores.append((values - median)/scale)
+    z_scores = numpy.stack(z_scores, axis=1)
+    return numpy.max(z_scores, axis=1), numpy.argmax(z_scores, axis=1), statistics
+
+
+@lru_cache(maxsize=4)
+def _open_reader(file_name):
+    # the reader is reused by the tasks evaluated in the same worker process
+    return open_received(file_name)
+
+
+def _scan_task(file_name, index, start, end, chunk_size):
+    return channel_pulse_metrics(_open_reader(file_name), index, start=start, end=end, chunk_size=chunk_size)
+
+
+def _channel_result(file_name, index, identifier, metrics, threshold):
+    scores, metric_indices, statistics = robust_scores(metrics)
+    suspects = []
+    for pulse in numpy.flatnonzero(scores >= threshold):
+        record = {
+            'file_name': file_name, 'channel': identifier, 'index': index, 'pulse': int(pulse),
+            'score': float(scores[pulse]), 'metric': ANOMALY_METRICS[metric_indices[pulse]]}
+        for name in ANOMALY_METRICS + ('peak_offset', ):
+            record[name] = float(metrics[name][pulse])
+        suspects.append(record)
+    channel = {
+        'index': index, 'identifier': identifier, 'pulse_count': int(scores.size),
+        'suspect_count': len(suspects), 'statistics': statistics}
+    return channel, suspects
+
+
+def scan_anomalies(file_names, threshold=DEFAULT_THRESHOLD, workers=None, task_pulses=1024,
+                   chunk_size=64, mp_context=None, progress_callback=None, cancel_event=None):
+    """
+    Scan every pulse of every channel of the given CRSD files for anomalies,
+    using a process pool.
+
+    Parameters
+    ----------
+    file_names : Sequence[str]
+    threshold : float
+        The robust score above which a pulse is a suspect.
+    workers : None|int
+        The number of worker processes. `None` will use all available cores.
+    task_pulses : int
+        The number of pulses in each task.
+    chunk_size : int
+        The number of pulses read at once within a task.
+    mp_context : None|multiprocessing.context.BaseContext
+        The multiprocessing context for the process pool. Applications with a
+        display should use the `spawn` context.
+    progress_callback : None|Callable
+        Called with the fraction complete after each task.
+    cancel_event : None|threading.Event
+        The scan is abandoned when this is set.
+
+    Returns
+    -------
+    None|List[dict]
+        `None` if cancelled, otherwise one json compatible record per file, with
+        the `file_name`, `status`, `message`, `channels` summaries and the
+        `suspects` ranked by decreasing score.
+    """
+
+    results = []
+    tasks = []
+    channels = {}
+    for file_name in file_names:
+        result = {'file_name': file_name, 'status': 'success', 'message': '', 'channels': [], 'suspects': []}
+        results.append(result)
+        try:
+            reader = open_received(file_name)
+        except SarpyIOError as e:
+            result['status'] = 'skipped'
+            result['message'] = str(e)
+            continue
+        for index, data_size in enumerate(reader.get_data_size_as_tuple()):
+            identifier = reader.crsd_meta.Channel.Parameters[index].Identifier
+            channels[(file_name, index)] = (identifier, {})
+            for start in range(0, data_size[0], task_pulses):
+                tasks.append((file_name, index, start, min(start + task_pulses, data_size[0])))
+        del reader
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(int(workers), len(tasks)))
+    failures = {}
+    if len(tasks) > 0:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+            futures = {
+                executor.submit(_scan_task, file_name, index, start, end, chunk_size): (file_name, index, start)
+                for file_name, index, start, end in tasks}
+            for count, future in enumerate(as_completed(futures)):
+                if cancel_event is not None and cancel_event.is_set():
+                    for entry in futures:
+                        entry.cancel()
+                    return None
+                file_name, index, start = futures[future]
+                try:
+                    channels[(file_name, index)][1][start] = future.result()
+                except Exception as e:
+                    logger.exception('Scanning file {}, channel index {} failed'.format(file_name, index))
+                    failures[file_name] = str(e)
+                if progress_callback is not None:
+                    progress_callback(float(count + 1)/len(tasks))
+
+    for result in results:
+        file_name = result['file_name']
+        if result['status'] != 'success':
+            continue
+        if file_name in failures:
+            result['status'] = 'failed'
+            result['message'] = failures[file_name]
+            continue
+        index = 0
+        while (file_name, index) in channels:
+            identifier, pieces = channels[(file_name, index)]
+            if len(pieces) > 0:
+                metrics = {
+                    key: numpy.concatenate([pieces[start][key] for start in sorted(pieces)])
+                    for key in pieces[min(pieces)]}
+                channel, suspects = _channel_result(file_name, index, identifier, metrics, threshold)
+                result['channels'].append(channel)
+                result['suspects'].extend(suspects)
+            index += 1
+        result['suspects'].sort(key=lambda x: -x['score'])
+        logger.info('{}: {} suspect pulses'.format(file_name, len(result['suspects'])))
+    return results
+
+
+def ranked_suspects(results):
+    """
+    Gets the suspect pulses over all files, ranked by decreasing score.
+
+    Parameters
+    ----------
+    results : List[dict]
+        As from :func:`scan_anomalies`.
+
+    Returns
+    -------
+    List[dict]
+    """
+
+    suspects = [entry for result in results for entry in result.get('suspects', [])]
+    suspects.sort(key=lambda x: -x['score'])
+    return suspects
+
+
+def write_anomaly_results(results, output_directory, stem='pulse_anomalies'):
+    """
+    Write the scan results to json and csv files in the given directory. The
+    json file contains the full results, and the csv file the suspect pulses
+    over all files, ranked by decreasing score.
+
+    Parameters
+    ----------
+    results : List[dict]
+        As from :func:`scan_anomalies`.
+    output_directory : str
+    stem : str
+        The file name stem for the output files.
+
+    Returns
+    -------
+    (str, str)
+        The json and csv file names.
+    """
+
+    json_file = os.path.join(output_directory, '{}.json'.format(stem))
+    with open(json_file, 'w') as fi:
+        json.dump(results, fi, indent=1)
+
+    csv_file = os.path.join(output_directory, '{}.csv'.format(stem))
+    with open(csv_file, 'w', newline='') as fi:
+        writer = csv.DictWriter(fi, fieldnames=_CSV_FIELDS)
+        writer.writeheader()
+        for rank, record in enumerate(ranked_suspects(results)):
+            writer.writerow(dict(rank=rank + 1, **record))
+    return json_file, csv_file
+
+
+def load_anomaly_results(file_name):
+    """
+    Load the suspect pulses from a json or csv file written by
+    :func:`write_anomaly_results`.
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    List[dict]
+        The suspect pulses, ranked by decreasing score.
+    """
+
+    if os.path.splitext(file_name)[1].lower() == '.csv':
+        suspects = []
+        with open(file_name, 'r', newline='') as fi:
+            for row in csv.DictReader(fi):
+                record = {key: row[key] for key in ('file_name', 'channel', 'metric')}
+                record['index'] = int(row['index'])
+                record['pulse'] = int(row['pulse'])
+                for key in ('score', 'peak_offset') + ANOMALY_METRICS:
+                    record[key] = float(row[key])
+                suspects.append(record)
+        suspects.sort(key=lambda x: -x['score'])
+        return suspects
+
+    with open(file_name, 'r') as fi:
+        return ranked_suspects(json.load(fi))
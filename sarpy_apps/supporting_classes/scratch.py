@@ -0,0 +1,412 @@
+"""
+Management of the scratch (temporary file) space used by the tools, primarily
+for numpy memmap objects too large to be comfortably held in memory.
+
+Each process uses its own uniquely named subdirectory of the scratch root
+directory, identifying the host and process, which contains a lock file held
+exclusively locked for the lifetime of the process. The subdirectories whose lock
+is not held by any process (i.e. those of processes which crashed or were killed)
+are removed the first time that the scratch space is used in a new process. As
+this relies only on the file lock, the scratch root directory can be shared
+between hosts, provided that the file system supports locking.
+
+The scratch root directory defaults to a subdirectory of the system temporary
+directory, and can be set with the `SARPY_APPS_SCRATCH` environment variable.
+A quota (in bytes) can be set using the `SARPY_APPS_SCRATCH_QUOTA` environment
+variable.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import atexit
+import errno
+import logging
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+from tempfile import gettempdir, mkdtemp, mkstemp
+from typing import Optional, Union
+
+import numpy
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_ROOT_VARIABLE = 'SARPY_APPS_SCRATCH'
+SCRATCH_QUOTA_VARIABLE = 'SARPY_APPS_SCRATCH_QUOTA'
+_PROCESS_PREFIX = 'process_'
+_LOCK_FILE = '.lock'
+# a directory without a locked lock file is not considered stale this soon after
+# its creation, since the lock file may not yet have been created and locked
+_STALE_GRACE_SECONDS = 60
+
+
+def _host_name():
+    # type: () -> str
+    return re.sub(r'[^A-Za-z0-9.-]', '-', socket.gethostname() or 'localhost')
+
+
+def _try_lock(handle):
+    """
+    Try to take an exclusive lock on the given open file, without blocking.
+
+    Parameters
+    ----------
+    handle
+        The file object, opened for writing.
+
+    Returns
+    -------
+    bool
+        Was the lock taken?
+    """
+
+    try:
+        if os.name == 'nt':
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(handle):
+    try:
+        if os.name == 'nt':
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass
+
+
+def _is_recent(path):
+    try:
+        return time.time() - os.path.getmtime(path) < _STALE_GRACE_SECONDS
+    except OSError:
+        return False
+
+
+def _remove_if_stale(directory):
+    """
+    Remove the given process subdirectory, if no process holds the lock on its
+    lock file. The owning process writes to the lock file only once it holds the
+    lock, so an empty lock file may just not yet be locked.
+
+    Parameters
+    ----------
+    directory : str
+
+    Returns
+    -------
+    bool
+        Was the directory removed?
+    """
+
+    lock_file = os.path.join(directory, _LOCK_FILE)
+    try:
+        handle = os.fdopen(os.open(lock_file, os.O_RDWR), 'r+b')
+    except FileNotFoundError:
+        if _is_recent(directory):
+            return False
+        # the process ended before creating its lock file
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+    except OSError:
+        return False
+
+    try:
+        if not _try_lock(handle):
+            return False
+        if os.fstat(handle.fileno()).st_size == 0 and _is_recent(lock_file):
+            _unlock(handle)
+            return False
+        if os.name == 'nt':
+            # an open file cannot be removed on Windows
+            _unlock(handle)
+            handle.close()
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+    finally:
+        handle.close()
+
+
+class ScratchSpace(object):
+    """
+    Scratch space manager, which hands out registered memmap files so that they
+    can be deterministically released.
+    """
+
+    def __init__(self, root=None, quota=None):
+        """
+
+        Parameters
+        ----------
+        root : None|str
+            The scratch root directory. If `None`, then the `SARPY_APPS_SCRATCH`
+            environment variable will be used, if set, otherwise a subdirectory of
+            the system temporary directory.
+        quota : None|int
+            The maximum number of bytes in use by this process. If `None`, then
+            the `SARPY_APPS_SCRATCH_QUOTA` environment variable will be used, if
+            set, otherwise only the available disk space is enforced.
+        """
+
+        if root is None:
+            root = os.environ.get(SCRATCH_ROOT_VARIABLE, None)
+        if root is None:
+            root = os.path.join(gettempdir(), 'sarpy_apps_scratch')
+        if quota is None and os.environ.get(SCRATCH_QUOTA_VARIABLE, '') != '':
+            quota = int(os.environ[SCRATCH_QUOTA_VARIABLE])
+
+        self._root = os.path.abspath(os.path.expanduser(root))
+        self._quota = quota
+        self._pid = os.getpid()
+        self._directory = None  # type: Optional[str]
+        self._lock_handle = None
+        self._files = {}
+        self._lock = threading.RLock()
+
+    @property
+    def root(self):
+        # type: () -> str
+        """
+        str: The scratch root directory.
+        """
+
+        return self._root
+
+    @property
+    def pid(self):
+        # type: () -> int
+        """
+        int: The process to which this scratch space belongs.
+        """
+
+        return self._pid
+
+    @property
+    def directory(self):
+        # type: () -> Optional[str]
+        """
+        None|str: The scratch directory for this process, which is created on first use.
+        """
+
+        return self._directory
+
+    @property
+    def quota(self):
+        # type: () -> Optional[int]
+        """
+        None|int: The maximum number of bytes in use by this process.
+        """
+
+        return self._quota
+
+    @property
+    def used_bytes(self):
+        # type: () -> int
+        """
+        int: The number of bytes in the currently registered files.
+        """
+
+        with self._lock:
+            return int(sum(self._files.values()))
+
+    def _ensure_directory(self):
+        if self._pid != os.getpid():
+            raise ValueError(
+                'This scratch space belongs to process {}, and cannot be used '
+                'in process {}'.format(self._pid, os.getpid()))
+        if self._lock_handle is not None:
+            return
+        os.makedirs(self._root, exist_ok=True)
+        host_name = _host_name()
+        directory = mkdtemp(prefix='{}{}_{}_'.format(_PROCESS_PREFIX, host_name, self._pid), dir=self._root)
+        lock_handle = open(os.path.join(directory, _LOCK_FILE), 'w+b')
+        for attempt in range(20):
+            # another process checking for staleness may briefly hold the lock
+            if _try_lock(lock_handle):
+                break
+            time.sleep(0.05)
+        else:
+            lock_handle.close()
+            shutil.rmtree(directory, ignore_errors=True)
+            raise OSError(errno.ENOLCK, 'Failed locking the scratch directory {}'.format(directory))
+        lock_handle.write('{} {}'.format(host_name, self._pid).encode('utf-8'))
+        lock_handle.flush()
+        self._directory = directory
+        self._lock_handle = lock_handle
+
+    def clean_stale(self):
+        """
+        Remove the scratch directories of any processes which are no longer running,
+        on any host, determined by whether the lock of the directory is held.
+
+        Returns
+        -------
+        int
+            The number of directories removed.
+        """
+
+        if not os.path.isdir(self._root):
+            return 0
+
+        count = 0
+        for entry in os.listdir(self._root):
+            if not entry.startswith(_PROCESS_PREFIX):
+                continue
+            directory = os.path.join(self._root, entry)
+            if directory == self._directory or not os.path.isdir(directory):
+                continue
+            if _remove_if_stale(directory):
+                logger.info('Removed stale scratch directory {}'.format(directory))
+                count += 1
+        return count
+
+    def _check_space(self, size):
+        if self._quota is not None and self.used_bytes + size > self._quota:
+            raise OSError(
+                errno.ENOSPC,
+                'Requested scratch file of {} bytes would exceed the scratch quota of {} bytes, '
+                'with {} bytes in use'.format(size, self._quota, self.used_bytes))
+        free = shutil.disk_usage(self._directory).free
+        if size > free:
+            raise OSError(
+                errno.ENOSPC,
+                'Requested scratch file of {} bytes, but only {} bytes are available '
+                'in {}'.format(size, free, self._directory))
+
+    def create_memmap(self, shape, dtype='complex64', suffix='.sarpy.cache'):
+        """
+        Create a registered memmap in the scratch directory for this process.
+
+        Parameters
+        ----------
+        shape : tuple
+        dtype : str|numpy.dtype
+        suffix : str
+
+        Returns
+        -------
+        (str, numpy.memmap)
+            The file name and the memmap. The file should be released using
+            :meth:`release` once the memmap is no longer in use.
+        """
+
+        size = int(numpy.prod(shape))*numpy.dtype(dtype).itemsize
+        with self._lock:
+            self._ensure_directory()
+            self._check_space(size)
+            file_descriptor, file_name = mkstemp(suffix=suffix, dir=self._directory)
+            os.close(file_descriptor)
+            self._files[file_name] = size
+        logger.debug('Creating scratch file {} of {} bytes'.format(file_name, size))
+        return file_name, numpy.memmap(file_name, dtype=dtype, mode='w+', offset=0, shape=shape)
+
+    def release(self, file_name):
+        """
+        Release the given scratch file, deleting it. Any references to the associated
+        memmap should be dropped before this is called.
+
+        Parameters
+        ----------
+        file_name : None|str|numpy.memmap
+
+        Returns
+        -------
+        None
+        """
+
+        if file_name is None:
+            return
+        if isinstance(file_name, numpy.memmap):
+            file_name = file_name.filename
+        with self._lock:
+            self._files.pop(file_name, None)
+        try:
+            os.remove(file_name)
+            logger.debug('Removing scratch file {}'.format(file_name))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # likely still open on Windows, it will be removed when the process exits
+            logger.warning('Failed removing scratch file {}'.format(file_name))
+
+    def release_all(self):
+        """
+        Release all registered scratch files.
+        """
+
+        with self._lock:
+            file_names = list(self._files.keys())
+        for file_name in file_names:
+            self.release(file_name)
+
+    def close(self):
+        """
+        Release all scratch files and remove the scratch directory for this process.
+        """
+
+        if self._pid != os.getpid():
+            return  # this belongs to the parent of a forked process
+        self.release_all()
+        with self._lock:
+            if self._lock_handle is not None:
+                if os.name == 'nt':
+                    # an open file cannot be removed on Windows
+                    self._lock_handle.close()
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._lock_handle.close()
+                self._lock_handle = None
+                self._directory = None
+
+
+_SCRATCH_SPACE = None  # type: Optional[ScratchSpace]
+_SCRATCH_LOCK = threading.Lock()
+
+
+def get_scratch_space():
+    """
+    Gets the scratch space for this process. On first use, the stale scratch
+    directories are removed, and cleanup at exit is registered.
+
+    Returns
+    -------
+    ScratchSpace
+    """
+
+    global _SCRATCH_SPACE
+    with _SCRATCH_LOCK:
+        if _SCRATCH_SPACE is None or _SCRATCH_SPACE.pid != os.getpid():
+            # NB: a forked process must not share the scratch space of its parent
+            _SCRATCH_SPACE = ScratchSpace()
+            _SCRATCH_SPACE.clean_stale()
+            atexit.register(_SCRATCH_SPACE.close)
+        return _SCRATCH_SPACE
+
+
+def release_scratch_file(file_name):
+    # type: (Union[None, str, numpy.memmap]) -> None
+    """
+    Release the given scratch file from the scratch space for this process.
+
+    Parameters
+    ----------
+    file_name : None|str|numpy.memmap
+    """
+
+    if file_name is None:
+        return
+    get_scratch_space().release(file_name)
@@ -0,0 +1,1134 @@
+"""
+Sub-aperture frame geometry and rendering for the aperture tool animation.
+
+The animation frames are defined as rectangles in the (displayed) phase history
+image coordinates, and each frame is the remapped inverse transform of the
+phase history restricted to its rectangle. The frames are computed on a pool
+of worker threads from a snapshot of the phase history, so that the animation
+can be played back or stepped through as cache lookups.
+
+The :class:`SubapertureProcessor` provides the sub-aperture processing for a
+region of a SICD type image without any display, returning the frames and their
+aperture bounds and resolutions for a schedule of frame rectangles. The frames
+can also be written as a three-dimensional datacube (npy or raw memmap file),
+with the frame information in a json sidecar file.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy
+
+from sarpy.io.complex.base import SICDTypeReader
+from sarpy.io.complex.converter import open_complex
+from sarpy.io.complex.sicd_elements.SICD import SICDType
+from sarpy.processing.sicd.fft_base import ifft2_sicd
+from sarpy.processing.sicd.subaperture import ApertureFilter
+
+logger = logging.getLogger(__name__)
+
+ANIMATION_MODES = (
+    'slow_time', 'fast_time', 'aperture_percent', 'full_range_bandwidth', 'full_az_bandwidth')
+
+
+def phase_history_bounds(sicd, shape):
+    """
+    Gets the bounds of the populated portion of the phase history image, based
+    on the `Grid` `ImpRespBW` and `SS` parameters.
+
+    Parameters
+    ----------
+    sicd : SICDType
+    shape : Tuple[int, int]
+        The phase history shape.
+
+    Returns
+    -------
+    Tuple[int, int, int, int]
+        Of the form `(row start, column start, row end, column end)`.
+    """
+
+    row_ratio = sicd.Grid.Row.ImpRespBW*sicd.Grid.Row.SS
+    col_ratio = sicd.Grid.Col.ImpRespBW*sicd.Grid.Col.SS
+
+    row_start = int(shape[0]*(1 - row_ratio)/2)
+    col_start = int(shape[1]*(1 - col_ratio)/2)
+    return row_start, col_start, shape[0] - row_start, shape[1] - col_start
+
+
+def animation_frame_rects(bounds, mode, n_frames, aperture_fraction=0.25,
+                          min_aperture_percent=0.1, max_aperture_percent=1.0):
+    """
+    Gets the phase history rectangle for each animation frame.
+
+    Parameters
+    ----------
+    bounds : Tuple[int, int, int, int]
+        The phase history bounds, as from :func:`phase_history_bounds`.
+    mode : str
+        One of `ANIMATION_MODES`.
+    n_frames : int
+    aperture_fraction : float
+        The fraction of the aperture for the `slow_time` and `fast_time` modes.
+    min_aperture_percent : float
+        The final aperture fraction for the other modes.
+    max_aperture_percent : float
+        The initial aperture fraction for the other modes.
+
+    Returns
+    -------
+    numpy.ndarray
+        Of shape `(n_frames, 4)`, with entries of the form
+        `(row min, column min, row max, column max)`.
+    """
+
+    if mode not in ANIMATION_MODES:
+        raise ValueError('mode must be one of {}, got {}'.format(ANIMATION_MODES, mode))
+    n_frames = int(n_frames)
+    if n_frames < 1:
+        raise ValueError('n_frames must be positive, got {}'.format(n_frames))
+
+    row_start, col_start, row_end, col_end = [float(entry) for entry in bounds]
+    full_rows = row_end - row_start
+    full_cols = col_end - col_start
+    rects = numpy.empty((n_frames, 4), dtype='float64')
+
+    if mode == 'slow_time':
+        aperture_distance = full_cols*aperture_fraction
+        starts = numpy.linspace(col_start, col_end - aperture_distance, n_frames)
+        rects[:, 0] = row_start
+        rects[:, 1] = starts
+        rects[:, 2] = row_end
+        rects[:, 3] = starts + aperture_distance
+    elif mode == 'fast_time':
+        aperture_distance = full_rows*aperture_fraction
+        starts = numpy.flip(numpy.linspace(row_start, row_end - aperture_distance, n_frames))
+        rects[:, 0] = starts
+        rects[:, 1] = col_start
+        rects[:, 2] = starts + aperture_distance
+        rects[:, 3] = col_end
+    else:
+        mid_row = 0.5*(row_start + row_end)
+        mid_col = 0.5*(col_start + col_end)
+        row_widths = 0.5*full_rows*numpy.linspace(max_aperture_percent, min_aperture_percent, n_frames)
+        col_widths = 0.5*full_cols*numpy.linspace(max_aperture_percent, min_aperture_percent, n_frames)
+        if mode == 'full_range_bandwidth':
+            rects[:, 0] = row_start
+            rects[:, 2] = row_end
+        else:
+            rects[:, 0] = mid_row - row_widths
+            rects[:, 2] = mid_row + row_widths
+        if mode == 'full_az_bandwidth':
+            rects[:, 1] = col_start
+            rects[:, 3] = col_end
+        else:
+            rects[:, 1] = mid_col - col_widths
+            rects[:, 3] = mid_col + col_widths
+    return rects
+
+
+def rect_slices(rect):
+    """
+    Gets the phase history slices for the given rectangle.
+
+    Parameters
+    ----------
+    rect : Tuple[float, float, float, float]
+        Of the form `(row, column, row, column)`.
+
+    Returns
+    -------
+    None|Tuple[slice, slice]
+        `None` if the rectangle is empty.
+    """
+
+    y_min = int(min(rect[0::2]))
+    y_max = int(max(rect[0::2]))
+    x_min = int(min(rect[1::2]))
+    x_max = int(max(rect[1::2]))
+    if y_min == y_max or x_min == x_max:
+        return None
+    return slice(y_min, y_max), slice(x_min, x_max)
+
+
+def filtered_image(phase_history, sicd, rect):
+    """
+    Gets the complex image formed from the portion of the phase history inside
+    the given rectangle. This is equivalent to the `ApertureFilter` evaluation.
+
+    Parameters
+    ----------
+    phase_history : numpy.ndarray
+        The normalized phase history.
+    sicd : SICDType
+    rect : Tuple[float, float, float, float]
+
+    Returns
+    -------
+    None|numpy.ndarray
+    """
+
+    slices = rect_slices(rect)
+    if phase_history is None or slices is None:
+        return None
+    filtered = numpy.zeros(phase_history.shape, dtype='complex64')
+    filtered[slices] = phase_history[slices]
+    return ifft2_sicd(filtered, sicd)
+
+
+def _render_frame(phase_history, sicd, rect, remap_function):
+    data = filtered_image(phase_history, sicd, rect)
+    return None if data is None else remap_function(data)
+
+
+def render_frames(phase_history, sicd, rects, remap_function=None, workers=None, max_pending=None):
+    """
+    Compute the frames on a pool of worker threads, yielding them in order.
+    At most `max_pending` frames are computed ahead of the consumer, so that
+    the memory usage is bounded, regardless of the number of frames.
+
+    Parameters
+    ----------
+    phase_history : numpy.ndarray
+    sicd : SICDType
+    rects : numpy.ndarray
+        As from :func:`animation_frame_rects`.
+    remap_function : None|Callable
+        If `None`, then the complex frames are yielded.
+    workers : None|int
+        The number of worker threads. `None` uses the number of cores.
+    max_pending : None|int
+        The maximum number of frames computed ahead. `None` uses twice the
+        number of workers.
+
+    Yields
+    ------
+    (int, None|numpy.ndarray)
+        The frame index and frame.
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2*workers
+    max_pending = max(1, int(max_pending))
+    function = filtered_image if remap_function is None else \
+        lambda *args: _render_frame(*args, remap_function)
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sarpy_apps_render') as executor:
+        try:
+            for index, rect in enumerate(rects):
+                pending.append(executor.submit(function, phase_history, sicd, rect))
+                if len(pending) >= max_pending:
+                    yield index + 1 - len(pending), pending.pop(0).result()
+            first = len(rects) - len(pending)
+            for count, future in enumerate(pending):
+                yield first + count, future.result()
+            pending = []
+        finally:
+            # if the consumer stopped early, then drop the remaining frames
+            for future in pending:
+                future.cancel()
+
+
+class FrameRenderer(object):
+    """
+    Computes the animation frames on a pool of worker threads, and caches them
+    until the phase history, frame rectangles, or remap function change.
+    """
+
+    def __init__(self, max_workers=None, name='sarpy_apps_frames'):
+        """
+
+        Parameters
+        ----------
+        max_workers : None|int
+            The number of worker threads. `None` uses the number of cores.
+        name : str
+            The thread name prefix.
+        """
+
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._sources = None  # type: Optional[tuple]
+        self._rects = None  # type: Optional[numpy.ndarray]
+        self._futures = []  # type: List[Future]
+
+    @property
+    def frame_count(self):
+        # type: () -> int
+        """
+        int: The number of frames being rendered.
+        """
+
+        return len(self._futures)
+
+    @property
+    def rects(self):
+        # type: () -> Optional[numpy.ndarray]
+        """
+        None|numpy.ndarray: The frame rectangles being rendered.
+        """
+
+        return self._rects
+
+    def invalidate(self):
+        """
+        Discard all rendered and pending frames.
+        """
+
+        for future in self._futures:
+            # this does nothing if it is already running, and the result is just dropped
+            future.cancel()
+        self._futures = []
+        self._rects = None
+        self._sources = None
+
+    def render(self, phase_history, sicd, rects, remap_function, order=None):
+        """
+        Start rendering the frames, unless these frames are already rendered
+        or pending. The phase history is assumed to be replaced, and not modified
+        in place, when the selection or the filter options change.
+
+        Parameters
+        ----------
+        phase_history : numpy.ndarray
+        sicd : SICDType
+        rects : numpy.ndarray
+            As from :func:`animation_frame_rects`.
+        remap_function : Callable
+        order : None|Sequence[int]
+            The order in which to render the frames, so that the frames which
+            will be displayed first are available first. This has no effect if
+            these frames are already rendered or pending.
+        """
+
+        rects = numpy.array(rects, dtype='float64')
+        sources = (phase_history, sicd, remap_function)
+        if self._sources is not None and \
+                all(entry is current for entry, current in zip(sources, self._sources)) and \
+                numpy.array_equal(rects, self._rects):
+            return
+        self.invalidate()
+        self._sources = sources
+        self._rects = rects
+        if order is None:
+            order = range(rects.shape[0])
+        futures = [None for _ in range(rects.shape[0])]  # type: List[Optional[Future]]
+        for index in order:
+            futures[index] = self._executor.submit(_render_frame, phase_history, sicd, rects[index], remap_function)
+        for index, future in enumerate(futures):
+            if future is None:
+                futures[index] = self._executor.submit(
+                    _render_frame, phase_history, sicd, rects[index], remap_function)
+        self._futures = futures
+
+    def is_ready(self, index):
+        """
+        Is the given frame rendered?
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        bool
+        """
+
+        return 0 <= index < len(self._futures) and self._futures[index].done()
+
+    def frame(self, index, timeout=None):
+        """
+        Gets the given frame, waiting for it to be rendered if necessary.
+
+        Parameters
+        ----------
+        index : int
+        timeout : None|float
+            The maximum time to wait, in seconds.
+
+        Returns
+        -------
+        None|numpy.ndarray
+        """
+
+        if not (0 <= index < len(self._futures)):
+            raise IndexError('Frame index {} out of range for {} frames'.format(index, len(self._futures)))
+        return self._futures[index].result(timeout=timeout)
+
+    def shutdown(self):
+        """
+        Discard all frames and shut down the worker threads.
+        """
+
+        self.invalidate()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class FilteredImageCache(object):
+    """
+    Least recently used cache of the `ApertureFilter` evaluations, keyed by the
+    sub-image bounds, the phase history rectangle, and the filter options. The
+    complex images and the remapped display images are stored separately, so
+    that a remap change does not require the transform to be repeated.
+    """
+
+    def __init__(self, max_bytes=256*2**20):
+        """
+
+        Parameters
+        ----------
+        max_bytes : int
+            The maximum number of bytes of cached images.
+        """
+
+        self._max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def size_bytes(self):
+        # type: () -> int
+        """
+        int: The number of bytes of cached images.
+        """
+
+        return self._bytes
+
+    @property
+    def hits(self):
+        # type: () -> int
+        """
+        int: The number of cache hits.
+        """
+
+        return self._hits
+
+    @property
+    def misses(self):
+        # type: () -> int
+        """
+        int: The number of cache misses.
+        """
+
+        return self._misses
+
+    def clear(self):
+        """
+        Remove all cached images. This should be called whenever the sub-image
+        bounds or the filter options change.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _get(self, key, check=None):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None or (check is not None and entry[0] is not check):
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def _put(self, key, value, reference=None):
+        size = 0 if value is None else value.nbytes
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous[1] is not None:
+                self._bytes -= previous[1].nbytes
+            self._entries[key] = (reference, value)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (_, removed) = self._entries.popitem(last=False)
+                if removed is not None:
+                    self._bytes -= removed.nbytes
+
+    @staticmethod
+    def _filter_key(aperture_filter, slices):
+        row_slice, col_slice = slices
+        return (
+            aperture_filter.sub_image_bounds,
+            (row_slice.start, row_slice.stop, col_slice.start, col_slice.stop),
+            aperture_filter.dimension, aperture_filter.apply_deskew, aperture_filter.apply_deweighting)
+
+    def complex_image(self, aperture_filter, slices):
+        """
+        Gets the complex image for the given phase history slices.
+
+        Parameters
+        ----------
+        aperture_filter : ApertureFilter
+        slices : Tuple[slice, slice]
+            As from :func:`rect_slices`.
+
+        Returns
+        -------
+        None|numpy.ndarray
+        """
+
+        key = ('complex', ) + self._filter_key(aperture_filter, slices)
+        value = self._get(key)
+        if value is None:
+            value = aperture_filter[slices]
+            self._put(key, value)
+        return value
+
+    def display_image(self, aperture_filter, slices, remap_function):
+        """
+        Gets the remapped display image for the given phase history slices.
+
+        Parameters
+        ----------
+        aperture_filter : ApertureFilter
+        slices : Tuple[slice, slice]
+            As from :func:`rect_slices`.
+        remap_function : Callable
+
+        Returns
+        -------
+        None|numpy.ndarray
+        """
+
+        # NB: the remap function is retained in the entry, so its id is not reused
+        key = ('display', id(remap_function)) + self._filter_key(aperture_filter, slices)
+        value = self._get(key, check=remap_function)
+        if value is None:
+            data = self.complex_image(aperture_filter, slices)
+            if data is None:
+                return None
+            value = remap_function(data)
+            self._put(key, value, reference=remap_function)
+        return value
+
+
+def default_deskew_dimension(sicd):
+    """
+    Gets the default deskew dimension. This is the slow time (column) dimension,
+    unless the `Grid.Row.DeltaKCOAPoly` is populated with a nonzero value.
+
+    Parameters
+    ----------
+    sicd : SICDType
+
+    Returns
+    -------
+    int
+    """
+
+    if sicd.Grid.Row.DeltaKCOAPoly is None:
+        return 1
+    row_delta_kcoa = sicd.Grid.Row.DeltaKCOAPoly.get_array()
+    return 1 if row_delta_kcoa.size == 1 and row_delta_kcoa[0, 0] == 0 else 0
+
+
+def default_deweighting(sicd):
+    """
+    Should deweighting be applied by default? This requires that both weight
+    functions are populated.
+
+    Parameters
+    ----------
+    sicd : SICDType
+
+    Returns
+    -------
+    bool
+    """
+
+    return sicd.Grid.Row.WgtFunct is not None and sicd.Grid.Col.WgtFunct is not None
+
+
+def frame_metadata(sicd, bounds, rect):
+    """
+    Gets the aperture bounds and resolution information for the given frame.
+    This is the information displayed in the aperture tool phase history panel.
+
+    Parameters
+    ----------
+    sicd : SICDType
+    bounds : Tuple[int, int, int, int]
+        The phase history bounds, as from :func:`phase_history_bounds`.
+    rect : Tuple[float, float, float, float]
+        The frame rectangle.
+
+    Returns
+    -------
+    dict
+    """
+
+    slices = rect_slices(rect)
+    if slices is None:
+        return {'row_bounds': None, 'col_bounds': None}
+    row_slice, col_slice = slices
+    full_rows = float(bounds[2] - bounds[0])
+    full_cols = float(bounds[3] - bounds[1])
+
+    range_fraction = (row_slice.stop - row_slice.start)/full_rows
+    cross_fraction = (col_slice.stop - col_slice.start)/full_cols
+    out = {
+        'row_bounds': [row_slice.start, row_slice.stop],
+        'col_bounds': [col_slice.start, col_slice.stop],
+        'range_start_percent': 100*(row_slice.start - bounds[0])/full_rows,
+        'range_stop_percent': 100*(row_slice.stop - bounds[0])/full_rows,
+        'range_fraction_percent': 100*range_fraction,
+        'cross_start_percent': 100*(col_slice.start - bounds[1])/full_cols,
+        'cross_stop_percent': 100*(col_slice.stop - bounds[1])/full_cols,
+        'cross_fraction_percent': 100*cross_fraction,
+        'range_resolution': sicd.Grid.Row.ImpRespWid/range_fraction,
+        'cross_resolution': sicd.Grid.Col.ImpRespWid/cross_fraction}
+    if sicd.SCPCOA is not None and sicd.SCPCOA.TwistAng and sicd.SCPCOA.GrazeAng:
+        out['range_ground_resolution'] = out['range_resolution']/numpy.cos(numpy.deg2rad(sicd.SCPCOA.GrazeAng))
+        out['cross_ground_resolution'] = out['cross_resolution']/numpy.cos(numpy.deg2rad(sicd.SCPCOA.TwistAng))
+    return out
+
+
+def datacube_sidecar_name(file_name):
+    """
+    Gets the json sidecar file name for the given datacube file name.
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    str
+    """
+
+    return os.path.splitext(file_name)[0] + '.json'
+
+
+def write_datacube(phase_history, sicd, rects, file_name, amplitude=False, memory_budget=2**30,
+                   workers=None, metadata=None, progress_callback=None):
+    """
+    Write the sub-aperture frames for the given rectangles as a three-dimensional
+    datacube of shape `(frame count, rows, columns)`, along with a json sidecar
+    file describing the frames.
+
+    If the file extension is `.npy`, then the datacube is written in the numpy
+    npy format. Otherwise, it is written as a raw memmap, and the dtype and shape
+    are only recorded in the sidecar.
+
+    Parameters
+    ----------
+    phase_history : numpy.ndarray
+        The normalized phase history.
+    sicd : SICDType
+    rects : numpy.ndarray
+        As from :func:`animation_frame_rects`.
+    file_name : str
+    amplitude : bool
+        Write float32 amplitude, rather than complex64 values?
+    memory_budget : int
+        The approximate maximum number of bytes used for frames in progress.
+    workers : None|int
+        The number of worker threads. `None` uses the number of cores.
+    metadata : None|dict
+        Additional information for the sidecar file.
+    progress_callback : None|Callable
+        Called with the fraction complete after each frame.
+
+    Returns
+    -------
+    dict
+        The sidecar contents.
+    """
+
+    rects = numpy.asarray(rects, dtype='float64')
+    frame_count = rects.shape[0]
+    shape = (frame_count, ) + tuple(phase_history.shape)
+    dtype = numpy.dtype('float32' if amplitude else 'complex64')
+
+    # the inverse transform uses complex128 temporaries
+    frame_bytes = 48*int(phase_history.size)
+    max_pending = max(1, int(memory_budget//frame_bytes))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(int(workers), max_pending))
+
+    if os.path.splitext(file_name)[1].lower() == '.npy':
+        cube_format = 'npy'
+        cube = numpy.lib.format.open_memmap(file_name, mode='w+', dtype=dtype, shape=shape)
+    else:
+        cube_format = 'raw'
+        cube = numpy.memmap(file_name, dtype=dtype, mode='w+', shape=shape)
+
+    bounds = phase_history_bounds(sicd, phase_history.shape)
+    try:
+        for index, frame in render_frames(
+                phase_history, sicd, rects, workers=workers, max_pending=max_pending):
+            if frame is None:
+                cube[index] = 0
+            elif amplitude:
+                numpy.abs(frame, out=cube[index])
+            else:
+                cube[index] = frame
+            if progress_callback is not None:
+                progress_callback(float(index + 1)/frame_count)
+        cube.flush()
+    finally:
+        del cube
+
+    sidecar = {
+        'file_name': os.path.basename(file_name),
+        'format': cube_format,
+        'dtype': dtype.name,
+        'shape': list(shape),
+        'phase_history_bounds': list(bounds),
+        'frames': [
+            dict(index=index, **frame_metadata(sicd, bounds, rect)) for index, rect in enumerate(rects)]}
+    if metadata is not None:
+        sidecar.update(metadata)
+    with open(datacube_sidecar_name(file_name), 'w') as fi:
+        json.dump(sidecar, fi, indent=1)
+    return sidecar
+
+
+def populate_delta_kcoa(sicd):
+    """
+    Populate any missing `DeltaKCOAPoly` as `[[0]]`, which may be incorrect,
+    but is required for the deskew.
+
+    Parameters
+    ----------
+    sicd : SICDType
+
+    Returns
+    -------
+    bool
+        Was anything populated?
+    """
+
+    populated = False
+    for dir_params in [sicd.Grid.Row, sicd.Grid.Col]:
+        if dir_params.DeltaKCOAPoly is None:
+            dir_params.DeltaKCOAPoly = [[0, ], ]
+            populated = True
+    if populated:
+        logger.warning('DeltaKCOAPoly is not populated, and is assumed to be [[0]]')
+    return populated
+
+
+class SubapertureProcessor(object):
+    """
+    Sub-aperture processing for a region of a SICD type image, independent of
+    any display. The frames are defined by a schedule of rectangles in the phase
+    history of the region, as from :meth:`frame_rects`.
+
+    .. code-block:: python
+
+        processor = SubapertureProcessor('image.nitf')
+        processor.set_region((0, 1024), (0, 1024))
+        rects = processor.frame_rects(mode='slow_time', n_frames=9)
+        frames, frame_info = processor.process(rects)
+    """
+
+    def __init__(self, reader, index=0, dimension=None, apply_deskew=True, apply_deweighting=None):
+        """
+
+        Parameters
+        ----------
+        reader : str|SICDTypeReader
+        index : int
+            The image index.
+        dimension : None|int
+            The deskew dimension. `None` uses :func:`default_deskew_dimension`.
+        apply_deskew : bool
+        apply_deweighting : None|bool
+            `None` uses :func:`default_deweighting`.
+        """
+
+        self._source = reader if isinstance(reader, str) else getattr(reader, 'file_name', None)
+        if isinstance(reader, str):
+            reader = open_complex(reader)
+        if not isinstance(reader, SICDTypeReader):
+            raise TypeError('reader must be a file name or SICDTypeReader, got type {}'.format(type(reader)))
+
+        sicd = reader.get_sicds_as_tuple()[index]
+        populate_delta_kcoa(sicd)
+        if dimension is None:
+            dimension = default_deskew_dimension(sicd)
+        if apply_deweighting is None:
+            apply_deweighting = default_deweighting(sicd)
+
+        self._reader = reader
+        self._index = index
+        self._aperture_filter = ApertureFilter(
+            reader, dimension=dimension, index=index, apply_deskew=apply_deskew,
+            apply_deweighting=apply_deweighting)
+
+    @property
+    def reader(self):
+        # type: () -> SICDTypeReader
+        """
+        SICDTypeReader: The reader.
+        """
+
+        return self._reader
+
+    @property
+    def index(self):
+        # type: () -> int
+        """
+        int: The image index.
+        """
+
+        return self._index
+
+    @property
+    def source(self):
+        # type: () -> Optional[str]
+        """
+        None|str: The source file name, if known.
+        """
+
+        return self._source if isinstance(self._source, str) else None
+
+    @property
+    def aperture_filter(self):
+        # type: () -> ApertureFilter
+        """
+        ApertureFilter: The aperture filter calculator.
+        """
+
+        return self._aperture_filter
+
+    @property
+    def sicd(self):
+        # type: () -> SICDType
+        """
+        SICDType: The sicd structure.
+        """
+
+        return self._aperture_filter.sicd
+
+    @property
+    def dimension(self):
+        # type: () -> int
+        """
+        int: The deskew dimension.
+        """
+
+        return self._aperture_filter.dimension
+
+    @dimension.setter
+    def dimension(self, value):
+        self._aperture_filter.dimension = int(value)
+
+    @property
+    def apply_deskew(self):
+        # type: () -> bool
+        """
+        bool: Apply the deskew?
+        """
+
+        return self._aperture_filter.apply_deskew
+
+    @apply_deskew.setter
+    def apply_deskew(self, value):
+        self._aperture_filter.apply_deskew = bool(value)
+
+    @property
+    def apply_deweighting(self):
+        # type: () -> bool
+        """
+        bool: Apply the deweighting?
+        """
+
+        return self._aperture_filter.apply_deweighting
+
+    @apply_deweighting.setter
+    def apply_deweighting(self, value):
+        self._aperture_filter.apply_deweighting = bool(value)
+
+    @property
+    def region(self):
+        # type: () -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]
+        """
+        None|Tuple[Tuple[int, int], Tuple[int, int]]: The image region row and
+        column bounds.
+        """
+
+        return self._aperture_filter.sub_image_bounds
+
+    def set_region(self, row_bounds, col_bounds):
+        """
+        Sets the image region, and calculates its phase history.
+
+        Parameters
+        ----------
+        row_bounds : None|Tuple[int, int]
+            Of the form `(start row, end row)`.
+        col_bounds : None|Tuple[int, int]
+            Of the form `(start column, end column)`.
+        """
+
+        self._aperture_filter.set_sub_image_bounds(row_bounds, col_bounds)
+
+    @property
+    def phase_history(self):
+        # type: () -> Optional[numpy.ndarray]
+        """
+        None|numpy.ndarray: The normalized phase history of the region.
+        """
+
+        return self._aperture_filter.normalized_phase_history
+
+    def _require_phase_history(self):
+        # type: () -> numpy.ndarray
+        phase_history = self.phase_history
+        if phase_history is None:
+            raise ValueError('The region has not been set')
+        return phase_history
+
+    @property
+    def bounds(self):
+        # type: () -> Tuple[int, int, int, int]
+        """
+        Tuple[int, int, int, int]: The bounds of the populated portion of the
+        phase history, see :func:`phase_history_bounds`.
+        """
+
+        return phase_history_bounds(self.sicd, self._require_phase_history().shape)
+
+    def parameters(self):
+        """
+        Gets the processing parameters.
+
+        Returns
+        -------
+        dict
+        """
+
+        region = self.region
+        return {
+            'source': self.source,
+            'index': self.index,
+            'row_bounds': None if region is None else list(region[0]),
+            'col_bounds': None if region is None else list(region[1]),
+            'dimension': self.dimension,
+            'apply_deskew': self.apply_deskew,
+            'apply_deweighting': self.apply_deweighting}
+
+    def frame_rects(self, mode='slow_time', n_frames=7, aperture_fraction=0.25,
+                    min_aperture_percent=0.1, max_aperture_percent=1.0):
+        """
+        Gets the frame rectangles for the aperture tool animation schedule.
+
+        Parameters
+        ----------
+        mode : str
+            One of `ANIMATION_MODES`.
+        n_frames : int
+        aperture_fraction : float
+        min_aperture_percent : float
+        max_aperture_percent : float
+
+        Returns
+        -------
+        numpy.ndarray
+            See :func:`animation_frame_rects`.
+        """
+
+        return animation_frame_rects(
+            self.bounds, mode, n_frames, aperture_fraction=aperture_fraction,
+            min_aperture_percent=min_aperture_percent, max_aperture_percent=max_aperture_percent)
+
+    def frame(self, rect, remap_function=None):
+        """
+        Gets the frame for the given phase history rectangle.
+
+        Parameters
+        ----------
+        rect : Tuple[float, float, float, float]
+        remap_function : None|Callable
+            If `None`, the complex image is returned.
+
+        Returns
+        -------
+        None|numpy.ndarray
+        """
+
+        data = filtered_image(self._require_phase_history(), self.sicd, rect)
+        return data if data is None or remap_function is None else remap_function(data)
+
+    def frame_metadata(self, rect):
+        """
+        Gets the aperture bounds and resolution information for the given rectangle.
+
+        Parameters
+        ----------
+        rect : Tuple[float, float, float, float]
+
+        Returns
+        -------
+        dict
+            See :func:`frame_metadata`.
+        """
+
+        return frame_metadata(self.sicd, self.bounds, rect)
+
+    def frames(self, rects, remap_function=None, workers=None, max_pending=None):
+        """
+        Compute the frames on a pool of worker threads, yielding them in order.
+
+        Parameters
+        ----------
+        rects : numpy.ndarray
+        remap_function : None|Callable
+        workers : None|int
+        max_pending : None|int
+
+        Yields
+        ------
+        (int, None|numpy.ndarray)
+            See :func:`render_frames`.
+        """
+
+        return render_frames(
+            self._require_phase_history(), self.sicd, rects, remap_function=remap_function,
+            workers=workers, max_pending=max_pending)
+
+    def process(self, rects, remap_function=None, workers=None):
+        """
+        Compute all of the frames, and the frame information.
+
+        Parameters
+        ----------
+        rects : numpy.ndarray
+        remap_function : None|Callable
+            If `None`, the complex frames are returned.
+        workers : None|int
+            The number of worker threads. `None` uses the number of cores.
+
+        Returns
+        -------
+        (numpy.ndarray, List[dict])
+            The frames, of shape `(frame count, rows, columns)`, and the
+            information for each frame.
+        """
+
+        phase_history = self._require_phase_history()
+        frames = None
+        for index, frame in self.frames(rects, remap_function=remap_function, workers=workers):
+            if frame is None:
+                continue
+            if frames is None:
+                frames = numpy.zeros((len(rects), ) + frame.shape, dtype=frame.dtype)
+            frames[index] = frame
+        if frames is None:
+            frames = numpy.zeros((len(rects), ) + phase_history.shape, dtype='complex64')
+        return frames, [dict(index=index, **self.frame_metadata(rect)) for index, rect in enumerate(rects)]
+
+    def write_datacube(self, file_name, rects, amplitude=False, memory_budget=2**30, workers=None,
+                       metadata=None, progress_callback=None):
+        """
+        Write the frames as a datacube, see :func:`write_datacube`. The processing
+        parameters are included in the sidecar.
+
+        Parameters
+        ----------
+        file_name : str
+        rects : numpy.ndarray
+        amplitude : bool
+        memory_budget : int
+        workers : None|int
+        metadata : None|dict
+            Additional information for the sidecar file.
+        progress_callback : None|Callable
+
+        Returns
+        -------
+        dict
+            The sidecar contents.
+        """
+
+        the_metadata = self.parameters()
+        if metadata is not None:
+            the_metadata.update(metadata)
+        return write_datacube(
+            self._require_phase_history(), self.sicd, rects, file_name, amplitude=amplitude,
+            memory_budget=memory_budget, workers=workers, metadata=the_metadata,
+            progress_callback=progress_callback)
+
+
+def export_datacube(reader, row_bounds, col_bounds, file_name, mode='slow_time', n_frames=7,
+                    aperture_fraction=0.25, min_aperture_percent=0.1, max_aperture_percent=1.0,
+                    index=0, dimension=None, apply_deskew=True, apply_deweighting=None,
+                    amplitude=False, memory_budget=2**30, workers=None, progress_callback=None):
+    """
+    Write the sub-aperture datacube for the given region of the image, with the
+    frames defined as for the aperture tool animation.
+
+    Parameters
+    ----------
+    reader : str|SICDTypeReader
+    row_bounds : Tuple[int, int]
+        The image region row bounds, of the form `(start, end)`.
+    col_bounds : Tuple[int, int]
+        The image region column bounds, of the form `(start, end)`.
+    file_name : str
+        The output file name, see :func:`write_datacube`.
+    mode : str
+        One of `ANIMATION_MODES`.
+    n_frames : int
+    aperture_fraction : float
+    min_aperture_percent : float
+    max_aperture_percent : float
+        The animation parameters, see :func:`animation_frame_rects`.
+    index : int
+        The image index.
+    dimension : None|int
+        The deskew dimension. `None` uses :func:`default_deskew_dimension`.
+    apply_deskew : bool
+    apply_deweighting : None|bool
+        `None` uses :func:`default_deweighting`.
+    amplitude : bool
+        Write float32 amplitude, rather than complex64 values?
+    memory_budget : int
+        The approximate maximum number of bytes used for frames in progress.
+    workers : None|int
+        The number of worker threads. `None` uses the number of cores.
+    progress_callback : None|Callable
+        Called with the fraction complete after each frame.
+
+    Returns
+    -------
+    dict
+        The sidecar contents.
+    """
+
+    processor = SubapertureProcessor(
+        reader, index=index, dimension=dimension, apply_deskew=apply_deskew,
+        apply_deweighting=apply_deweighting)
+    processor.set_region(row_bounds, col_bounds)
+    rects = processor.frame_rects(
+        mode=mode, n_frames=n_frames, aperture_fraction=aperture_fraction,
+        min_aperture_percent=min_aperture_percent, max_aperture_percent=max_aperture_percent)
+    metadata = {
+        'mode': mode,
+        'aperture_fraction': aperture_fraction,
+        'min_aperture_percent': min_aperture_percent,
+        'max_aperture_percent': max_aperture_percent}
+    return processor.write_datacube(
+        file_name, rects, amplitude=amplitude, memory_budget=memory_budget, workers=workers,
+        metadata=metadata, progress_callback=progress_callback)
@@ -0,0 +1,307 @@
+"""
+Quantitative comparison of the observed (scaled mean) spectral profile of a SICD
+with the weighting described in its metadata.
+
+The observed profile is the mean magnitude of the deskewed Fourier transform
+along one dimension, as produced by :func:`frequency_support.analyze_weighting`,
+which is defined on `[-0.5/SS, 0.5/SS]`. The weights are defined on
+`[-0.5*ImpRespBW, 0.5*ImpRespBW]`.
+"""
+
+__classification__ = "UNCLASSIFIED"
+__author__ = "National Geospatial-Intelligence Agency"
+
+from typing import List, Optional
+
+import numpy
+
+from sarpy.io.complex.sicd_elements.Grid import DirParamType
+
+
+def _smooth(profile):
+    # the same smoothing width used for scaling the mean profile
+    if profile.size < 200:
+        return profile
+    the_size = int(numpy.ceil(profile.size/200.))
+    return numpy.convolve(profile, numpy.full((the_size, ), 1./the_size, dtype='float64'), mode='same')
+
+
+def _normalize_weights(weights):
+    # weights without a positive maximum (e.g. all zero) cannot be compared
+    if weights is None:
+        return None
+    weights = numpy.asarray(weights, dtype='float64')
+    if weights.size == 0:
+        return None
+    maximum = numpy.amax(weights)
+    if not (numpy.isfinite(maximum) and maximum > 0):
+        return None
+    return weights/maximum
+
+
+def profile_frequencies(size, sample_spacing):
+    """
+    Gets the spatial frequencies (cycles/meter) for the observed profile.
+
+    Parameters
+    ----------
+    size : int
+    sample_spacing : float
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    return numpy.linspace(-0.5/sample_spacing, 0.5/sample_spacing, size)
+
+
+def weight_frequencies(size, impulse_response_bandwidth):
+    """
+    Gets the spatial frequencies (cycles/meter) for the weight function.
+
+    Parameters
+    ----------
+    size : int
+    impulse_response_bandwidth : float
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    return numpy.linspace(-0.5*impulse_response_bandwidth, 0.5*impulse_response_bandwidth, size)
+
+
+def resample_profile(scaled_mean, dir_params, size):
+    """
+    Resample the observed profile onto the support of a weight function of the
+    given size.
+
+    Parameters
+    ----------
+    scaled_mean : numpy.ndarray
+    dir_params : DirParamType
+    size : int
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    return numpy.interp(
+        weight_frequencies(size, dir_params.ImpRespBW),
+        profile_frequencies(scaled_mean.size, dir_params.SS),
+        scaled_mean)
+
+
+def compare_weights(scaled_mean, weights, dir_params):
+    """
+    Compare the observed profile with the given weights, on the support of the weights.
+
+    Parameters
+    ----------
+    scaled_mean : numpy.ndarray
+    weights : None|numpy.ndarray
+    dir_params : DirParamType
+
+    Returns
+    -------
+    None|dict
+        The `rms_error`, `max_error`, and `correlation`, or `None` if no weights
+        are provided, or the weights have no positive maximum.
+    """
+
+    weights = _normalize_weights(weights)
+    if weights is None:
+        return None
+    observed = resample_profile(scaled_mean, dir_params, weights.size)
+    difference = observed - weights
+    if numpy.std(observed) == 0 or numpy.std(weights) == 0:
+        # uniform weighting has no meaningful correlation
+        correlation = float('nan')
+    else:
+        correlation = float(numpy.corrcoef(observed, weights)[0, 1])
+    return {
+        'rms_error': float(numpy.sqrt(numpy.mean(difference*difference))),
+        'max_error': float(numpy.amax(numpy.abs(difference))),
+        'correlation': correlation}
+
+
+def _support_edges(values, frequencies, threshold):
+    above = numpy.flatnonzero(values >= threshold)
+    if above.size == 0:
+        return float('nan'), float('nan')
+    return float(frequencies[above[0]]), float(frequencies[above[-1]])
+
+
+def weighting_metrics(scaled_mean, dir_params, derived_weights=None, threshold=0.1):
+    """
+    Calculate the weighting mismatch metrics for one dimension.
+
+    The observed bandwidth edges are the outermost frequencies at which the
+    smoothed observed profile exceeds `threshold`, and the expected edges are
+    determined in the same way from the weights (declared, if populated, else
+    derived), so that tapered weights do not bias the edge offsets.
+
+    Parameters
+    ----------
+    scaled_mean : numpy.ndarray
+        The observed profile, scaled so that its smoothed maximum is 1.
+    dir_params : DirParamType
+        The `Grid.Row` or `Grid.Col` element.
+    derived_weights : None|numpy.ndarray
+        The weights derived from `WgtType`. Weights without a positive maximum
+        are not compared.
+    threshold : float
+        The relative level defining the bandwidth edges.
+
+    Returns
+    -------
+    dict
+    """
+
+    scaled_mean = numpy.asarray(scaled_mean, dtype='float64')
+    declared_weights = None if dir_params.WgtFunct is None else \
+        numpy.asarray(dir_params.WgtFunct, dtype='float64')
+
+    out = {}
+    for name, weights in [('declared', declared_weights), ('derived', derived_weights)]:
+        comparison = compare_weights(scaled_mean, weights, dir_params)
+        for key in ['rms_error', 'max_error', 'correlation']:
+            out['{}_{}'.format(name, key)] = None if comparison is None else comparison[key]
+
+    frequencies = profile_frequencies(scaled_mean.size, dir_params.SS)
+    low_edge, high_edge = _support_edges(_smooth(scaled_mean), frequencies, threshold)
+
+    weights = _normalize_weights(declared_weights)
+    if weights is None:
+        weights = _normalize_weights(derived_weights)
+    if weights is None:
+        expected_low, expected_high = -0.5*dir_params.ImpRespBW, 0.5*dir_params.ImpRespBW
+    else:
+        expected_low, expected_high = _support_edges(
+            weights, weight_frequencies(weights.size, dir_params.ImpRespBW), threshold)
+
+    # the resolution of the edge estimates is a couple of profile bins
+    tolerance = 2./(dir_params.SS*scaled_mean.size)
+    out['low_edge'] = low_edge
+    out['high_edge'] = high_edge
+    out['low_edge_offset'] = low_edge - expected_low
+    out['high_edge_offset'] = high_edge - expected_high
+    out['edge_tolerance'] = tolerance
+    if dir_params.DeltaK1 is None or dir_params.DeltaK2 is None:
+        out['delta_k1_margin'] = None
+        out['delta_k2_margin'] = None
+        out['delta_k_consistent'] = None
+    else:
+        # the observed support should lie inside [DeltaK1, DeltaK2], which
+        # should lie inside the sampled bandwidth
+        out['delta_k1_margin'] = low_edge - dir_params.DeltaK1
+        out['delta_k2_margin'] = dir_params.DeltaK2 - high_edge
+        out['delta_k_consistent'] = bool(
+            out['delta_k1_margin'] >= -tolerance and out['delta_k2_margin'] >= -tolerance and
+            dir_params.DeltaK1 >= -0.5/dir_params.SS - tolerance and
+            dir_params.DeltaK2 <= 0.5/dir_params.SS + tolerance)
+    return out
+
+
+def weighting_flags(metrics, rms_threshold=0.15, correlation_threshold=0.9):
+    """
+    Determine the flags (i.e. likely metadata problems) for the weighting metrics
+    of a single dimension.
+
+    Parameters
+    ----------
+    metrics : dict
+        As produced by :func:`weighting_metrics`.
+    rms_threshold : float
+        The maximum acceptable rms error versus the weights.
+    correlation_threshold : float
+        The minimum acceptable correlation versus the weights.
+
+    Returns
+    -------
+    List[str]
+    """
+
+    flags = []
+    for name in ['declared', 'derived']:
+        rms_error = metrics['{}_rms_error'.format(name)]
+        correlation = metrics['{}_correlation'.format(name)]
+        if rms_error is not None and rms_error > rms_threshold:
+            flags.append('{}_rms_error'.format(name))
+        if correlation is not None and correlation < correlation_threshold:
+            flags.append('{}_correlation'.format(name))
+
+    tolerance = metrics['edge_tolerance']
+    for name in ['low_edge_offset', 'high_edge_offset']:
+        if not abs(metrics[name]) <= tolerance:
+            # NB: this catches nan
+            flags.append(name)
+    if metrics['delta_k_consistent'] is False:
+        flags.append('delta_k')
+    return flags
+
+
+def sicd_weighting_metrics(sicd, scaled_row_mean, scaled_column_mean,
+                           derived_row_weights=None, derived_column_weights=None, threshold=0.1):
+    """
+    Calculate the weighting metrics for both dimensions of the given sicd.
+
+    Parameters
+    ----------
+    sicd : sarpy.io.complex.sicd_elements.SICD.SICDType
+    scaled_row_mean : numpy.ndarray
+    scaled_column_mean : numpy.ndarray
+    derived_row_weights : None|numpy.ndarray
+    derived_column_weights : None|numpy.ndarray
+    threshold : float
+
+    Returns
+    -------
+    dict
+        Of the form `{'Row': <metrics>, 'Col': <metrics>}`, where each metrics
+        dictionary has the additional `flags` entry.
+    """
+
+    out = {}
+    for name, dir_params, scaled_mean, derived_weights in [
+            ('Row', sicd.Grid.Row, scaled_row_mean, derived_row_weights),
+            ('Col', sicd.Grid.Col, scaled_column_mean, derived_column_weights)]:
+        metrics = weighting_metrics(scaled_mean, dir_params, derived_weights=derived_weights, threshold=threshold)
+        metrics['flags'] = weighting_flags(metrics)
+        out[name] = metrics
+    return out
+
+
+def format_weighting_metrics(metrics):
+    """
+    Format the metrics for a single dimension as short text for display.
+
+    Parameters
+    ----------
+    metrics : dict
+
+    Returns
+    -------
+    str
+    """
+
+    def fmt(value, spec='{:0.3f}'):
+        return 'n/a' if value is None else spec.format(value)
+
+    lines = []
+    for name in ['declared', 'derived']:
+        if metrics['{}_rms_error'.format(name)] is not None:
+            lines.append('{}: rms {}, corr {}'.format(
+                name, fmt(metrics['{}_rms_error'.format(name)]),
+                fmt(metrics['{}_correlation'.format(name)])))
+    lines.append('edge offsets: {}, {}'.format(
+        fmt(metrics['low_edge_offset'], '{:0.3g}'), fmt(metrics['high_edge_offset'], '{:0.3g}')))
+    if metrics['delta_k_consistent'] is not None:
+        lines.append('DeltaK1/DeltaK2 margins: {}, {}'.format(
+            fmt(metrics['delta_k1_margin'], '{:0.3g}'), fmt(metrics['delta_k2_margin'], '{:0.3g}')))
+    if metrics.get('flags', None):
+        lines.append('flags: {}'.format(', '.join(metrics['flags'])))
+    return '\n'.join(lines)
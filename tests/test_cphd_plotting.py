@@ -0,0 +1,114 @@
+__classification__ = 'UNCLASSIFIED'
+
+import warnings
+
+import numpy
+from matplotlib import mlab
+
+from sarpy_apps.supporting_classes.cphd_plotting import VectorCache, VectorTFR, VectorWindowSums
+
+from tests import unittest
+
+
+def random_vectors(num_vectors, num_samples, seed=0):
+    generator = numpy.random.default_rng(seed)
+    return (generator.normal(size=(num_vectors, num_samples)) +
+            1j*generator.normal(size=(num_vectors, num_samples)) + 1).astype('complex64')
+
+
+class TestVectorTFR(unittest.TestCase):
+    # odd and even segment lengths, with and without overlap, and vectors shorter than a segment
+    cases = [(1000, 64, 32), (1000, 63, 31), (1001, 65, 0), (999, 128, 127), (50, 64, 32), (37, 63, 10)]
+
+    def check(self, tfr, signals, nfft, noverlap, conjugate, scss=1e-8):
+        result = tfr.compute(signals, nfft, noverlap, conjugate=conjugate)
+        frequencies, centers = tfr.axes(signals.shape[-1], nfft, noverlap, scss)
+        for the_result, signal in zip(result.reshape(-1, *result.shape[-2:]), signals.reshape(-1, signals.shape[-1])):
+            if conjugate:
+                signal = numpy.conj(signal)
+            with warnings.catch_warnings():
+                # the warning that a vector shorter than a segment is padded to one segment
+                warnings.simplefilter('ignore', UserWarning)
+                spec, expected_frequencies, expected_centers = mlab.specgram(
+                    signal, NFFT=nfft, Fs=1/scss, noverlap=noverlap, window=mlab.window_none, scale_by_freq=False)
+            self.assertEqual(the_result.shape, spec.shape)
+            numpy.testing.assert_allclose(the_result, numpy.log10(spec), rtol=0, atol=1e-5)
+            numpy.testing.assert_allclose(frequencies, expected_frequencies, rtol=1e-12)
+            numpy.testing.assert_allclose(centers, expected_centers, rtol=1e-12)
+
+    def test_compute(self):
+        tfr = VectorTFR()
+        for num_samples, nfft, noverlap in self.cases:
+            for conjugate in [False, True]:
+                with self.subTest(num_samples=num_samples, nfft=nfft, noverlap=noverlap, conjugate=conjugate):
+                    signals = random_vectors(3, num_samples)
+                    self.check(tfr, signals[0], nfft, noverlap, conjugate)
+                    self.check(tfr, signals, nfft, noverlap, conjugate)
+
+    def test_compute_blocks(self):
+        # several blocks of vectors, reusing the buffers
+        tfr = VectorTFR(block_bytes=2**14)
+        signals = random_vectors(7, 1000)
+        expected = VectorTFR().compute(signals, 64, 32).copy()
+        numpy.testing.assert_allclose(tfr.compute(signals, 64, 32), expected, rtol=0, atol=1e-6)
+        numpy.testing.assert_allclose(tfr.compute(signals, 64, 32), expected, rtol=0, atol=1e-6)
+
+    def test_compute_overlap(self):
+        with self.assertRaises(ValueError):
+            VectorTFR().compute(random_vectors(1, 100)[0], 64, 64)
+
+
+class TestVectorWindowSums(unittest.TestCase):
+    def setUp(self):
+        generator = numpy.random.default_rng(0)
+        self.data = generator.exponential(size=(500, 33)).astype('float32')
+        self.computed = []
+
+    def compute(self, start, stop):
+        self.computed.append((start, stop))
+        return self.data[start:stop], 2*self.data[start:stop, :5]
+
+    def windows(self):
+        generator = numpy.random.default_rng(1)
+        windows = [(0, 10), (1, 11), (2, 12), (3, 12), (3, 20), (10, 20)]  # slide, shrink and grow
+        windows += [(100, 140), (101, 141), (99, 139), (300, 301), (300, 302)]  # jump
+        windows += [(i, i + 64) for i in range(200, 300)]  # long slide, past the resync interval
+        windows += [(start, start + int(generator.integers(1, 100)))
+                    for start in generator.integers(0, 400, size=100)]
+        windows += [(start, start + int(length)) for start, length in zip(
+            numpy.clip(250 + numpy.cumsum(generator.integers(-5, 6, size=100)), 0, 400),
+            generator.integers(1, 30, size=100))]
+        return windows
+
+    def check(self, window_sums):
+        for start, stop in self.windows():
+            with self.subTest(start=start, stop=stop):
+                sums = window_sums.sums(start, stop)
+                self.assertEqual(len(sums), 2)
+                numpy.testing.assert_allclose(
+                    sums[0], self.data[start:stop].astype('float64').sum(0), rtol=1e-9, atol=1e-9)
+                numpy.testing.assert_allclose(
+                    sums[1], 2*self.data[start:stop, :5].astype('float64').sum(0), rtol=1e-9, atol=1e-9)
+
+    def test_sums(self):
+        self.check(VectorWindowSums(self.compute, resync_interval=16))
+
+    def test_sums_evicted(self):
+        # a cache smaller than the windows
+        self.check(VectorWindowSums(self.compute, max_bytes=4096, resync_interval=16))
+
+    def test_sums_cleared(self):
+        window_sums = VectorWindowSums(self.compute)
+        window_sums.sums(0, 10)
+        window_sums.clear()
+        self.data[:] = 1
+        numpy.testing.assert_allclose(window_sums.sums(2, 12)[0], 10.)
+
+    def test_cache(self):
+        cache = VectorCache(self.compute, dtype=numpy.float64)
+        values = cache.fetch([3, 4, 5, 7])
+        self.assertEqual(self.computed, [(3, 6), (7, 8)])
+        self.assertEqual(values[0][0].dtype, numpy.float64)
+        numpy.testing.assert_array_equal(values[2][0], self.data[5])
+        cache.fetch([4, 5, 6])
+        self.assertEqual(self.computed, [(3, 6), (7, 8), (6, 7)])
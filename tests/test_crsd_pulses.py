@@ -0,0 +1,158 @@
+__classification__ = 'UNCLASSIFIED'
+
+from types import SimpleNamespace
+
+import numpy
+from scipy.fft import fftshift
+from scipy.signal import resample, spectrogram
+
+from sarpy.processing.sicd.windows import kaiser
+
+from sarpy_apps.supporting_classes.crsd_pulses import batch_stft, reramp, rf_signal_spectrograms, \
+    stft_parameters, stratified_pulses, _reramp_table
+
+from tests import unittest
+
+
+def baseline_reramp(pulse_data, sampling_rate, deramp_rate):
+    # the reramp using scipy.signal.resample, which reramp replaces
+    rcv_window_length = pulse_data.size / sampling_rate
+    deramp_bandwidth = abs(rcv_window_length * deramp_rate)
+    upsample_factor = (deramp_bandwidth + sampling_rate) / sampling_rate
+
+    sample_size = round(upsample_factor * pulse_data.size)
+    oversample_factor = sample_size / (upsample_factor * pulse_data.size)
+    use_data = resample(pulse_data - numpy.mean(pulse_data), sample_size)
+    time_interval = 1 / (sampling_rate * upsample_factor * oversample_factor)
+    times = time_interval * numpy.arange(sample_size) - 0.5 * rcv_window_length
+    return use_data * numpy.exp(
+        1j * numpy.pi * deramp_rate * times * times), 1. / time_interval
+
+
+def baseline_stft(data, sampling_rate):
+    # the single pulse spectrogram, which batch_stft replaces
+    nfft, nperseg, noverlap = stft_parameters(data.shape[0])
+    frequencies, times, trans_data = spectrogram(
+        data, sampling_rate, window=kaiser(nperseg, 5), nperseg=nperseg, noverlap=noverlap,
+        nfft=nfft, return_onesided=False)
+    return times, fftshift(frequencies, axes=0), fftshift(trans_data, axes=0)
+
+
+def random_pulses(pulse_count, sample_count, seed=0):
+    generator = numpy.random.default_rng(seed)
+    return (generator.normal(size=(pulse_count, sample_count)) +
+            1j*generator.normal(size=(pulse_count, sample_count)) + 2).astype('complex64')
+
+
+class TestReramp(unittest.TestCase):
+    # the lengths 17506 and 60615 of the reramped pulses are not fast transform lengths
+    cases = [(2000, 100e6, 2e12), (1999, 100e6, -3e12), (5001, 100e6, 5e12), (12289, 250e6, 2e13)]
+
+    def test_reramp(self):
+        for sample_count, sampling_rate, deramp_rate in self.cases:
+            with self.subTest(sample_count=sample_count):
+                pulse_data = random_pulses(3, sample_count)
+                reramped, reramped_sampling_rate = reramp(pulse_data, sampling_rate, deramp_rate)
+                for pulse in range(pulse_data.shape[0]):
+                    expected, expected_sampling_rate = baseline_reramp(
+                        pulse_data[pulse].astype('complex128'), sampling_rate, deramp_rate)
+                    self.assertEqual(reramped.shape[1], expected.size)
+                    self.assertEqual(reramped_sampling_rate, expected_sampling_rate)
+                    error = numpy.max(numpy.abs(reramped[pulse] - expected))/numpy.max(numpy.abs(expected))
+                    self.assertLess(error, 1e-5)
+
+    def test_reramp_single(self):
+        pulse_data = random_pulses(1, 5001)
+        reramped, _ = reramp(pulse_data, 100e6, 5e12)
+        single, _ = reramp(pulse_data[0], 100e6, 5e12)
+        self.assertEqual(single.ndim, 1)
+        numpy.testing.assert_allclose(single, reramped[0], rtol=0, atol=1e-5*numpy.max(numpy.abs(single)))
+
+    def test_reramp_table(self):
+        sample_size, _, chirp = _reramp_table(5001, 100e6, 5e12)
+        self.assertEqual(sample_size, 17506)
+        self.assertEqual(chirp.shape, (sample_size, ))
+        self.assertFalse(chirp.flags.writeable)
+
+
+class TestBatchStft(unittest.TestCase):
+    def test_batch_stft(self):
+        sampling_rate = 100e6
+        for sample_count in [64, 100, 1000, 1999, 4096, 17506]:
+            with self.subTest(sample_count=sample_count):
+                pulse_data = random_pulses(3, sample_count)
+                times, frequencies, spectrograms = batch_stft(pulse_data, sampling_rate)
+                self.assertEqual(spectrograms.dtype, numpy.float32)
+                for pulse in range(pulse_data.shape[0]):
+                    expected_times, expected_frequencies, expected = baseline_stft(
+                        pulse_data[pulse].astype('complex128'), sampling_rate)
+                    numpy.testing.assert_allclose(times, expected_times, rtol=1e-12)
+                    numpy.testing.assert_allclose(frequencies, expected_frequencies, rtol=1e-12)
+                    self.assertEqual(spectrograms[pulse].shape, expected.shape)
+                    error = numpy.max(numpy.abs(spectrograms[pulse] - expected))/numpy.max(expected)
+                    self.assertLess(error, 1e-5)
+
+    def test_batch_stft_blocks(self):
+        # runs of segments of one pulse, as well as blocks of several pulses
+        pulse_data = random_pulses(5, 4096)
+        _, _, expected = batch_stft(pulse_data, 1.)
+        _, _, spectrograms = batch_stft(pulse_data, 1., block_bytes=2**12)
+        numpy.testing.assert_allclose(spectrograms, expected, rtol=1e-5, atol=1e-6*numpy.max(expected))
+        _, _, single = batch_stft(pulse_data[2], 1.)
+        numpy.testing.assert_allclose(single, expected[2], rtol=1e-5, atol=1e-6*numpy.max(expected))
+
+    def test_batch_stft_short(self):
+        with self.assertRaises(ValueError):
+            batch_stft(random_pulses(1, 8), 1.)
+
+
+class TestRFSignalSpectrograms(unittest.TestCase):
+    def test_rf_signal_spectrograms(self):
+        for sample_count, sampling_rate, deramp_rate in TestReramp.cases:
+            with self.subTest(sample_count=sample_count):
+                params = SimpleNamespace(Fs=sampling_rate, F0Ref=9.6e9)
+                pulse_data = random_pulses(3, sample_count)
+                fic_rates = numpy.array([deramp_rate, 0., deramp_rate])
+                dfic0s = numpy.array([1e6, -2e6, 3e6])
+                results = rf_signal_spectrograms(params, pulse_data, fic_rates, dfic0s)
+                for pulse, (times, frequencies, data) in enumerate(results):
+                    fic_rate, dfic0 = fic_rates[pulse], dfic0s[pulse]
+                    the_data = pulse_data[pulse].astype('complex128')
+                    if fic_rate == 0:
+                        expected_times, expected_frequencies, expected = baseline_stft(the_data, sampling_rate)
+                        expected_frequencies += params.F0Ref + dfic0 - 0.5*sampling_rate
+                    else:
+                        reramped, reramped_sampling_rate = baseline_reramp(the_data, sampling_rate, fic_rate)
+                        expected_times, expected_frequencies, expected = baseline_stft(
+                            reramped, reramped_sampling_rate)
+                        expected_frequencies += \
+                            params.F0Ref + dfic0 + \
+                            0.5 * fic_rate * the_data.size / reramped_sampling_rate - \
+                            0.5 * reramped_sampling_rate
+                    numpy.testing.assert_allclose(times, expected_times, rtol=1e-12)
+                    numpy.testing.assert_allclose(frequencies, expected_frequencies, rtol=0, atol=1e-3)
+                    self.assertEqual(data.shape, expected.shape)
+                    error = numpy.max(numpy.abs(data - expected))/numpy.max(expected)
+                    self.assertLess(error, 1e-4)
+
+
+class TestStratifiedPulses(unittest.TestCase):
+    def test_stratified_pulses(self):
+        pulses = stratified_pulses(1000, 64, seed=3)
+        self.assertEqual(pulses.size, 64)
+        numpy.testing.assert_array_equal(numpy.diff(pulses) > 0, True)
+        # one pulse overlapping each interval
+        edges = numpy.linspace(0, 1000, 65)
+        numpy.testing.assert_array_equal(pulses + 1 > edges[:-1], True)
+        numpy.testing.assert_array_equal(pulses < edges[1:], True)
+        numpy.testing.assert_array_equal(stratified_pulses(1000, 64, seed=3), pulses)
+
+    def test_stratified_pulses_few(self):
+        numpy.testing.assert_array_equal(stratified_pulses(5, 64), numpy.arange(5))
+        numpy.testing.assert_array_equal(stratified_pulses(1, 64), [0])
+
+    def test_stratified_pulses_empty(self):
+        for pulse_count in [0, -1]:
+            pulses = stratified_pulses(pulse_count, 64)
+            self.assertEqual(pulses.size, 0)
+            self.assertEqual(pulses.dtype, numpy.int64)